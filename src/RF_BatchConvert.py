@@ -0,0 +1,194 @@
+"""
+    RF_BatchConvert.py
+    Convert many FNT and DAT files to each other, across directories and glob patterns, in parallel.
+"""
+
+
+from typing import Tuple, List, Dict, Optional
+import os
+import glob
+import time
+
+from RF_Set import GLOBAL_INFO_DATA_SIZE, PER_GLYPH_DATA_SIZE, GLOBAL_UNIC_HEADER, GLOBAL_UNIC_HEADER_SIZE, \
+    GLYPHS_PER_FONT
+from RF_FontData import FontData
+from RF_WorkerPool import WorkerPool
+
+
+class BatchConvertResult:
+    def __init__(self):
+        self.converted: List[Tuple[str, str]] = []      # input path, output path
+        self.skipped: List[Tuple[str, str]] = []        # output is newer than the input
+        self.failed: List[Tuple[str, str]] = []         # input path, error
+        self.input_bytes: int = 0
+        self.glyphs_count: int = 0
+        self.elapsed: float = 0.0
+
+
+def detect_format(filepath: str) -> str:
+    """
+    :return: "dat" or "fnt", from the content of the file, the extension is only used when the content is ambiguous
+    """
+    with open(filepath, 'rb') as f:
+        head = f.read(4096)
+
+    if head[:GLOBAL_UNIC_HEADER_SIZE] == GLOBAL_UNIC_HEADER.encode('utf-8'):
+        return "dat"
+
+    # FNT files are text, binary DAT records are full of zero bytes
+    if head and b'\x00' not in head and (b'{' in head or b'//' in head):
+        return "fnt"
+
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension in (".fnt", ".dat"):
+        return extension[1:]
+
+    file_size = os.path.getsize(filepath)
+    if file_size >= GLOBAL_INFO_DATA_SIZE and (file_size - GLOBAL_INFO_DATA_SIZE) % PER_GLYPH_DATA_SIZE == 0:
+        return "dat"
+
+    raise ValueError(f"unknown font data format of \"{filepath}\"")
+
+
+def find_font_files(inputs: List[str]) -> List[Tuple[str, str]]:
+    """
+    :param inputs: files, directories (searched recursively for .fnt and .dat files) or glob patterns ("**" allowed)
+    :return: (file path, root of the input it was found in), without duplicates, in input order
+    """
+    found: Dict[str, str] = {}
+
+    for item in inputs:
+        if os.path.isdir(item):
+            for dirpath, _, filenames in os.walk(item):
+                for filename in sorted(filenames):
+                    if os.path.splitext(filename)[1].lower() in (".fnt", ".dat"):
+                        found.setdefault(os.path.normpath(os.path.join(dirpath, filename)), item)
+        elif os.path.isfile(item):
+            found.setdefault(os.path.normpath(item), os.path.dirname(item))
+        else:
+            matches = sorted(glob.glob(item, recursive=True))
+            if not matches:
+                print(f"[Warning] no file matches \"{item}\"")
+            # keep the directory structure below the part of the pattern without wildcards
+            root = item
+            while glob.has_magic(root):
+                root = os.path.dirname(root)
+            for match in matches:
+                if os.path.isfile(match):
+                    found.setdefault(os.path.normpath(match), root)
+
+    return list(found.items())
+
+
+def convert_batch(inputs: List[str], output_dir: str = "", max_glyphs: int = GLYPHS_PER_FONT,
+                    max_workers: int = 0, force: bool = False,
+                    pool: Optional[WorkerPool] = None) -> BatchConvertResult:
+    """
+    Convert every FNT file to DAT and every DAT file to FNT.
+    :param inputs: files, directories or glob patterns, see find_font_files()
+    :param output_dir: write next to the input files if not specified, otherwise keep the directory structure
+        below every input in output_dir
+    :param max_workers: worker processes, set 0 to use all available CPUs
+    :param force: convert even if the output file is newer than the input file
+    :param pool: worker pool shared with other stages, if not specified, a pool is created for this batch
+    """
+    start = time.perf_counter()
+    result = BatchConvertResult()
+
+    font_files = find_font_files(inputs)
+    input_paths = {filepath for filepath, _ in font_files}
+
+    tasks: List[Tuple[str, str, str, int]] = []
+    for filepath, root in font_files:
+        try:
+            input_format = detect_format(filepath)
+        except (OSError, ValueError) as e:
+            result.failed.append((filepath, str(e)))
+            continue
+
+        output_format = "dat" if input_format == "fnt" else "fnt"
+        output_name = os.path.splitext(os.path.basename(filepath))[0] + "." + output_format
+        if output_dir and not output_dir.isspace():
+            relative_dir = os.path.relpath(os.path.dirname(filepath), root) if root else ""
+            output_path = os.path.normpath(os.path.join(output_dir, relative_dir, output_name))
+        else:
+            output_path = os.path.join(os.path.dirname(filepath), output_name)
+
+        if os.path.normpath(output_path) in input_paths:
+            # "a.fnt" and "a.dat" are both inputs, only the newer one is converted (the FNT one on a tie),
+            # otherwise two workers would write the file the other one is reading
+            output_time, input_time = os.path.getmtime(output_path), os.path.getmtime(filepath)
+            if output_time > input_time or (output_time == input_time and input_format == "dat"):
+                result.skipped.append((filepath, output_path))
+                continue
+        elif not force and os.path.exists(output_path) and \
+                os.path.getmtime(output_path) >= os.path.getmtime(filepath):
+            result.skipped.append((filepath, output_path))
+            continue
+
+        tasks.append((filepath, input_format, output_path, max_glyphs))
+
+    print(f"Converting {len(tasks)} files, {len(result.skipped)} up to date, {len(result.failed)} unreadable...")
+
+    if tasks:
+        own_pool = pool is None
+        if own_pool:
+            pool = WorkerPool(max_workers=max_workers)
+        try:
+            # a broken file fails the same way every time, don't retry it
+            for task_index, converted, error in pool.run_tasks(_convert_file, tasks, backend="process",
+                                                                retries=0, retry_serial=False):
+                filepath = tasks[task_index][0]
+                if error is not None:
+                    result.failed.append((filepath, str(error)))
+                    continue
+
+                output_path, glyphs_count = converted
+                result.converted.append((filepath, output_path))
+                result.input_bytes += os.path.getsize(filepath)
+                result.glyphs_count += glyphs_count
+        finally:
+            if own_pool:
+                pool.shutdown()
+
+    result.elapsed = time.perf_counter() - start
+    _print_summary(result)
+    return result
+
+
+def _convert_file(filepath: str, input_format: str, output_path: str, max_glyphs: int) -> Tuple[str, int]:
+    fontinfo = FontData(output_dir="", max_glyphs=max_glyphs, verbose=False)
+    fontinfo.file_path = filepath
+    if input_format == "fnt":
+        fontinfo.read_fnt(filepath=filepath)
+    else:
+        fontinfo.read_dat(filepath=filepath)
+
+    if len(fontinfo.glyphs) == 0:
+        raise ValueError("no glyph data found")
+
+    filename = os.path.basename(output_path)
+    output_dir = os.path.dirname(output_path)
+    if input_format == "fnt":
+        fontinfo.write_dat(filename=filename, output_dir=output_dir)
+        # write_dat() leaves a DAT with the same content untouched, mark it as up to date with this input,
+        # so the next batch skips it
+        if os.path.getmtime(output_path) < os.path.getmtime(filepath):
+            os.utime(output_path)
+    else:
+        fontinfo.write_fnt(filename=filename, output_dir=output_dir)
+
+    return output_path, len(fontinfo.glyphs)
+
+
+def _print_summary(result: BatchConvertResult) -> None:
+    elapsed = max(result.elapsed, 1e-9)
+    print(f"Converted {len(result.converted)} files ({result.glyphs_count} glyphs) in {result.elapsed:.2f}s: "
+          f"{len(result.converted) / elapsed:.1f} files/s, {result.input_bytes / elapsed / (1024 * 1024):.2f} MB/s")
+    print(f"Skipped {len(result.skipped)} up to date files, {len(result.failed)} failed")
+    for filepath, error in result.failed:
+        print(f"[Error] \"{filepath}\": {error}")
+
+
+if __name__ == "__main__":
+    convert_batch(["./output", "./mod/fonts/**/*.fnt"], max_workers=0)
@@ -0,0 +1,222 @@
+"""
+    RF_Benchmark.py
+    Compare time and memory of the font generation paths on the same corresponding table,
+    the speed of the glyph rasterizers, and the import time of the modules used by short conversion runs.
+"""
+
+
+from typing import Tuple, List, Dict, Union, Any
+import os
+import sys
+import glob
+import time
+import statistics
+import subprocess
+import shutil
+import tempfile
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+from RF_Set import RASTERIZERS
+from RF_FontImageMulti import FontImageMulti, _glyph_rgba
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the traced Python/NumPy peak is reported instead
+    resource = None
+
+
+# conversion and inspection entry points first, they should not load the heavy dependencies
+IMPORT_BENCHMARK_MODULES: Tuple[str, ...] = ("RF_FontData", "RF_BatchConvert", "main", "RF_FontDiff",
+                                                "RF_FontImageMulti")
+HEAVY_MODULES: Tuple[str, ...] = ("numpy", "PIL", "fontTools")
+
+
+def benchmark_sdf_atlas(corresponding_table: List[List[Union[str, List[Tuple[int, int]]]]],
+                        font_sizes: List[int], sdf_font_size: int = 0, spread: int = 4, supersample: int = 4,
+                        texture_size: int = 1024, texture_format: str = "tga", max_workers: int = 1,
+                        max_glyphs: int = 65536, output_dir: str = "") -> List[Dict[str, Any]]:
+    """
+    Build the same fonts once with generate_sizes() (one bitmap atlas per size) and once with generate_sdf()
+    (one distance field atlas for all sizes), every path in a fresh process so their peak memory is comparable.
+    sdf_font_size: size of the distance field atlas, 0 to use the median of font_sizes
+    output_dir: keep the generated files in this directory, a temporary one is removed otherwise
+    :return: one dict per path with "time", "peak_memory_mb", "memory_source", "pages" and "vram_mb"
+    """
+    font_sizes = sorted(set(font_sizes))
+    if sdf_font_size <= 0:
+        sdf_font_size = font_sizes[len(font_sizes) // 2]
+
+    work_dir = output_dir if output_dir else tempfile.mkdtemp(prefix="rtcw_font_benchmark_")
+    common_args = dict(texture_width=texture_size, texture_height=texture_size, texture_format=texture_format,
+                        max_workers=max_workers)
+    cases = [
+        ("bitmap", max(font_sizes), dict(font_sizes=font_sizes, **common_args)),
+        ("sdf", sdf_font_size, dict(font_sizes=font_sizes, spread=spread, supersample=supersample, **common_args)),
+    ]
+
+    results: List[Dict[str, Any]] = []
+    try:
+        for mode, default_font_size, generate_args in cases:
+            case_dir = os.path.join(work_dir, mode)
+            # spawn, so the measured process doesn't inherit the memory of this one
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                result = executor.submit(_run_case, mode, corresponding_table, default_font_size, max_glyphs,
+                                            case_dir, generate_args).result()
+
+            result["pages"], result["vram_mb"] = _measure_pages(case_dir, texture_format)
+            results.append(result)
+    finally:
+        if not output_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    sizes_text = ", ".join(str(font_size) for font_size in font_sizes)
+    print(f"Benchmark for sizes {sizes_text} (distance field atlas at size {sdf_font_size}, "
+          f"spread {spread}, supersample {supersample}x):")
+    print(f"\t{'path':<8}{'time (s)':>10}{'peak memory (MB)':>18}{'pages':>7}{'VRAM RGBA (MB)':>16}")
+    for result in results:
+        print(f"\t{result['mode']:<8}{result['time']:>10.2f}{result['peak_memory_mb']:>18.1f}"
+              f"{result['pages']:>7}{result['vram_mb']:>16.1f}")
+    print(f"\tpeak memory: {results[0]['memory_source']}")
+
+    return results
+
+
+def benchmark_rasterizers(corresponding_table: List[List[Union[str, List[Tuple[int, int]]]]],
+                            default_font_size: int = 36, rasterizers: Tuple[str, ...] = RASTERIZERS,
+                            repeat: int = 3, max_glyphs: int = 65536) -> List[Dict[str, Any]]:
+    """
+    Render the glyphs of the table serially with every rasterizer, best of repeat runs, and check that
+    they produce the same pixels as the first one.
+    :return: one dict per rasterizer with "time", "glyphs", "glyphs_per_second" and "identical"
+    """
+    results: List[Dict[str, Any]] = []
+    reference: Dict[int, bytes] = {}
+    with FontImageMulti(corresponding_table, default_font_size=default_font_size,
+                        max_glyphs=max_glyphs) as generator:
+        for rasterizer in rasterizers:
+            times: List[float] = []
+            for _ in range(max(1, repeat)):
+                start = time.perf_counter()
+                generator.render_glyphs(margin=0, developer_mode=False, deduplicate=False, rasterizer=rasterizer)
+                times.append(time.perf_counter() - start)
+
+            pixels = {ttf_glyph.unicode: _glyph_rgba(ttf_glyph.image).tobytes()
+                        for ttf_glyph in generator.ttf_glyphs if ttf_glyph.image is not None}
+            if not reference:
+                reference = pixels
+
+            glyphs_count = len(generator.ttf_glyphs)
+            results.append({"rasterizer": rasterizer, "time": min(times), "glyphs": glyphs_count,
+                            "glyphs_per_second": glyphs_count / max(min(times), 1e-9),
+                            "identical": pixels == reference})
+
+    print(f"Rasterizers, best of {repeat} serial runs at size {default_font_size}:")
+    print(f"	{'rasterizer':<12}{'time (s)':>10}{'glyphs':>8}{'glyphs/s':>11}  same pixels as {rasterizers[0]}")
+    for result in results:
+        print(f"	{result['rasterizer']:<12}{result['time']:>10.2f}{result['glyphs']:>8}"
+              f"{result['glyphs_per_second']:>11.0f}  {'yes' if result['identical'] else 'no'}")
+
+    return results
+
+
+def benchmark_import_time(modules: Tuple[str, ...] = IMPORT_BENCHMARK_MODULES,
+                            repeat: int = 10) -> List[Dict[str, Any]]:
+    """
+    Import every module in a fresh interpreter repeat times, like one short conversion invocation does.
+    The first line is an interpreter importing nothing, the startup cost every invocation pays anyway.
+    :return: one dict per module with "import_ms" (median of the import statement), "process_ms" (median wall time
+        of the whole interpreter run) and "heavy_modules" (of HEAVY_MODULES, loaded by the import)
+    """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    child_code = ("import sys, time\n"
+                    "start = time.perf_counter()\n"
+                    "{statement}\n"
+                    "elapsed = time.perf_counter() - start\n"
+                    f"print(elapsed, ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n")
+
+    results: List[Dict[str, Any]] = []
+    for module in ("",) + tuple(modules):
+        code = child_code.format(statement=f"import {module}" if module else "pass")
+        import_times: List[float] = []
+        process_times: List[float] = []
+        heavy_modules = ""
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            completed = subprocess.run([sys.executable, "-c", code], cwd=src_dir, capture_output=True, text=True)
+            process_times.append(time.perf_counter() - start)
+            if completed.returncode != 0:
+                raise RuntimeError(f"[Error] couldn't import {module}: {completed.stderr.strip()}")
+
+            elapsed, _, heavy_modules = completed.stdout.strip().partition(" ")
+            import_times.append(float(elapsed))
+
+        results.append({"module": module or "(interpreter)", "import_ms": statistics.median(import_times) * 1000,
+                        "process_ms": statistics.median(process_times) * 1000,
+                        "heavy_modules": heavy_modules.split(",") if heavy_modules else []})
+
+    print(f"Import time, median of {repeat} fresh interpreters:")
+    print(f"\t{'module':<20}{'import (ms)':>12}{'process (ms)':>14}  heavy dependencies")
+    for result in results:
+        print(f"\t{result['module']:<20}{result['import_ms']:>12.1f}{result['process_ms']:>14.1f}  "
+              f"{', '.join(result['heavy_modules']) or '-'}")
+
+    return results
+
+
+def _run_case(mode: str, corresponding_table: List, default_font_size: int, max_glyphs: int, output_dir: str,
+                generate_args: Dict[str, Any]) -> Dict[str, Any]:
+    if resource is None:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    with FontImageMulti(corresponding_table, default_font_size=default_font_size, output_dir=output_dir,
+                        max_glyphs=max_glyphs) as generator:
+        if mode == "sdf":
+            generator.generate_sdf(mode, **generate_args)
+        else:
+            generator.generate_sizes(mode, **generate_args)
+    elapsed = time.perf_counter() - start
+
+    if resource is None:
+        peak_memory = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        memory_source = "traced Python and NumPy allocations"
+        tracemalloc.stop()
+    else:
+        # kilobytes on Linux, bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_memory = max_rss / (1024 * 1024) if os.uname().sysname == "Darwin" else max_rss / 1024
+        memory_source = "max resident set size of the process"
+
+    return {"mode": mode, "time": elapsed, "peak_memory_mb": peak_memory, "memory_source": memory_source}
+
+
+def _measure_pages(output_dir: str, texture_format: str) -> Tuple[int, float]:
+    """
+    :return: count of texture pages, their size once uploaded as uncompressed RGBA in MB
+    """
+    pages = 0
+    vram = 0
+    for path in glob.glob(os.path.join(output_dir, f"*.{texture_format.lower()}")):
+        with Image.open(path) as image:
+            width, height = image.size
+        pages += 1
+        vram += width * height * 4
+
+    return pages, vram / (1024 * 1024)
+
+
+if __name__ == "__main__":
+    table = [
+        [
+            "./test/ttf/DejaVuSerif.ttf",
+            [(0x0000, 0x04FF)]
+        ]
+    ]
+
+    benchmark_sdf_atlas(table, font_sizes=[16, 24, 32, 48], sdf_font_size=32, texture_format="tga", max_workers=4)
+    benchmark_rasterizers(table, default_font_size=32)
+    benchmark_import_time(repeat=10)
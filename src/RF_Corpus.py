@@ -0,0 +1,141 @@
+"""
+    RF_Corpus.py
+    Read text corpora (localization files, menu scripts..., also inside pk3 archives)
+    and measure how fonts are used by them.
+"""
+
+
+from typing import Tuple, List, Set, Dict, Iterable, Iterator, IO
+import os
+import io
+import zipfile
+import numpy as np
+
+
+CORPUS_EXTENSIONS: Tuple[str, ...] = (".txt", ".cfg", ".menu", ".str", ".lang", ".json", ".xml", ".csv")
+
+
+def iter_corpus_files(paths: List[str],
+                        extensions: Tuple[str, ...] = CORPUS_EXTENSIONS) -> Iterator[Tuple[str, IO[bytes]]]:
+    """
+    :param paths: text files, pk3 archives, or directories searched recursively for both
+    :return: (name, opened binary stream) of every text file, files inside pk3 archives are named "archive/member",
+        read the stream before getting the next one
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            filepaths = []
+            for dirpath, _, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    if os.path.splitext(filename)[1].lower() in extensions + (".pk3",):
+                        filepaths.append(os.path.join(dirpath, filename))
+        elif os.path.isfile(path):
+            filepaths = [path]
+        else:
+            print(f"[Warning] corpus \"{path}\" not exist, skip...")
+            continue
+
+        for filepath in filepaths:
+            if filepath.lower().endswith(".pk3"):
+                # pk3 files are zip archives
+                try:
+                    with zipfile.ZipFile(filepath) as archive:
+                        for info in archive.infolist():
+                            if info.is_dir() or os.path.splitext(info.filename)[1].lower() not in extensions:
+                                continue
+                            with archive.open(info) as f:
+                                yield f"{filepath}/{info.filename}", f
+                except zipfile.BadZipFile:
+                    print(f"[Warning] \"{filepath}\" is not a valid pk3 archive, skip...")
+            else:
+                with open(filepath, 'rb') as f:
+                    yield filepath, f
+
+
+def read_corpus(paths: List[str], encoding: str = 'utf-8',
+                extensions: Tuple[str, ...] = CORPUS_EXTENSIONS) -> List[str]:
+    """
+    :param paths: text files, pk3 archives, or directories searched recursively for both
+    :return: non-empty lines, every line is one string drawn by the game
+    """
+    strings: List[str] = []
+
+    for _, f in iter_corpus_files(paths, extensions):
+        text = io.TextIOWrapper(f, encoding=encoding, errors='ignore')
+        strings.extend(line.strip() for line in text if line.strip())
+
+    return strings
+
+
+def collect_codepoints(paths: List[str], encoding: str = 'utf-8',
+                        extensions: Tuple[str, ...] = CORPUS_EXTENSIONS,
+                        chunk_size: int = 1 << 20) -> Set[int]:
+    """
+    Stream the corpus files in chunks and collect every codepoint used, without keeping the text in memory.
+    :param paths: text files, pk3 archives, or directories searched recursively for both
+    """
+    used = np.zeros(0x110000, dtype=bool)
+    files_count = 0
+    chars_count = 0
+
+    for _, f in iter_corpus_files(paths, extensions):
+        text = io.TextIOWrapper(f, encoding=encoding, errors='ignore')
+        files_count += 1
+        while True:
+            chunk = text.read(chunk_size)
+            if not chunk:
+                break
+            used[np.frombuffer(chunk.encode('utf-32-le'), dtype='<u4')] = True
+            chars_count += len(chunk)
+
+    codepoints = set(np.flatnonzero(used).tolist())
+    print(f"Collected {len(codepoints)} distinct characters from {chars_count} characters in {files_count} files")
+    return codepoints
+
+
+def corpus_codepoints(strings: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: codepoints of all strings in one array, index of the string of every codepoint
+    """
+    strings = list(strings)
+    lengths = np.fromiter((len(string) for string in strings), dtype=np.int64, count=len(strings))
+    codepoints = np.frombuffer("".join(strings).encode('utf-32-le'), dtype='<u4').astype(np.int64)
+    string_ids = np.repeat(np.arange(len(strings)), lengths)
+
+    return codepoints, string_ids
+
+
+def count_frequency(strings: Iterable[str]) -> Dict[int, int]:
+    """
+    :return: codepoint -> count of uses in the strings
+    """
+    codepoints, _ = corpus_codepoints(strings)
+    unicodes, counts = np.unique(codepoints, return_counts=True)
+
+    return dict(zip(unicodes.tolist(), counts.tolist()))
+
+
+def count_page_switches(strings: List[str], glyph_pages: Dict[int, int]) -> Tuple[float, float]:
+    """
+    Count texture page changes while drawing every string glyph by glyph, characters missing in the font are skipped.
+    :param glyph_pages: codepoint -> texture page index
+    :return: mean page switches per string (the first bind is not counted), mean distinct pages per string
+    """
+    if not strings or not glyph_pages:
+        return 0.0, 0.0
+
+    codepoints, string_ids = corpus_codepoints(strings)
+
+    max_unicode = max(max(glyph_pages), int(codepoints.max()) if len(codepoints) else 0)
+    pages_lookup = np.full(max_unicode + 1, -1, dtype=np.int64)
+    pages_lookup[np.fromiter(glyph_pages.keys(), dtype=np.int64)] = np.fromiter(glyph_pages.values(), dtype=np.int64)
+
+    pages = pages_lookup[codepoints]
+    drawn = pages >= 0
+    pages, string_ids = pages[drawn], string_ids[drawn]
+
+    same_string = string_ids[1:] == string_ids[:-1]
+    switches = int(np.count_nonzero(same_string & (pages[1:] != pages[:-1])))
+    distinct_pages = len(np.unique(string_ids * (int(pages.max(initial=0)) + 1) + pages))
+
+    return switches / len(strings), distinct_pages / len(strings)
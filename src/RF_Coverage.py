@@ -0,0 +1,289 @@
+"""
+    RF_Coverage.py
+    Check which codepoints of the corresponding table every font covers, only from the cmaps and the table ranges,
+    without rendering anything. Codepoint sets are sorted interval boundaries, so even full-BMP tables are fast.
+"""
+
+
+from typing import Tuple, List, Dict, Iterable, Optional, Callable
+import os
+import time
+import numpy as np
+from fontTools.ttLib import TTFont
+
+from RF_Set import SYS_FONTS_DIR
+from RF_FontImageMulti import FontImageMulti
+
+
+FONT_EXTENSIONS: Tuple[str, ...] = (".ttf", ".ttc", ".otf")
+
+
+""" ========== interval sets ==========
+    A set of codepoints is a sorted int64 array of boundaries [start0, end0, start1, end1...],
+    every interval is half-open [start, end) and intervals neither overlap nor touch.
+"""
+
+
+def intervals_from_ranges(char_ranges: Iterable[Tuple[int, int]]) -> np.ndarray:
+    """
+    :param char_ranges: (first, last) pairs of the corresponding table, last included
+    """
+    char_ranges = list(char_ranges)
+    if not char_ranges:
+        return np.zeros(0, dtype=np.int64)
+
+    bounds = np.array([(r[0], r[-1] + 1) for r in char_ranges], dtype=np.int64)
+    bounds = bounds[bounds[:, 1] > bounds[:, 0]]
+    # union of possibly overlapping ranges
+    result = np.zeros(0, dtype=np.int64)
+    for start, end in bounds:
+        result = interval_union(result, np.array([start, end], dtype=np.int64))
+    return result
+
+
+def intervals_from_codepoints(codepoints: Iterable[int]) -> np.ndarray:
+    codepoints = np.unique(np.fromiter(codepoints, dtype=np.int64))
+    if len(codepoints) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # a new interval starts wherever the next codepoint is not adjacent
+    breaks = np.flatnonzero(np.diff(codepoints) != 1)
+    starts = np.concatenate(([codepoints[0]], codepoints[breaks + 1]))
+    ends = np.concatenate((codepoints[breaks] + 1, [codepoints[-1] + 1]))
+    return np.stack((starts, ends), axis=1).ravel()
+
+
+def _combine(a: np.ndarray, b: np.ndarray, op: Callable[[np.ndarray, np.ndarray], np.ndarray]) -> np.ndarray:
+    points = np.union1d(a, b)
+    in_a = np.searchsorted(a, points, side='right') % 2 == 1
+    in_b = np.searchsorted(b, points, side='right') % 2 == 1
+    inside = op(in_a, in_b)
+    # keep the points where the result switches between inside and outside
+    before = np.concatenate(([False], inside[:-1]))
+    return points[inside != before]
+
+
+def interval_union(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return _combine(a, b, np.logical_or)
+
+
+def interval_intersection(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return _combine(a, b, np.logical_and)
+
+
+def interval_difference(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return _combine(a, b, lambda in_a, in_b: in_a & ~in_b)
+
+
+def interval_count(a: np.ndarray) -> int:
+    return int((a[1::2] - a[0::2]).sum())
+
+
+def format_intervals(a: np.ndarray, limit: int = 20) -> str:
+    """
+    :return: "U+0E80-U+0E86 U+0E89 ..." with at most limit intervals
+    """
+    texts = []
+    for start, end in zip(a[0::2][:limit].tolist(), a[1::2][:limit].tolist()):
+        texts.append(f"U+{start:04X}" if end - start == 1 else f"U+{start:04X}-U+{end - 1:04X}")
+    if len(a) // 2 > limit:
+        texts.append(f"... (+{len(a) // 2 - limit} ranges)")
+    return " ".join(texts)
+
+
+""" ========== coverage ========== """
+
+
+class RangeCoverage:
+    def __init__(self):
+        self.font_index: int = 0
+        self.char_range: Tuple[int, int] = (0, 0)
+        self.requested: int = 0
+        self.covered: int = 0           # rendered from this font
+        self.overridden: int = 0        # in this font, but a later font of the table renders it
+        self.missing: int = 0           # not in this font
+        self.beyond_max_glyphs: int = 0     # not stored in the font data at all
+        self.missing_intervals: np.ndarray = np.zeros(0, dtype=np.int64)
+
+
+class CoverageReport:
+    def __init__(self):
+        self.font_names: List[str] = []
+        self.ranges: List[RangeCoverage] = []
+        self.fonts_requested: List[int] = []
+        self.fonts_covered: List[int] = []
+        self.fonts_overridden: List[int] = []
+        self.fonts_missing: List[int] = []
+        self.requested: int = 0
+        self.missing: np.ndarray = np.zeros(0, dtype=np.int64)     # requested, but in no font of the table
+        self.suggestions: List[Tuple[str, int]] = []    # fallback font path, missing codepoints it adds
+        self.elapsed: float = 0.0
+
+    @property
+    def missing_count(self) -> int:
+        return interval_count(self.missing)
+
+    def show_info(self, limit: int = 20) -> None:
+        """
+        :param limit: maximum count of missing ranges printed per line
+        """
+        print(f"------coverage------ ({self.elapsed * 1000:.1f}ms)")
+        for font_index, font_name in enumerate(self.font_names):
+            print(f"Font {font_index} \"{font_name}\": {self.fonts_requested[font_index]} requested, "
+                  f"{self.fonts_covered[font_index]} covered, {self.fonts_overridden[font_index]} overridden, "
+                  f"{self.fonts_missing[font_index]} missing")
+            for range_coverage in self.ranges:
+                if range_coverage.font_index != font_index:
+                    continue
+                first, last = range_coverage.char_range
+                text = (f"\tU+{first:04X}-U+{last:04X}: {range_coverage.requested} requested, "
+                        f"{range_coverage.covered} covered, {range_coverage.overridden} overridden, "
+                        f"{range_coverage.missing} missing")
+                if range_coverage.beyond_max_glyphs:
+                    text += f", {range_coverage.beyond_max_glyphs} beyond max_glyphs"
+                print(text)
+                if range_coverage.missing:
+                    print(f"\t\tmissing: {format_intervals(range_coverage.missing_intervals, limit)}")
+
+        print(f"{self.missing_count} of {self.requested} requested codepoints are in no font of the table")
+        if self.missing_count:
+            print(f"\t{format_intervals(self.missing, limit)}")
+        for font_path, count in self.suggestions:
+            print(f"\tfallback \"{font_path}\" covers {count} of them")
+
+
+def analyze_coverage(generator: FontImageMulti, fallback_dirs: Optional[List[str]] = None,
+                        max_suggestions: int = 3) -> CoverageReport:
+    """
+    Coverage of the corresponding table of a generator (fonts are loaded, nothing is rendered), the ranges are
+    intersected with the characters selected by subset_chars(). A codepoint is rendered by the last font of the
+    table whose ranges and cmap contain it, like in generate(). The 256 reserved characters of the first font
+    are only analyzed if they are in one of its ranges.
+    :param fallback_dirs: directories searched for fonts covering the codepoints missing from every font
+    :param max_suggestions: fallback fonts are picked greedily, each one covering the most remaining codepoints
+    """
+    start = time.perf_counter()
+    report = CoverageReport()
+    limit = np.array([0, generator.max_glyphs], dtype=np.int64)
+
+    fonts_ranges: List[List[np.ndarray]] = []
+    fonts_requested: List[np.ndarray] = []
+    fonts_cmap: List[np.ndarray] = []
+    for mtable in generator.multi_table:
+        cmap = intervals_from_codepoints(mtable.glyph_names.keys())
+        if mtable.char_ranges:
+            ranges = [intervals_from_ranges([char_range]) for char_range in mtable.char_ranges]
+        else:
+            # empty ranges select every character of the font
+            ranges = [cmap]
+        requested = interval_intersection(_union_all(ranges), limit)
+        selected = mtable.selected_codepoints
+        if len(selected) and len(selected) != interval_count(_union_all(ranges)):
+            # narrowed by subset_chars()
+            requested = interval_intersection(requested, intervals_from_codepoints(selected))
+
+        report.font_names.append(os.path.basename(mtable.ttf_path))
+        fonts_ranges.append(ranges)
+        fonts_requested.append(requested)
+        fonts_cmap.append(cmap)
+
+    fonts_provided = [interval_intersection(requested, cmap) for requested, cmap in zip(fonts_requested, fonts_cmap)]
+
+    # codepoints rendered by any later font, they override this font
+    later_provided: List[np.ndarray] = [np.zeros(0, dtype=np.int64)] * len(fonts_provided)
+    for font_index in range(len(fonts_provided) - 2, -1, -1):
+        later_provided[font_index] = interval_union(later_provided[font_index + 1], fonts_provided[font_index + 1])
+
+    for font_index, ranges in enumerate(fonts_ranges):
+        requested, cmap = fonts_requested[font_index], fonts_cmap[font_index]
+        report.fonts_requested.append(interval_count(requested))
+        report.fonts_covered.append(interval_count(interval_difference(fonts_provided[font_index],
+                                                                        later_provided[font_index])))
+        report.fonts_overridden.append(interval_count(interval_intersection(fonts_provided[font_index],
+                                                                            later_provided[font_index])))
+        report.fonts_missing.append(interval_count(interval_difference(requested, cmap)))
+
+        char_ranges = generator.multi_table[font_index].char_ranges or [(0, generator.max_glyphs - 1)]
+        for char_range, range_intervals in zip(char_ranges, ranges):
+            range_requested = interval_intersection(range_intervals, requested)
+            range_provided = interval_intersection(range_requested, cmap)
+
+            range_coverage = RangeCoverage()
+            range_coverage.font_index = font_index
+            range_coverage.char_range = (char_range[0], char_range[-1])
+            range_coverage.requested = interval_count(range_requested)
+            range_coverage.covered = interval_count(interval_difference(range_provided, later_provided[font_index]))
+            range_coverage.overridden = interval_count(interval_intersection(range_provided,
+                                                                                later_provided[font_index]))
+            range_coverage.missing_intervals = interval_difference(range_requested, cmap)
+            range_coverage.missing = interval_count(range_coverage.missing_intervals)
+            range_coverage.beyond_max_glyphs = interval_count(interval_difference(range_intervals, limit))
+            report.ranges.append(range_coverage)
+
+    all_requested = _union_all(fonts_requested)
+    report.requested = interval_count(all_requested)
+    report.missing = interval_difference(all_requested, _union_all(fonts_provided))
+
+    if fallback_dirs and report.missing_count:
+        report.suggestions = suggest_fallback_fonts(report.missing, fallback_dirs, max_suggestions)
+
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def suggest_fallback_fonts(missing: np.ndarray, font_dirs: List[str],
+                            max_suggestions: int = 3) -> List[Tuple[str, int]]:
+    """
+    :param missing: interval set of the codepoints to cover
+    :return: (font path, codepoints of missing it covers and the previous suggestions don't), best first
+    """
+    candidates: Dict[str, np.ndarray] = {}
+    for font_dir in font_dirs:
+        if not os.path.isdir(font_dir):
+            print(f"[Warning] fallback font directory \"{font_dir}\" not exist, skip...")
+            continue
+        for dirpath, _, filenames in os.walk(font_dir):
+            for filename in sorted(filenames):
+                if os.path.splitext(filename)[1].lower() not in FONT_EXTENSIONS:
+                    continue
+                font_path = os.path.join(dirpath, filename)
+                try:
+                    # only the cmap table is parsed
+                    with TTFont(font_path, lazy=True, fontNumber=0) as ttfont:
+                        cmap = ttfont.getBestCmap() or {}
+                except Exception as e:
+                    print(f"[Warning] couldn't read the cmap of \"{font_path}\": {e}")
+                    continue
+                covered = interval_intersection(missing, intervals_from_codepoints(cmap.keys()))
+                if interval_count(covered):
+                    candidates[font_path] = covered
+
+    suggestions: List[Tuple[str, int]] = []
+    remaining = missing
+    while candidates and len(suggestions) < max_suggestions and interval_count(remaining):
+        gains = {font_path: interval_count(interval_intersection(covered, remaining))
+                    for font_path, covered in candidates.items()}
+        best_path = max(gains, key=lambda font_path: gains[font_path])
+        if gains[best_path] == 0:
+            break
+        suggestions.append((best_path, gains[best_path]))
+        remaining = interval_difference(remaining, candidates.pop(best_path))
+
+    return suggestions
+
+
+def _union_all(interval_sets: List[np.ndarray]) -> np.ndarray:
+    result = np.zeros(0, dtype=np.int64)
+    for intervals in interval_sets:
+        result = interval_union(result, intervals)
+    return result
+
+
+# example
+if __name__ == '__main__':
+    table = [
+        ["./test/ttf/DejaVuSerif.ttf", [(0x0000, 0x04FF)]],
+        ["./test/ttf/malgun.ttf", [(0x1100, 0x11FF), (0x3130, 0x318F), (0xAC00, 0xD7AF)]],
+    ]
+    with FontImageMulti(table, default_font_size=36, max_glyphs=65536) as font_generator:
+        analyze_coverage(font_generator, fallback_dirs=[SYS_FONTS_DIR]).show_info()
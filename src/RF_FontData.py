@@ -4,10 +4,13 @@
 """
 
 
-from typing import Tuple, List, Set, Dict, Optional, IO, NoReturn
+from typing import Tuple, List, Set, Dict, Iterable, Optional, Union, IO, NoReturn
 import os
+import mmap
 import struct
-from RF_Set import *
+from RF_Set import MAX_SHADER_NAME, MAX_QPATH, GLOBAL_INFO_DATA_SIZE, PER_GLYPH_DATA_SIZE, GLOBAL_UNIC_HEADER, \
+    GLOBAL_UNIC_HEADER_SIZE, PER_GLYPH_UNIC_DATA_SIZE, GLYPHS_PER_FONT, Glyph
+from RF_Utils import patch_in_place, recover_patch, write_if_changed, BuildManifest
 
 
 class FontData:
@@ -15,7 +18,11 @@ class FontData:
     read FNT and DAT files or convert FNT and DAT files to each other for RTCW.
     """
 
-    def __init__(self, file_path: str = "", output_dir: str = "", max_glyphs: int = GLYPHS_PER_FONT):
+    def __init__(self, file_path: str = "", output_dir: str = "", max_glyphs: int = GLYPHS_PER_FONT,
+                    verbose: bool = True):
+        """
+        :param verbose: print reading progress and written files, warnings are always printed
+        """
         self.glyphs: Dict[int, Glyph] = {}
         self.glyphScale: float = 0.5
         self.name: str = ""
@@ -23,6 +30,7 @@ class FontData:
         self.max_glyphs = max_glyphs
         self.output_dir: str = output_dir
         self.file_path: str = file_path
+        self.verbose: bool = verbose
 
         self._startup()
 
@@ -110,48 +118,9 @@ class FontData:
         """ tool function """
         def _parse_glyph_info(data_block: bytes, is_unic_format: bool) -> Glyph:
             nonlocal glyphs_index
-            glyph = Glyph()
-
-            if is_unic_format:
-                if len(data_block) < PER_GLYPH_UNIC_DATA_SIZE:
-                    raise ValueError(f"[Error] the size of glyph data block is below the minimum \
-                                        {PER_GLYPH_UNIC_DATA_SIZE}, please make sure file has valid format.")
-
-                glyph.unicode = struct.unpack('<i', data_block[0:4])[0]
-                glyph.height = struct.unpack('<i', data_block[4:8])[0]
-                glyph.top = struct.unpack('<i', data_block[8:12])[0]
-                glyph.bottom = struct.unpack('<i', data_block[12:16])[0]
-                glyph.pitch = struct.unpack('<i', data_block[16:20])[0]
-                glyph.xSkip = struct.unpack('<i', data_block[20:24])[0]
-                glyph.imageWidth = struct.unpack('<i', data_block[24:28])[0]
-                glyph.imageHeight = struct.unpack('<i', data_block[28:32])[0]
-                glyph.s = struct.unpack('<f', data_block[32:36])[0]
-                glyph.t = struct.unpack('<f', data_block[36:40])[0]
-                glyph.s2 = struct.unpack('<f', data_block[40:44])[0]
-                glyph.t2 = struct.unpack('<f', data_block[44:48])[0]
-                glyph.glyph = struct.unpack('<i', data_block[48:52])[0]
-                glyph.shaderName = '\"' + data_block[52:PER_GLYPH_UNIC_DATA_SIZE].split(b'\x00', maxsplit=1)[0].decode(
-                    'latin-1', errors='ignore') + '\"'
-            else:
-                if len(data_block) < PER_GLYPH_DATA_SIZE:
-                    raise ValueError(f"[Error] the size of glyph data block is below the minimum \
-                                        {PER_GLYPH_DATA_SIZE}, please make sure file has valid format.")
-
+            glyph = _unpack_glyph_info(data_block, 0, is_unic_format)
+            if not is_unic_format:
                 glyph.unicode = glyphs_index
-                glyph.height = struct.unpack('<i', data_block[0:4])[0]
-                glyph.top = struct.unpack('<i', data_block[4:8])[0]
-                glyph.bottom = struct.unpack('<i', data_block[8:12])[0]
-                glyph.pitch = struct.unpack('<i', data_block[12:16])[0]
-                glyph.xSkip = struct.unpack('<i', data_block[16:20])[0]
-                glyph.imageWidth = struct.unpack('<i', data_block[20:24])[0]
-                glyph.imageHeight = struct.unpack('<i', data_block[24:28])[0]
-                glyph.s = struct.unpack('<f', data_block[28:32])[0]
-                glyph.t = struct.unpack('<f', data_block[32:36])[0]
-                glyph.s2 = struct.unpack('<f', data_block[36:40])[0]
-                glyph.t2 = struct.unpack('<f', data_block[40:44])[0]
-                glyph.glyph = struct.unpack('<i', data_block[44:48])[0]
-                glyph.shaderName = '\"' + data_block[48:PER_GLYPH_DATA_SIZE].split(b'\x00', maxsplit=1)[0].decode(
-                    'latin-1', errors='ignore') + '\"'
 
             return glyph
 
@@ -166,6 +135,7 @@ class FontData:
                 file_handle.seek(pos)
 
         """ read_dat """
+        recover_patch(filepath)
         with open(file=filepath, mode='rb') as f:
             # file size
             f.seek(0, 2)
@@ -182,13 +152,15 @@ class FontData:
 
             # read header, because we have a new compact storge format for unicode
             if _is_unic_format(f):
-                print("reading glyphs info from 'UNIC' format DAT...")
+                if self.verbose:
+                    print("reading glyphs info from 'UNIC' format DAT...")
                 per_glyph_data_size = PER_GLYPH_UNIC_DATA_SIZE
                 glyphs_data_size = file_size - GLOBAL_INFO_DATA_SIZE - GLOBAL_UNIC_HEADER_SIZE
                 unic_format = True
                 start_pos = GLOBAL_UNIC_HEADER_SIZE
             else:
-                print("reading glyphs info from DAT...")
+                if self.verbose:
+                    print("reading glyphs info from DAT...")
                 per_glyph_data_size = PER_GLYPH_DATA_SIZE
                 glyphs_data_size = file_size - GLOBAL_INFO_DATA_SIZE
                 unic_format = False
@@ -196,10 +168,11 @@ class FontData:
 
             # glyphs data block
             if glyphs_data_size % per_glyph_data_size != 0:
-                print(f"[Warning] glyph data block is invalid or broken!")
+                print("[Warning] glyph data block is invalid or broken!")
 
             glyphs_count = glyphs_data_size // per_glyph_data_size
-            print(f"found {glyphs_count} data blocks of glyph")
+            if self.verbose:
+                print(f"found {glyphs_count} data blocks of glyph")
 
             f.seek(start_pos)
             glyphs_index = 0
@@ -217,9 +190,9 @@ class FontData:
                     self.glyphs[glyph_info.unicode] = glyph_info
                     glyphs_index += 1
 
-                    if glyphs_index % 100 == 0:
+                    if self.verbose and glyphs_index % 100 == 0:
                         print(f"\rparsed {glyphs_index}/{glyphs_count} glyph", end='', flush=True)
-                    elif glyphs_index == glyphs_count:
+                    elif self.verbose and glyphs_index == glyphs_count:
                         print(f"\rparsed {glyphs_count}/{glyphs_count} glyph", flush=True)
 
                 except Exception as e:
@@ -290,87 +263,131 @@ class FontData:
             f.write(f"\tname {self.name}\n")
             f.write("}\n")
             
-        if os.path.exists(filepath):
+        if self.verbose and os.path.exists(filepath):
             print(f"Successfully written to \"{filepath}\"")
 
-    def write_dat(self, filename: str = "", output_dir: str = "") -> None:
+    def write_dat(self, filename: str = "", output_dir: str = "", manifest: Optional[BuildManifest] = None) -> None:
         """
-        Before using this, use read_fnt() to initial data from a RTCW .fnt file
+        Before using this, use read_fnt() to initial data from a RTCW .fnt file,
+        an existing file with the same content is left untouched
         :param filename: save file name
         :param output_dir: save file path
+        :param manifest: record the file in the build manifest
         """
+        if self.glyphs is None or len(self.glyphs) == 0:
+            print("[Warning] empty data to write!")
+            return
 
-        """ tool functions """
-        def dat_int_to_hex(value: int) -> bytes:
-            byte_data = value.to_bytes(4, byteorder='little', signed=True)
-            return byte_data
-
-        def dat_float_to_hex(value: float) -> bytes:
-            byte_data = struct.pack('<f', value)
-            return byte_data
-
-        def dat_str_to_hex(string: str, byte_len=MAX_SHADER_NAME) -> bytes:
-            string_len = len(string)
-            if string_len > byte_len:
-                byte_data = string[:byte_len].encode('utf-8')
-            elif string_len < byte_len:
-                byte_data = string.encode('utf-8') + (byte_len - string_len) * b'\x00'
-            else:
-                byte_data = string.encode('utf-8')
-            return byte_data
+        filename = self._get_dat_path(filename, output_dir)
+        # an interrupted patch_dat() must not be rolled back over the new file later
+        recover_patch(filename)
+        is_unic_format = len(self.glyphs) > 256
+
+        data = bytearray()
+        # header
+        if is_unic_format:
+            data += GLOBAL_UNIC_HEADER.encode('utf-8')
 
-        """ write_dat """
+        # glyphs
+        # NOTE: only write valid glyph section
+        for i in self._get_dat_indexes():
+            data += _pack_glyph_info(self.glyphs[i], is_unic_format)
+
+        # fontinfo
+        data += _pack_font_info(self.glyphScale, self.name)
+
+        if manifest is not None:
+            written = manifest.write(filename, data)
+        else:
+            written, _ = write_if_changed(filename, data)
+
+        if self.verbose and written:
+            print(f"Successfully written to \"{filename}\"")
+        elif self.verbose:
+            print(f"\"{filename}\" is unchanged, not rewritten")
+
+    def patch_dat(self, filename: str = "", output_dir: str = "") -> None:
+        """
+        Update an existing DAT file in place, only the glyph records that differ and the fontinfo block
+        are written, see patch_in_place(). Falls back to write_dat() when glyphs were added or removed.
+        :param filename: save file name
+        :param output_dir: save file path
+        """
         if self.glyphs is None or len(self.glyphs) == 0:
             print("[Warning] empty data to write!")
             return
 
+        filepath = self._get_dat_path(filename, output_dir)
+        if os.path.exists(filepath):
+            recover_patch(filepath)
+        else:
+            self.write_dat(filename, output_dir)
+            return
+
+        with open(file=filepath, mode='rb') as f:
+            file_data = f.read()
+
+        is_unic_format = len(self.glyphs) > 256
+        if is_unic_format:
+            start_pos = GLOBAL_UNIC_HEADER_SIZE
+            per_glyph_data_size = PER_GLYPH_UNIC_DATA_SIZE
+        else:
+            start_pos = 0
+            per_glyph_data_size = PER_GLYPH_DATA_SIZE
+
+        glyphs_data_size = len(file_data) - GLOBAL_INFO_DATA_SIZE - start_pos
+        file_is_unic = file_data[:GLOBAL_UNIC_HEADER_SIZE] == GLOBAL_UNIC_HEADER.encode('utf-8')
+        if file_is_unic != is_unic_format or glyphs_data_size < 0 or glyphs_data_size % per_glyph_data_size != 0:
+            print(f"[Warning] layout of \"{filepath}\" has changed, rewrite the whole file...")
+            self.write_dat(filename, output_dir)
+            return
+
+        # map every record in the file to the glyph it holds, same as read_dat()
+        record_indexes: Dict[int, int] = {}
+        empty_block = bytes(per_glyph_data_size)
+        for record in range(glyphs_data_size // per_glyph_data_size):
+            offset = start_pos + record * per_glyph_data_size
+            if file_data[offset:offset + per_glyph_data_size] == empty_block:
+                continue
+            if is_unic_format:
+                record_indexes[struct.unpack_from('<i', file_data, offset)[0]] = record
+            else:
+                record_indexes[record] = record
+
+        if set(record_indexes.keys()) != set(self._get_dat_indexes()):
+            print("[Warning] glyphs were added or removed, rewrite the whole file...")
+            self.write_dat(filename, output_dir)
+            return
+
+        patches: List[Tuple[int, bytes]] = []
+        for i, record in record_indexes.items():
+            offset = start_pos + record * per_glyph_data_size
+            glyph_data = _pack_glyph_info(self.glyphs[i], is_unic_format)
+            if file_data[offset:offset + per_glyph_data_size] != glyph_data:
+                patches.append((offset, glyph_data))
+
+        font_info_data = _pack_font_info(self.glyphScale, self.name)
+        if file_data[-GLOBAL_INFO_DATA_SIZE:] != font_info_data:
+            patches.append((len(file_data) - GLOBAL_INFO_DATA_SIZE, font_info_data))
+
+        if patches:
+            patch_in_place(filepath, patches)
+        if self.verbose:
+            print(f"Successfully patched {len(patches)} data blocks in \"{filepath}\"")
+
+    def _get_dat_path(self, filename: str, output_dir: str) -> str:
         if not filename or filename.isspace():
             filename = os.path.basename(self.file_path.replace(".fnt", ".dat"))
 
         if output_dir and not output_dir.isspace():
             os.makedirs(output_dir, exist_ok=True)
-            filename = os.path.join(output_dir, filename)
+            return os.path.join(output_dir, filename)
         else:
-            filename = os.path.join(self.output_dir, filename)
-
-        with open(file=filename, mode='wb') as f:
-            is_unic_format = len(self.glyphs) > 256
+            return os.path.join(self.output_dir, filename)
 
-            # header
-            if is_unic_format:
-                f.write(dat_str_to_hex(GLOBAL_UNIC_HEADER, byte_len=len(GLOBAL_UNIC_HEADER)))
-
-            # glyphs
-            indexes = self.glyphs.keys()
-            for i in range(self.max_glyphs):
-                if i not in indexes:
-                    # NOTE: only write valid glyph section
-                    continue
-                    # f.write(bytes(PER_GLYPH_DATA_SIZE))   # write PER_GDATA_LEN * b"0x00"
-                else:
-                    glyph = self.glyphs[i]
-                    if is_unic_format:
-                        f.write(dat_int_to_hex(glyph.unicode))
-                    f.write(dat_int_to_hex(glyph.height))
-                    f.write(dat_int_to_hex(glyph.top))
-                    f.write(dat_int_to_hex(glyph.bottom))
-                    f.write(dat_int_to_hex(glyph.pitch))
-                    f.write(dat_int_to_hex(glyph.xSkip))
-                    f.write(dat_int_to_hex(glyph.imageWidth))
-                    f.write(dat_int_to_hex(glyph.imageHeight))
-                    f.write(dat_float_to_hex(glyph.s))
-                    f.write(dat_float_to_hex(glyph.t))
-                    f.write(dat_float_to_hex(glyph.s2))
-                    f.write(dat_float_to_hex(glyph.t2))
-                    f.write(dat_int_to_hex(glyph.glyph))
-                    f.write(dat_str_to_hex(glyph.shaderName.replace('\"', ''), byte_len=MAX_SHADER_NAME))
-
-            # fontinfo
-            f.write(dat_float_to_hex(self.glyphScale))
-            f.write(dat_str_to_hex(self.name.replace('\"', ''), byte_len=MAX_QPATH))
-        
-        if os.path.exists(filename):
-            print(f"Successfully written to \"{filename}\"")
+    def _get_dat_indexes(self) -> List[int]:
+        # glyphs are stored in ascending order and limited by max_glyphs
+        return sorted(i for i in self.glyphs.keys() if 0 <= i < self.max_glyphs)
 
     def show_info(self, index: int = -1) -> None:
         """
@@ -411,6 +428,155 @@ class FontData:
         self.show_info(index)
 
 
+class FontDataIndex:
+    """
+    Random-access glyph lookup on a DAT file without parsing every data block.
+    The file is memory-mapped, 'UNIC' blocks are found by binary search over their unicode fields
+    (write_dat() stores them in ascending order), legacy blocks by their slot offset.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path: str = file_path
+        self.glyphScale: float = 0.5
+        self.name: str = ""
+        self.is_unic_format: bool = False
+        self.glyphs_count: int = 0
+
+        self._file: Optional[IO[bytes]] = None
+        self._data: Optional[mmap.mmap] = None
+        self._start_pos: int = 0
+        self._per_glyph_data_size: int = PER_GLYPH_DATA_SIZE
+
+        self._startup()
+
+    def _startup(self) -> None:
+        # roll back an interrupted patch_dat() before mapping the records
+        recover_patch(self.file_path)
+        self._file = open(file=self.file_path, mode='rb')
+        file_size = os.fstat(self._file.fileno()).st_size
+        if file_size < GLOBAL_INFO_DATA_SIZE:
+            self._file.close()
+            raise ValueError("[Error] invalid glyph data block!")
+
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # global fontinfo data block
+        global_info_data = self._data[file_size - GLOBAL_INFO_DATA_SIZE:]
+        self.glyphScale = struct.unpack_from('<f', global_info_data, 0)[0]
+        self.name = '\"' + global_info_data[4:].split(b'\x00', maxsplit=1)[0].decode('latin-1', errors='ignore') + '\"'
+
+        self.is_unic_format = self._data[:GLOBAL_UNIC_HEADER_SIZE] == GLOBAL_UNIC_HEADER.encode('utf-8')
+        if self.is_unic_format:
+            self._start_pos = GLOBAL_UNIC_HEADER_SIZE
+            self._per_glyph_data_size = PER_GLYPH_UNIC_DATA_SIZE
+
+        glyphs_data_size = file_size - GLOBAL_INFO_DATA_SIZE - self._start_pos
+        if glyphs_data_size % self._per_glyph_data_size != 0:
+            print("[Warning] glyph data block is invalid or broken!")
+        self.glyphs_count = glyphs_data_size // self._per_glyph_data_size
+
+    def close(self) -> None:
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "FontDataIndex":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.glyphs_count
+
+    def __contains__(self, unicode: int) -> bool:
+        return self._find_record(unicode) >= 0
+
+    def _find_record(self, unicode: int) -> int:
+        """
+        :return: data block index of the unicode, -1 if not found
+        """
+        if self.is_unic_format:
+            lo, hi = 0, self.glyphs_count - 1
+            while lo <= hi:
+                mid = (lo + hi) // 2
+                value = struct.unpack_from('<i', self._data, self._start_pos + mid * self._per_glyph_data_size)[0]
+                if value < unicode:
+                    lo = mid + 1
+                elif value > unicode:
+                    hi = mid - 1
+                else:
+                    return mid
+            return -1
+
+        if not 0 <= unicode < self.glyphs_count:
+            return -1
+        # all b"0x00" blocks are unused slots
+        offset = self._start_pos + unicode * self._per_glyph_data_size
+        if self._data[offset:offset + self._per_glyph_data_size].count(0) == self._per_glyph_data_size:
+            return -1
+        return unicode
+
+    def get_glyph(self, unicode: int) -> Optional[Glyph]:
+        record = self._find_record(unicode)
+        if record < 0:
+            return None
+
+        glyph = _unpack_glyph_info(self._data, self._start_pos + record * self._per_glyph_data_size, self.is_unic_format)
+        glyph.unicode = unicode
+        return glyph
+
+    def get_glyphs(self, unicodes: Iterable[int]) -> Dict[int, Glyph]:
+        glyphs: Dict[int, Glyph] = {}
+        for unicode in unicodes:
+            glyph = self.get_glyph(unicode)
+            if glyph is not None:
+                glyphs[unicode] = glyph
+
+        return glyphs
+
+
+def _unpack_glyph_info(data: Union[bytes, mmap.mmap], offset: int, is_unic_format: bool) -> Glyph:
+    """
+    Decode one glyph data block starting at offset, legacy blocks don't store the unicode
+    """
+    per_glyph_data_size = PER_GLYPH_UNIC_DATA_SIZE if is_unic_format else PER_GLYPH_DATA_SIZE
+    if len(data) - offset < per_glyph_data_size:
+        raise ValueError(f"[Error] the size of glyph data block is below the minimum \
+                            {per_glyph_data_size}, please make sure file has valid format.")
+
+    glyph = Glyph()
+    if is_unic_format:
+        glyph.unicode = struct.unpack_from('<i', data, offset)[0]
+        offset += 4
+
+    (glyph.height, glyph.top, glyph.bottom, glyph.pitch, glyph.xSkip, glyph.imageWidth, glyph.imageHeight,
+        glyph.s, glyph.t, glyph.s2, glyph.t2, glyph.glyph) = struct.unpack_from('<7i4fi', data, offset)
+    shader_name = data[offset + 48:offset + 48 + MAX_SHADER_NAME].split(b'\x00', maxsplit=1)[0]
+    glyph.shaderName = '\"' + shader_name.decode('latin-1', errors='ignore') + '\"'
+
+    return glyph
+
+
+def _pack_glyph_info(glyph: Glyph, is_unic_format: bool) -> bytes:
+    shader_name = glyph.shaderName.replace('\"', '').encode('utf-8')[:MAX_SHADER_NAME]
+    data = struct.pack('<7i4fi', glyph.height, glyph.top, glyph.bottom, glyph.pitch, glyph.xSkip,
+                        glyph.imageWidth, glyph.imageHeight, glyph.s, glyph.t, glyph.s2, glyph.t2, glyph.glyph)
+    data += shader_name.ljust(MAX_SHADER_NAME, b'\x00')
+
+    if is_unic_format:
+        return struct.pack('<i', glyph.unicode) + data
+    return data
+
+
+def _pack_font_info(glyph_scale: float, name: str) -> bytes:
+    name_data = name.replace('\"', '').encode('utf-8')[:MAX_QPATH]
+    return struct.pack('<f', glyph_scale) + name_data.ljust(MAX_QPATH, b'\x00')
+
+
 def _remove_lines_comments(lines: List[str]) -> List[str]:
     cleaned_lines: List = []
     in_comment: bool = False
@@ -0,0 +1,320 @@
+"""
+    RF_FontDiff.py
+    Compare two RTCW fonts (FNT or DAT, legacy or 'UNIC') glyph by glyph with vectorized record arrays.
+"""
+
+
+from typing import Tuple, List, Dict, Optional, TYPE_CHECKING
+import os
+import time
+import numpy as np
+
+from RF_Set import MAX_SHADER_NAME, GLOBAL_INFO_DATA_SIZE, GLOBAL_UNIC_HEADER, GLOBAL_UNIC_HEADER_SIZE
+from RF_FontData import FontData
+from RF_Utils import recover_patch
+from RF_BatchConvert import detect_format
+
+if TYPE_CHECKING:
+    # Pillow is only loaded to compare pixels
+    from PIL import Image
+
+
+GLYPH_FIELDS: Tuple[str, ...] = ("height", "top", "bottom", "pitch", "xSkip", "imageWidth", "imageHeight",
+                                    "s", "t", "s2", "t2", "glyph", "shaderName")
+FLOAT_FIELDS: Tuple[str, ...] = ("s", "t", "s2", "t2")
+
+# same layout as a DAT glyph data block
+GLYPH_RECORD_DTYPE = np.dtype([
+    ("height", "<i4"), ("top", "<i4"), ("bottom", "<i4"), ("pitch", "<i4"), ("xSkip", "<i4"),
+    ("imageWidth", "<i4"), ("imageHeight", "<i4"),
+    ("s", "<f4"), ("t", "<f4"), ("s2", "<f4"), ("t2", "<f4"),
+    ("glyph", "<i4"), ("shaderName", f"S{MAX_SHADER_NAME}")
+])
+GLYPH_UNIC_RECORD_DTYPE = np.dtype([("unicode", "<i4")] + GLYPH_RECORD_DTYPE.descr)
+
+
+class FontRecords:
+    """
+    All glyphs of a font as one structured array sorted by unicode, fields as in GLYPH_UNIC_RECORD_DTYPE
+    """
+
+    def __init__(self, file_path: str, max_glyphs: int = 65536):
+        self.file_path: str = file_path
+        self.max_glyphs: int = max_glyphs
+        self.records: np.ndarray = np.zeros(0, dtype=GLYPH_UNIC_RECORD_DTYPE)
+        self.glyphScale: float = 0.5
+        self.name: str = ""
+
+        self._startup()
+
+    def _startup(self) -> None:
+        if detect_format(self.file_path) == "fnt":
+            self._read_fnt()
+        else:
+            # roll back an interrupted patch_dat() before reading the records
+            recover_patch(self.file_path)
+            with open(self.file_path, 'rb') as f:
+                head = f.read(GLOBAL_UNIC_HEADER_SIZE)
+            self._read_dat(is_unic_format=head == GLOBAL_UNIC_HEADER.encode('utf-8'))
+
+        records = self.records[(self.records["unicode"] >= 0) & (self.records["unicode"] < self.max_glyphs)]
+        # sorted and unique, the last record of a codepoint wins like in FontData
+        order = np.argsort(records["unicode"], kind="stable")[::-1]
+        _, first = np.unique(records["unicode"][order], return_index=True)
+        self.records = records[order[first]]
+
+    def _read_dat(self, is_unic_format: bool) -> None:
+        with open(self.file_path, 'rb') as f:
+            data = f.read()
+
+        if len(data) < GLOBAL_INFO_DATA_SIZE:
+            raise ValueError(f"[Error] invalid glyph data block in \"{self.file_path}\"!")
+
+        global_info_data = data[-GLOBAL_INFO_DATA_SIZE:]
+        self.glyphScale = float(np.frombuffer(global_info_data, dtype="<f4", count=1)[0])
+        self.name = global_info_data[4:].split(b'\x00', maxsplit=1)[0].decode('latin-1', errors='ignore')
+
+        dtype = GLYPH_UNIC_RECORD_DTYPE if is_unic_format else GLYPH_RECORD_DTYPE
+        start_pos = GLOBAL_UNIC_HEADER_SIZE if is_unic_format else 0
+        glyphs_count = (len(data) - GLOBAL_INFO_DATA_SIZE - start_pos) // dtype.itemsize
+        if (len(data) - GLOBAL_INFO_DATA_SIZE - start_pos) % dtype.itemsize != 0:
+            print(f"[Warning] glyph data block of \"{self.file_path}\" is invalid or broken!")
+
+        raw = np.frombuffer(data, dtype=np.uint8, count=glyphs_count * dtype.itemsize, offset=start_pos)
+        used = raw.reshape(glyphs_count, dtype.itemsize).any(axis=1)     # all b"0x00" blocks are unused
+        records = np.frombuffer(data, dtype=dtype, count=glyphs_count, offset=start_pos)
+
+        if is_unic_format:
+            self.records = records[used].copy()
+        else:
+            # legacy blocks are indexed by their slot
+            self.records = np.zeros(int(used.sum()), dtype=GLYPH_UNIC_RECORD_DTYPE)
+            self.records["unicode"] = np.flatnonzero(used)
+            for field in GLYPH_FIELDS:
+                self.records[field] = records[field][used]
+
+    def _read_fnt(self) -> None:
+        fontinfo = FontData(max_glyphs=self.max_glyphs, verbose=False)
+        fontinfo.read_fnt(filepath=self.file_path)
+
+        self.glyphScale = fontinfo.glyphScale
+        self.name = fontinfo.name.replace('\"', '')
+        # stored the same way write_dat() would, so FNT and DAT files compare equal
+        self.records = np.array(
+            [
+                (glyph.unicode, glyph.height, glyph.top, glyph.bottom, glyph.pitch, glyph.xSkip,
+                    glyph.imageWidth, glyph.imageHeight, glyph.s, glyph.t, glyph.s2, glyph.t2, glyph.glyph,
+                    glyph.shaderName.replace('\"', '').encode('utf-8')[:MAX_SHADER_NAME])
+                for glyph in fontinfo.glyphs.values()
+            ],
+            dtype=GLYPH_UNIC_RECORD_DTYPE
+        )
+
+
+class FontDiff:
+    def __init__(self):
+        self.added: np.ndarray = np.zeros(0, dtype=np.int32)       # codepoints only in the new font
+        self.removed: np.ndarray = np.zeros(0, dtype=np.int32)     # codepoints only in the old font
+        self.changed: np.ndarray = np.zeros(0, dtype=np.int32)     # codepoints with at least one changed field
+        self.changed_fields: Dict[str, np.ndarray] = {}             # field -> codepoints where it changed
+        self.glyph_scale_changed: bool = False
+        self.name_changed: bool = False
+        self.common_count: int = 0
+
+        # only with check_pixels
+        self.pixels_checked: bool = False
+        self.pixels_changed: np.ndarray = np.zeros(0, dtype=np.int32)    # different atlas region content
+        self.moved_only: np.ndarray = np.zeros(0, dtype=np.int32)        # new atlas position, same pixels
+        self.missing_textures: List[str] = []
+
+        self.elapsed: float = 0.0
+
+    @property
+    def is_identical(self) -> bool:
+        return not (len(self.added) or len(self.removed) or len(self.changed) or len(self.pixels_changed)
+                    or self.glyph_scale_changed or self.name_changed)
+
+    def show_info(self, limit: int = 20) -> None:
+        """
+        :param limit: maximum count of codepoints printed per line
+        """
+        def codepoints_text(codepoints: np.ndarray) -> str:
+            text = " ".join(f"U+{int(unicode):04X}" for unicode in codepoints[:limit])
+            if len(codepoints) > limit:
+                text += f" ... (+{len(codepoints) - limit})"
+            return text
+
+        print(f"------font diff------ ({self.elapsed * 1000:.1f}ms)")
+        print(f"{self.common_count} common glyphs, {len(self.added)} added, {len(self.removed)} removed, "
+              f"{len(self.changed)} changed")
+        if len(self.added):
+            print(f"added: {codepoints_text(self.added)}")
+        if len(self.removed):
+            print(f"removed: {codepoints_text(self.removed)}")
+        for field, codepoints in self.changed_fields.items():
+            if len(codepoints):
+                print(f"{field} ({len(codepoints)}): {codepoints_text(codepoints)}")
+        if self.glyph_scale_changed:
+            print("glyphScale changed")
+        if self.name_changed:
+            print("name changed")
+
+        if self.pixels_checked:
+            print(f"pixels changed ({len(self.pixels_changed)}): {codepoints_text(self.pixels_changed)}")
+            print(f"moved in the atlas with the same pixels ({len(self.moved_only)}): "
+                  f"{codepoints_text(self.moved_only)}")
+            for texture_path in self.missing_textures:
+                print(f"[Warning] texture \"{texture_path}\" not found, its glyphs were not compared")
+
+        if self.is_identical:
+            print("fonts are identical")
+
+
+def diff_fonts(old_path: str, new_path: str, float_tolerance: float = 1e-5, check_pixels: bool = False,
+                old_texture_dir: str = "", new_texture_dir: str = "", max_glyphs: int = 65536) -> FontDiff:
+    """
+    :param float_tolerance: s, t, s2, t2 differences up to this are ignored,
+        FNT files store 6 decimals and DAT files float32
+    :param check_pixels: compare the atlas regions of every common glyph, pages are looked up by the basename of
+        their shader name in old_texture_dir / new_texture_dir (default: the directory of the font file)
+    """
+    start = time.perf_counter()
+    old_font = FontRecords(old_path, max_glyphs=max_glyphs)
+    new_font = FontRecords(new_path, max_glyphs=max_glyphs)
+    old_records, new_records = old_font.records, new_font.records
+
+    result = FontDiff()
+    result.added = np.setdiff1d(new_records["unicode"], old_records["unicode"], assume_unique=True)
+    result.removed = np.setdiff1d(old_records["unicode"], new_records["unicode"], assume_unique=True)
+
+    common, old_index, new_index = np.intersect1d(old_records["unicode"], new_records["unicode"],
+                                                    assume_unique=True, return_indices=True)
+    old_common, new_common = old_records[old_index], new_records[new_index]
+    result.common_count = len(common)
+
+    any_changed = np.zeros(len(common), dtype=bool)
+    for field in GLYPH_FIELDS:
+        if field in FLOAT_FIELDS:
+            field_changed = np.abs(old_common[field] - new_common[field]) > float_tolerance
+        else:
+            field_changed = old_common[field] != new_common[field]
+        result.changed_fields[field] = common[field_changed]
+        any_changed |= field_changed
+    result.changed = common[any_changed]
+
+    result.glyph_scale_changed = abs(old_font.glyphScale - new_font.glyphScale) > 1e-6
+    result.name_changed = old_font.name != new_font.name
+
+    if check_pixels:
+        _diff_pixels(result, common, old_common, new_common,
+                        old_texture_dir or os.path.dirname(old_path), new_texture_dir or os.path.dirname(new_path))
+
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def _diff_pixels(result: FontDiff, common: np.ndarray, old_common: np.ndarray, new_common: np.ndarray,
+                    old_texture_dir: str, new_texture_dir: str) -> None:
+    """
+    Glyphs at the same place of pages with the same size are compared at once, with a summed-area table
+    of the page difference. Only glyphs moved in the atlas are cropped and compared one by one.
+    """
+    # Pillow is only needed to compare pixels
+    from PIL import Image
+
+    def load_pages(texture_dir: str, shader_names: np.ndarray) -> Tuple[List[Optional[np.ndarray]], np.ndarray]:
+        # one load per page, the index of the page of every glyph
+        names, page_index = np.unique(shader_names, return_inverse=True)
+        pages: List[Optional[np.ndarray]] = []
+        for name in names:
+            texture_path = os.path.join(texture_dir, os.path.basename(name.decode('utf-8', errors='ignore')))
+            if os.path.exists(texture_path):
+                with Image.open(texture_path) as image:
+                    pages.append(_page_rgba(image))
+            else:
+                pages.append(None)
+                result.missing_textures.append(texture_path)
+        return pages, page_index.reshape(-1)
+
+    def regions(pages: List[Optional[np.ndarray]], page_index: np.ndarray, records: np.ndarray) -> np.ndarray:
+        # x1, y1, x2, y2 of every glyph in its page, clipped to the page
+        sizes = np.array([page.shape[:2] if page is not None else (0, 0) for page in pages],
+                            dtype=np.float64).reshape(-1, 2)
+        heights, widths = sizes[page_index, 0], sizes[page_index, 1]
+        rects = np.stack([np.rint(records["s"].astype(np.float64) * widths),
+                            np.rint(records["t"].astype(np.float64) * heights),
+                            np.rint(records["s2"].astype(np.float64) * widths),
+                            np.rint(records["t2"].astype(np.float64) * heights)], axis=1)
+        rects[:, 0::2] = np.clip(rects[:, 0::2], 0, widths[:, None])
+        rects[:, 1::2] = np.clip(rects[:, 1::2], 0, heights[:, None])
+        rects[:, 2] = np.maximum(rects[:, 2], rects[:, 0])
+        rects[:, 3] = np.maximum(rects[:, 3], rects[:, 1])
+        return rects.astype(np.int64)
+
+    old_pages, old_page_index = load_pages(old_texture_dir, old_common["shaderName"])
+    new_pages, new_page_index = load_pages(new_texture_dir, new_common["shaderName"])
+    old_present = np.array([page is not None for page in old_pages], dtype=bool)
+    new_present = np.array([page is not None for page in new_pages], dtype=bool)
+    checked = old_present[old_page_index] & new_present[new_page_index]
+
+    old_rects = regions(old_pages, old_page_index, old_common)
+    new_rects = regions(new_pages, new_page_index, new_common)
+    same_place = checked & (old_common["shaderName"] == new_common["shaderName"]) & \
+        (old_rects == new_rects).all(axis=1)
+
+    pixels_changed = np.zeros(len(common), dtype=bool)
+    compared = np.zeros(len(common), dtype=bool)
+    for old_page_id, new_page_id in set(zip(old_page_index[same_place].tolist(),
+                                            new_page_index[same_place].tolist())):
+        old_page, new_page = old_pages[old_page_id], new_pages[new_page_id]
+        if old_page.shape != new_page.shape:
+            continue
+
+        glyphs = np.flatnonzero(same_place & (old_page_index == old_page_id) & (new_page_index == new_page_id))
+        # count of different pixels above and left of every pixel corner
+        different = np.zeros((old_page.shape[0] + 1, old_page.shape[1] + 1), dtype=np.int32)
+        # RGBA texels compared as one uint32
+        mismatch = np.ascontiguousarray(old_page).view(np.uint32)[..., 0] != \
+            np.ascontiguousarray(new_page).view(np.uint32)[..., 0]
+        np.cumsum(mismatch, axis=0, dtype=np.int32, out=different[1:, 1:])
+        np.cumsum(different[1:, 1:], axis=1, out=different[1:, 1:])
+        x1, y1, x2, y2 = old_rects[glyphs].T
+        counts = different[y2, x2] - different[y1, x2] - different[y2, x1] + different[y1, x1]
+        pixels_changed[glyphs] = counts > 0
+        compared[glyphs] = True
+
+    # moved glyphs, or pages whose size changed
+    for i in np.flatnonzero(checked & ~compared).tolist():
+        old_x1, old_y1, old_x2, old_y2 = old_rects[i].tolist()
+        new_x1, new_y1, new_x2, new_y2 = new_rects[i].tolist()
+        old_region = old_pages[old_page_index[i]][old_y1:old_y2, old_x1:old_x2]
+        new_region = new_pages[new_page_index[i]][new_y1:new_y2, new_x1:new_x2]
+        pixels_changed[i] = old_region.shape != new_region.shape or not np.array_equal(old_region, new_region)
+
+    moved = np.zeros(len(common), dtype=bool)
+    for field in ("s", "t", "s2", "t2", "shaderName"):
+        moved |= np.isin(common, result.changed_fields[field])
+
+    result.pixels_checked = True
+    result.pixels_changed = common[pixels_changed]
+    result.moved_only = common[moved & checked & ~pixels_changed]
+
+
+def _page_rgba(image: "Image.Image") -> np.ndarray:
+    """
+    :return: RGBA pixels of a page, 8-bit pages of texture mode "alpha" become the white glyphs they store,
+        like the RGBA pages of the same font
+    """
+    if image.mode == "L":
+        alpha = np.asarray(image)
+        pixels = np.zeros((image.height, image.width, 4), dtype=np.uint8)
+        pixels[alpha > 0, :3] = 255
+        pixels[..., 3] = alpha
+        return pixels
+    return np.asarray(image.convert("RGBA"))
+
+
+# example
+if __name__ == '__main__':
+    diff = diff_fonts("./output/fontImage_old.dat", "./output/fontImage_36.dat", check_pixels=True)
+    diff.show_info()
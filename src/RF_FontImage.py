@@ -11,7 +11,7 @@ import os
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from fontTools.ttLib import TTFont
-from RF_Set import *
+from RF_Set import GLYPHS_PER_FONT, SYS_FONTS_DIR, Glyph, TTFGlyph, Texture
 
 
 class FontImage:
@@ -3,23 +3,64 @@
     Generate TGA bitmap font textures and base FNT data file for RTCW from multiple TrueTypeFont files.
 """
 
-from typing import Tuple, List, Set, Dict, Optional, Union, NoReturn
+from typing import Tuple, List, Set, Dict, Iterable, Optional, Union, Callable, NoReturn
 import os
+import io
+import copy
+import math
+import time
+import shutil
+import hashlib
+import tempfile
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+from fontTools import subset
 from fontTools.ttLib import TTFont
 from fontTools.ttLib.tables._c_m_a_p import table__c_m_a_p
-from concurrent.futures import ProcessPoolExecutor, as_completed
 
-from RF_Set import *
+from RF_Set import GLYPHS_PER_FONT, SYS_FONTS_DIR, RENDER_SERIAL_SECONDS, RENDER_PROCESS_STARTUP_SECONDS, \
+    RENDER_THREAD_SPEEDUP, RENDER_CHUNKS_PER_WORKER, RENDER_MIN_CHUNK_GLYPHS, PRESUBSET_MIN_FILE_SIZE, \
+    PRESUBSET_MAX_GLYPHS_RATIO, TEXTURE_MODES, TEXTURE_MODE_BYTES, RASTERIZERS, MANIFEST_SUFFIX, Glyph, TTFGlyph, Texture, MultiTable
+from RF_FontData import FontData
+from RF_Corpus import count_frequency, count_page_switches
+from RF_Utils import atomic_write, write_if_changed, matches_source, available_cpu_count, AsyncWriter, \
+    BuildManifest
+from RF_WorkerPool import WorkerPool, load_font
+
+
+# written to the FNT header, the pages have to be drawn differently depending on their pixel format
+TEXTURE_MODE_NOTES: Dict[str, List[str]] = {
+    "rgba": [],
+    "alpha": [
+        "Texture mode: alpha, 8-bit grayscale pages with the coverage in the color channels, loaded opaque",
+        "Shader: blendFunc GL_ONE GL_ONE_MINUS_SRC_COLOR, rgbGen vertex (exact for white and gray text)",
+    ],
+    "la": [
+        "Texture mode: la, 8-bit luminance and alpha PNG pages, expanded to RGBA by the PNG loader",
+        "Shader: blendFunc GL_SRC_ALPHA GL_ONE_MINUS_SRC_ALPHA, rgbGen vertex (same as RGBA pages)",
+    ],
+}
 
 
 class FontImageMulti:
     def __init__(self, corresponding_table: List[List[Union[str, List[Tuple[int, int]]]]],
-                    default_font_size: int = 36, output_dir: str = "", max_glyphs: int = GLYPHS_PER_FONT):
+                    default_font_size: int = 36, output_dir: str = "", max_glyphs: int = GLYPHS_PER_FONT,
+                    pool: Optional[WorkerPool] = None):
+        """
+        pool: worker pool shared with other generators in a multi-build session, if not specified,
+            the generator creates its own pool on first use, call close() or use "with" to shut it down
+        """
         self.ttf_glyphs: List[TTFGlyph] = []
         self.textures: List[Texture] = []
         self.glyphs: List[Glyph] = []
+        self.blank_glyph: Optional[TTFGlyph] = None     # shared transparent texel of empty glyphs
+        self.glyph_scale: float = 1.0    # glyphScale written to the .fnt file
+        self.imported_fonts: List[str] = []     # FNT/DAT files merged by generate_merged()
+        self.glyph_frequency: Dict[int, int] = {}   # codepoint -> uses, hot glyphs are packed first
+        self.usage_corpus: List[str] = []       # strings to report texture page switches for
+        self.manifest: Optional[BuildManifest] = None   # files written by the last generate() call
+        # rendered glyphs kept between builds, None: every build renders everything, see render_glyphs_cached()
+        self.render_cache: Optional[Dict[Tuple, Dict[int, Optional[TTFGlyph]]]] = None
 
         self.default_font_size: int = default_font_size
         self.max_workers: int = 0
@@ -30,6 +71,9 @@ class FontImageMulti:
         # ttf path, TTFont, available chars, selected chars set
         self.multi_table: List[MultiTable] = []
 
+        self.pool: Optional[WorkerPool] = pool
+        self._owns_pool: bool = pool is None
+
         self._startup()
 
     def _startup(self) -> None:
@@ -38,7 +82,39 @@ class FontImageMulti:
 
         self._set_multi_table()
 
-    def _set_multi_table(self) -> None:
+    def _get_pool(self) -> WorkerPool:
+        if self.pool is None:
+            self.pool = WorkerPool(max_workers=self.max_workers)
+        return self.pool
+
+    def close(self) -> None:
+        """
+        shut down the worker pool created by this generator, a shared pool is left to its owner
+        """
+        if self._owns_pool and self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self) -> "FontImageMulti":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def set_corresponding_table(self, corresponding_table: List[List[Union[str, List[Tuple[int, int]]]]]) -> None:
+        """
+        Replace the corresponding table, fonts whose file is unchanged since they were loaded are reused
+        instead of being parsed again (see RF_Watch). Rendered glyphs are not kept, see render_cache.
+        """
+        loaded = {mtable.ttf_path: mtable for mtable in self.multi_table}
+        self.corresponding_table = corresponding_table
+        self.multi_table = []
+        self._set_multi_table(loaded)
+
+    def _set_multi_table(self, loaded: Optional[Dict[str, MultiTable]] = None) -> None:
+        """
+        loaded: tables of the fonts already loaded by their path, reused if the font file is unchanged
+        """
         cor_table = self.corresponding_table
         if cor_table is None:
             return
@@ -65,11 +141,20 @@ class FontImageMulti:
             mtable.ttf_path = filepath
             mtable.font_size = font_size if font_size > 0 else self.default_font_size
             mtable.char_ranges = char_ranges
-            mtable.ttfont = self._load_font(filepath)
-            if mtable.ttfont is None:
-                continue
-            mtable.available_chars = self._get_available_characters(mtable.ttfont)
-            mtable.selected_chars = self._set_char_sets(char_ranges)
+            previous = loaded.get(filepath) if loaded else None
+            if previous is not None and previous.font_stamp == _get_font_stamp(previous):
+                mtable.ttfont = previous.ttfont
+                mtable.font_stamp = previous.font_stamp
+                mtable.available_codepoints = previous.available_codepoints
+                mtable.glyph_names = previous.glyph_names
+            else:
+                mtable.ttfont = self._load_font(filepath)
+                if mtable.ttfont is None:
+                    continue
+                mtable.font_stamp = _get_font_stamp(mtable)
+                mtable.available_codepoints = self._get_available_codepoints(mtable.ttfont)
+                mtable.glyph_names = mtable.ttfont.getBestCmap() or {}
+            mtable.selected_codepoints = self._get_selected_codepoints(char_ranges)
 
             self.multi_table.append(mtable)
 
@@ -94,9 +179,11 @@ class FontImageMulti:
 
         return ttfont
 
-    def _get_available_characters(self, ttfont: TTFont) -> List[str]:
-        available_chars = set()
-        available_chars.update([chr(i) for i in range(256)])
+    def _get_available_codepoints(self, ttfont: TTFont) -> np.ndarray:
+        """
+        :return: sorted codepoints of the cmap and the 256 base characters
+        """
+        codepoints: List[Iterable[int]] = [range(256)]
 
         if not ttfont:
             raise AttributeError("Could not find cmap table")
@@ -105,72 +192,90 @@ class FontImageMulti:
             cmap_table = ttfont['cmap'].tables
             for table in cmap_table:
                 if table.format == 4:  # the mostly used format
-                    for codepoint in table.cmap.keys():
-                        if 0 <= codepoint <= self.max_glyphs:  # Unicode range
-                            available_chars.add(chr(codepoint))
+                    codepoints.append(table.cmap.keys())
         except:
             best_table = ttfont.getBestCmap()
             if best_table:
-                for codepoint in best_table.keys():
-                    if 0 <= codepoint <= self.max_glyphs:
-                        available_chars.add(chr(codepoint))
-
-        # need to be ordered, so return a list type
-        return sorted(list(available_chars))
+                codepoints.append(best_table.keys())
 
-    def _set_char_sets(self, char_ranges: List[Tuple[int, int]]) -> Set[int]:
-        selected_chars = set()
-        for r in char_ranges:
-            for i in range(r[0], r[-1] + 1):
-                # [r[0], r[-1]], including the right boundary value
-                selected_chars.add(i)
+        available = np.unique(np.concatenate([np.fromiter(keys, dtype=np.int64) for keys in codepoints]))
+        # Unicode range
+        return available[(available >= 0) & (available <= self.max_glyphs)]
 
-        return selected_chars
+    def _get_selected_codepoints(self, char_ranges: List[Tuple[int, int]]) -> np.ndarray:
+        """
+        :return: sorted codepoints of the ranges, [r[0], r[-1]] including the right boundary value
+        """
+        if not char_ranges:
+            return np.zeros(0, dtype=np.int64)
 
-    def is_character_supported(self, char: str, available_chars: List[str]) -> bool:
-        return char in available_chars
+        return np.unique(np.concatenate([np.arange(r[0], r[-1] + 1, dtype=np.int64) for r in char_ranges]))
 
-    def is_character_selected(self, char: str, selected_chars: Set[int]) -> bool:
-        unicode = ord(char[0])
-        return unicode in selected_chars
+    def subset_chars(self, codepoints: Iterable[int], always_include: Optional[List[Tuple[int, int]]] = None) -> None:
+        """
+        Only render the characters in codepoints (e.g. from RF_Corpus.collect_codepoints()) and in the
+        always_include ranges, the table ranges still decide which font renders a character.
+        The 256 reserved characters of the first font are always rendered.
+        """
+        subset = np.union1d(np.fromiter(codepoints, dtype=np.int64),
+                            self._get_selected_codepoints(always_include or []))
 
-    def render_glyphs(self, margin: int, developer_mode: bool) -> None:
+        for font_index, mtable in enumerate(self.multi_table):
+            before = len(self._get_render_codepoints(-1, mtable))
+            selected = mtable.selected_codepoints if len(mtable.selected_codepoints) else mtable.available_codepoints
+            # empty selected codepoints means every character, so keep a value no character matches
+            mtable.selected_codepoints = np.intersect1d(selected, subset, assume_unique=True)
+            if len(mtable.selected_codepoints) == 0:
+                mtable.selected_codepoints = np.array([-1], dtype=np.int64)
+            after = len(self._get_render_codepoints(-1, mtable))
+            print(f"Font {font_index} \"{os.path.basename(mtable.ttf_path)}\": {before} -> {after} selected characters")
+
+    def is_character_supported(self, char: str, available_codepoints: np.ndarray) -> bool:
+        return bool(_contains(available_codepoints, np.array([ord(char[0])]))[0])
+
+    def is_character_selected(self, char: str, selected_codepoints: np.ndarray) -> bool:
+        return bool(_contains(selected_codepoints, np.array([ord(char[0])]))[0])
+
+    def render_glyphs(self, margin: int, developer_mode: bool, deduplicate: bool = True,
+                        rasterizer: str = "draw") -> None:
         self.ttf_glyphs = []
-
-        # prevent multiple same codepoint font structure
-        # Note: if there are multiple same codepoint font structure, the latter will overwrite the former
-        ttf_glyphs_dict: Dict[int, TTFGlyph] = {}
+        # the boundary lines of developer mode are drawn on RGBA images
+        use_mask = rasterizer == "mask" and not developer_mode
+        font_glyphs: List[Dict[int, TTFGlyph]] = []
+        font_aliases: List[Dict[int, int]] = []
 
         n = 0
         for mtable in self.multi_table:
             ttf_basename = os.path.basename(mtable.ttf_path)
             font_size = mtable.font_size
-            available_chars = mtable.available_chars
-            selected_chars = mtable.selected_chars
+            aliases = self._get_glyph_aliases(n, mtable) if deduplicate else {}
+            render_codepoints = self._get_render_codepoints(n, mtable, aliases)
+            char_indexes = np.searchsorted(mtable.available_codepoints, render_codepoints).tolist()
+            ttf_glyphs_dict: Dict[int, TTFGlyph] = {}
 
             font_pil = ImageFont.truetype(mtable.ttf_path, font_size)
 
             missing_count = 0
-            num = len(available_chars)
+            num = len(render_codepoints)
             print(f"rendering glyphs from \"{ttf_basename}\"")
-            for i, char in enumerate(available_chars):
+            for i, codepoint in enumerate(render_codepoints.tolist()):
                 if i % 100 == 0:
                     print(f"\rProgress {i}/{num} ...", end='', flush=True)
                 elif i == num - 1:
                     print(f"\rProgress {num}/{num} ...", flush=True)
 
+                char = chr(codepoint)
                 try:
-                    is_reserved_char = ord(char) < 256 and n == 0   # reserve 256 base ascii characters
-                    if not is_reserved_char:
-                        if len(selected_chars) > 0 and not self.is_character_selected(char, selected_chars):
-                            continue
-                        if not self.is_character_supported(char, available_chars):
-                            missing_count += 1
-                            continue
-
-                    bbox = font_pil.getbbox(char)
+                    # reserve 256 base ascii characters
+                    is_reserved_char = codepoint < 256 and n == 0 and mtable.reserve_base_chars
+                    mask = None
+                    if use_mask:
+                        mask, bbox = _rasterize_mask(font_pil, char)
+                    else:
+                        bbox = font_pil.getbbox(char)
                     if not bbox:
                         if is_reserved_char:
+                            mask = None
                             bbox = font_pil.getbbox(' ')
                         else:
                             missing_count += 1
@@ -181,9 +286,9 @@ class FontImageMulti:
                         continue
 
                     ttf_glyph = TTFGlyph()
-                    ttf_glyph.char_index = i
+                    ttf_glyph.char_index = char_indexes[i]
                     ttf_glyph.char = char
-                    ttf_glyph.unicode = ord(char[0])
+                    ttf_glyph.unicode = codepoint
                     ttf_glyph.width = int(bbox[2] - bbox[0])
                     ttf_glyph.height = int(bbox[3] - bbox[1])
                     ttf_glyph.margin = margin
@@ -192,28 +297,31 @@ class FontImageMulti:
                     metrics = font_pil.getmetrics()
                     ttf_glyph.ascent, ttf_glyph.descent = metrics
 
-                    ttf_glyph.image = Image.new("RGBA", (ttf_glyph.width, ttf_glyph.height), (0, 0, 0, 0))
-                    draw = ImageDraw.Draw(ttf_glyph.image)
-
-                    x_offset = -bbox[0]
-                    y_offset = -bbox[1]
-
-                    draw.text((x_offset, y_offset), char, font=font_pil, fill=(255, 255, 255, 255))
-
-                    # draw the boundary line for debug
-                    if developer_mode:
-                        # texture range
-                        rect_x1 = 0
-                        rect_y1 = 0
-                        rect_x2 = ttf_glyph.width - 1
-                        rect_y2 = ttf_glyph.height - 1
-                        rect_x1, rect_x2 = min(rect_x1, rect_x2), max(rect_x1, rect_x2)
-                        rect_y1, rect_y2 = min(rect_y1, rect_y2), max(rect_y1, rect_y2)
-                        draw.rectangle(
-                            [rect_x1, rect_y1, rect_x2, rect_y2],
-                            outline=(255, 0, 0, 255),  # red
-                            width=1
-                        )
+                    if mask is not None:
+                        ttf_glyph.image = mask
+                    else:
+                        ttf_glyph.image = Image.new("RGBA", (ttf_glyph.width, ttf_glyph.height), (0, 0, 0, 0))
+                        draw = ImageDraw.Draw(ttf_glyph.image)
+
+                        x_offset = -bbox[0]
+                        y_offset = -bbox[1]
+
+                        draw.text((x_offset, y_offset), char, font=font_pil, fill=(255, 255, 255, 255))
+
+                        # draw the boundary line for debug
+                        if developer_mode:
+                            # texture range
+                            rect_x1 = 0
+                            rect_y1 = 0
+                            rect_x2 = ttf_glyph.width - 1
+                            rect_y2 = ttf_glyph.height - 1
+                            rect_x1, rect_x2 = min(rect_x1, rect_x2), max(rect_x1, rect_x2)
+                            rect_y1, rect_y2 = min(rect_y1, rect_y2), max(rect_y1, rect_y2)
+                            draw.rectangle(
+                                [rect_x1, rect_y1, rect_x2, rect_y2],
+                                outline=(255, 0, 0, 255),  # red
+                                width=1
+                            )
 
                     ttf_glyphs_dict[ttf_glyph.unicode] = ttf_glyph
 
@@ -225,114 +333,518 @@ class FontImageMulti:
             if missing_count > 0:
                 print(f"{missing_count} characters are not rendered, they may unsupported in \"{ttf_basename}\"")
 
+            font_glyphs.append(ttf_glyphs_dict)
+            font_aliases.append(aliases)
             n += 1
 
-        self.ttf_glyphs = list(ttf_glyphs_dict.values())
-        self.ttf_glyphs = sorted(self.ttf_glyphs, key=lambda g: g.unicode, reverse=False)
+        self._merge_font_glyphs(font_glyphs, font_aliases)
+        if deduplicate:
+            self._deduplicate_glyphs()
         print(f"Successfully rendered {len(self.ttf_glyphs)} characters!")
 
-    def render_glyphs_parallel(self, margin: int, developer_mode: bool, chars_per_chunk: int) -> None:
+    def _get_render_codepoints(self, font_index: int, mtable: MultiTable,
+                                aliases: Optional[Dict[int, int]] = None) -> np.ndarray:
+        """
+        sorted codepoints of the font which will be rendered, 256 base characters are reserved in the first font
+        aliases: also leave out these codepoints, they're copied from their first codepoint after rendering
+        """
+        available = mtable.available_codepoints
+        render = np.ones(len(available), dtype=bool)
+        if len(mtable.selected_codepoints) > 0:
+            render = _contains(mtable.selected_codepoints, available)
+            if font_index == 0 and mtable.reserve_base_chars:
+                render |= available < 256
+        if aliases:
+            render &= ~_contains(np.fromiter(sorted(aliases), dtype=np.int64, count=len(aliases)), available)
+
+        return available[render]
+
+    def _get_glyph_aliases(self, font_index: int, mtable: MultiTable) -> Dict[int, int]:
+        """
+        codepoints mapped to the same glyph id in the font are rendered only once
+        :return: alias codepoint -> the first codepoint with the same glyph id
+        """
+        aliases: Dict[int, int] = {}
+        first_codepoints: Dict[str, int] = {}
+        for codepoint in self._get_render_codepoints(font_index, mtable).tolist():
+            # line feed is a line break for the text layout, it's never drawn like the .notdef box
+            if codepoint == 0x0A:
+                continue
+
+            # unsupported reserved characters are drawn as .notdef box
+            glyph_name = mtable.glyph_names.get(codepoint, ".notdef")
+            if glyph_name in first_codepoints:
+                aliases[codepoint] = first_codepoints[glyph_name]
+            else:
+                first_codepoints[glyph_name] = codepoint
+
+        return aliases
+
+    def _merge_font_glyphs(self, font_glyphs: List[Dict[int, TTFGlyph]], font_aliases: List[Dict[int, int]]) -> None:
+        # prevent multiple same codepoint font structure
+        # Note: if there are multiple same codepoint font structure, the latter will overwrite the former
+        merged_glyphs_dict: Dict[int, TTFGlyph] = {}
+
+        for ttf_glyphs_dict, aliases in zip(font_glyphs, font_aliases):
+            merged_glyphs_dict.update(ttf_glyphs_dict)
+
+            for unicode, first_unicode in aliases.items():
+                first_glyph = ttf_glyphs_dict.get(first_unicode)
+                if first_glyph is None:
+                    continue
+
+                ttf_glyph = copy.copy(first_glyph)
+                ttf_glyph.char = chr(unicode)
+                ttf_glyph.unicode = unicode
+                merged_glyphs_dict[unicode] = ttf_glyph
+
+        self.ttf_glyphs = sorted(merged_glyphs_dict.values(), key=lambda g: g.unicode, reverse=False)
+
+    def _deduplicate_glyphs(self) -> None:
+        """
+        glyphs with identical bitmaps share one atlas region
+        """
+        first_glyphs: Dict[Tuple, TTFGlyph] = {}
+        image_keys: Dict[int, Tuple] = {}
+        duplicate_count = 0
+
+        for ttf_glyph in self.ttf_glyphs:
+            ttf_glyph.duplicate_of = None
+            if ttf_glyph.image is None:
+                continue
+
+            # aliases of the same glyph id share the image object, no need to hash it again
+            key = image_keys.get(id(ttf_glyph.image))
+            if key is None:
+                image = ttf_glyph.image
+                key = (image.mode, image.size, hashlib.blake2b(image.tobytes(), digest_size=16).digest())
+                image_keys[id(image)] = key
+
+            first_glyph = first_glyphs.get(key)
+            if first_glyph is None:
+                first_glyphs[key] = ttf_glyph
+            else:
+                ttf_glyph.duplicate_of = first_glyph
+                duplicate_count += 1
+
+        if duplicate_count > 0:
+            print(f"Found {duplicate_count} duplicate glyphs, they share the atlas region of the same bitmap")
+
+    def elide_empty_glyphs(self) -> None:
+        """
+        glyphs without any coverage (whitespace, control characters...) are not packed,
+        they keep their metrics but point to one shared transparent texel
+        """
+        self.blank_glyph = None
+        packed_glyphs = [ttf_glyph for ttf_glyph in self.ttf_glyphs if ttf_glyph.duplicate_of is None]
+
+        # zero-area images have no coverage, check the alpha channel of the others in one pass
+        empty_ids: Set[int] = set()
+        drawn_glyphs: List[TTFGlyph] = []
+        for ttf_glyph in packed_glyphs:
+            if ttf_glyph.image is None or ttf_glyph.width <= 0 or ttf_glyph.height <= 0:
+                empty_ids.add(id(ttf_glyph))
+            else:
+                drawn_glyphs.append(ttf_glyph)
+
+        if drawn_glyphs:
+            alpha_data = [_glyph_alpha(ttf_glyph.image).tobytes() for ttf_glyph in drawn_glyphs]
+            offsets = np.cumsum([0] + [len(data) for data in alpha_data[:-1]])
+            coverage = np.maximum.reduceat(np.frombuffer(b''.join(alpha_data), dtype=np.uint8), offsets)
+            for index in np.flatnonzero(coverage == 0):
+                empty_ids.add(id(drawn_glyphs[index]))
+
+        if not empty_ids:
+            return
+
+        self.blank_glyph = TTFGlyph()
+        self.blank_glyph.unicode = -1
+        self.blank_glyph.width = 1
+        self.blank_glyph.height = 1
+        self.blank_glyph.image = Image.new("RGBA", (1, 1), (0, 0, 0, 0))
+
+        empty_count = 0
+        for ttf_glyph in self.ttf_glyphs:
+            packed_glyph = ttf_glyph.duplicate_of or ttf_glyph
+            if id(packed_glyph) in empty_ids:
+                ttf_glyph.duplicate_of = self.blank_glyph
+                empty_count += 1
+
+        print(f"Found {empty_count} empty glyphs, they are not packed into the textures")
+
+    def select_render_backend(self, margin: int, developer_mode: bool, deduplicate: bool = True,
+                                rasterizer: str = "draw") -> str:
+        """
+        choose "serial", "thread" or "process" from the glyph count and the measured per-glyph cost
+        """
+        max_workers = min(available_cpu_count(), self.max_workers)
+        if max_workers <= 1 or not self.multi_table:
+            return "serial"
+
+        glyphs_count = 0
+        sample_font_index = 0
+        sample_codepoints = np.zeros(0, dtype=np.int64)
+        for font_index, mtable in enumerate(self.multi_table):
+            aliases = self._get_glyph_aliases(font_index, mtable) if deduplicate else {}
+            render_codepoints = self._get_render_codepoints(font_index, mtable, aliases)
+            glyphs_count += len(render_codepoints)
+            if len(render_codepoints) > len(sample_codepoints):
+                sample_font_index = font_index
+                sample_codepoints = render_codepoints
+
+        if glyphs_count == 0:
+            return "serial"
+
+        # measure a few glyphs spread over the largest font
+        step = max(1, len(sample_codepoints) // 32)
+        sample_codepoints = sample_codepoints[::step][:32]
+        mtable = self.multi_table[sample_font_index]
+        start = time.perf_counter()
+        FontImageMulti._render_glyphs_chunk(sample_font_index, mtable, mtable.font_size, margin, -1,
+                                            sample_codepoints, developer_mode, rasterizer)
+        per_glyph_cost = (time.perf_counter() - start) / len(sample_codepoints)
+
+        serial_time = glyphs_count * per_glyph_cost
+        thread_time = serial_time / min(RENDER_THREAD_SPEEDUP, max_workers)
+        process_time = serial_time / max_workers + RENDER_PROCESS_STARTUP_SECONDS
+
+        if serial_time < RENDER_SERIAL_SECONDS:
+            backend = "serial"
+        elif thread_time <= process_time:
+            backend = "thread"
+        else:
+            backend = "process"
+
+        print(f"Render backend: {backend} ({glyphs_count} glyphs, {per_glyph_cost * 1000:.3f} ms/glyph, "
+              f"estimated serial time {serial_time:.2f}s)")
+        return backend
+
+    def render_glyphs_parallel(self, margin: int, developer_mode: bool, chars_per_chunk: int = 0,
+                                deduplicate: bool = True, backend: str = "process",
+                                retries: int = 1, retry_serial: bool = True, presubset: bool = True,
+                                rasterizer: str = "draw") -> None:
+        """
+        chars_per_chunk: fixed chunk size, set 0 to split selected glyphs by their estimated rendering cost
+        backend: "process" or "thread"
+        retries: times a failed chunk is resubmitted to the pool, then it's rendered in this process if retry_serial
+        presubset: workers load a temporary subset of large fonts with only the glyphs they render
+        rasterizer: "draw" or "mask", see generate()
+        """
+        # only the selected glyphs are rendered, aliases are copied after rendering
+        font_aliases: List[Dict[int, int]] = []
+        font_render_codepoints: List[np.ndarray] = []
+        for font_index, mtable in enumerate(self.multi_table):
+            aliases = self._get_glyph_aliases(font_index, mtable) if deduplicate else {}
+            font_aliases.append(aliases)
+            font_render_codepoints.append(self._get_render_codepoints(font_index, mtable, aliases))
+
+        font_glyphs, total_missing = self._render_codepoints_parallel(font_render_codepoints, margin, developer_mode,
+                                                                        chars_per_chunk, backend, retries,
+                                                                        retry_serial, presubset, rasterizer)
+
+        # merged result, in the order of the corresponding table
+        self._merge_font_glyphs(font_glyphs, font_aliases)
+        if deduplicate:
+            self._deduplicate_glyphs()
+
+        print(f"\nSuccessfully rendered {len(self.ttf_glyphs)} unique characters!")
+        if total_missing > 0:
+            print(f"Total missing characters: {total_missing}")
+
+    def render_glyphs_cached(self, margin: int, developer_mode: bool, deduplicate: bool = True,
+                                backend: str = "auto", rasterizer: str = "draw") -> None:
+        """
+        Only render the glyphs missing from render_cache, so a build after a small change of the table
+        (a range, the size of one font...) only renders the new glyphs, see RF_Watch.
+        Glyphs are cached by font file and its modification time, size, margin, developer mode, rasterizer and
+        whether the font holds the reserved characters, the entries the table doesn't use anymore are dropped.
+        backend: "serial", "thread", "process", or "auto" to use the pool when there are enough glyphs to render
+        """
+        if self.render_cache is None:
+            self.render_cache = {}
+
+        font_keys: List[Tuple] = []
+        font_aliases: List[Dict[int, int]] = []
+        font_render_codepoints: List[np.ndarray] = []
+        font_missing_codepoints: List[np.ndarray] = []
+        for font_index, mtable in enumerate(self.multi_table):
+            key = (mtable.ttf_path, mtable.font_stamp, mtable.font_size, margin, developer_mode, rasterizer,
+                    font_index == 0 and mtable.reserve_base_chars)
+            cached = self.render_cache.get(key, {})
+            aliases = self._get_glyph_aliases(font_index, mtable) if deduplicate else {}
+            render_codepoints = self._get_render_codepoints(font_index, mtable, aliases)
+            cached_codepoints = np.fromiter(sorted(cached), dtype=np.int64, count=len(cached))
+
+            font_keys.append(key)
+            font_aliases.append(aliases)
+            font_render_codepoints.append(render_codepoints)
+            font_missing_codepoints.append(render_codepoints[~_contains(cached_codepoints, render_codepoints)])
+
+        render_count = sum(len(codepoints) for codepoints in font_missing_codepoints)
+        if backend == "auto":
+            backend = "process" if render_count > RENDER_MIN_CHUNK_GLYPHS * max(1, self.max_workers) else "serial"
+
+        total_missing = 0
+        if render_count > 0 and self.max_workers > 1 and backend in ("thread", "process"):
+            # the workers keep their fonts loaded between builds, a temporary subset would be loaded every time
+            rendered, total_missing = self._render_codepoints_parallel(font_missing_codepoints, margin,
+                                                                        developer_mode, 0, backend, 1, True,
+                                                                        False, rasterizer)
+        else:
+            rendered: List[Dict[int, TTFGlyph]] = []
+            for font_index, mtable in enumerate(self.multi_table):
+                missing_codepoints = font_missing_codepoints[font_index]
+                if len(missing_codepoints) == 0:
+                    rendered.append({})
+                    continue
+                _, _, ttf_glyphs_dict, missing_count = FontImageMulti._render_glyphs_chunk(
+                    font_index, mtable, mtable.font_size, margin, -1, missing_codepoints, developer_mode, rasterizer)
+                rendered.append(ttf_glyphs_dict)
+                total_missing += missing_count
+
+        render_cache: Dict[Tuple, Dict[int, Optional[TTFGlyph]]] = {}
+        font_glyphs: List[Dict[int, TTFGlyph]] = []
+        for font_index, key in enumerate(font_keys):
+            cached = render_cache.setdefault(key, self.render_cache.get(key, {}))
+            # characters without a glyph (empty bbox) are cached as None, they're not rendered again
+            cached.update(dict.fromkeys(font_missing_codepoints[font_index].tolist()))
+            cached.update(rendered[font_index])
+            render_codepoints = font_render_codepoints[font_index].tolist()
+            # copies, the build sets atlas positions and duplicates on its glyphs, the cache keeps no build state
+            font_glyphs.append({codepoint: copy.copy(cached[codepoint]) for codepoint in render_codepoints
+                                if cached[codepoint] is not None})
+        self.render_cache = render_cache
+
+        self._merge_font_glyphs(font_glyphs, font_aliases)
+        if deduplicate:
+            self._deduplicate_glyphs()
+
+        reused_count = sum(len(codepoints) for codepoints in font_render_codepoints) - render_count
+        print(f"Rendered {render_count} characters, reused {reused_count} cached characters")
+        if total_missing > 0:
+            print(f"Total missing characters: {total_missing}")
+
+    def _render_codepoints_parallel(self, font_render_codepoints: List[np.ndarray], margin: int,
+                                    developer_mode: bool, chars_per_chunk: int, backend: str, retries: int,
+                                    retry_serial: bool, presubset: bool,
+                                    rasterizer: str) -> Tuple[List[Dict[int, TTFGlyph]], int]:
+        """
+        render the codepoints of every font of the table in chunks on the pool, see render_glyphs_parallel()
+        :return: codepoint -> glyph of every font, count of characters not rendered
+        """
+        max_workers = self._get_pool().max_workers
+
+        total_cost = 0.0
+        for font_index, mtable in enumerate(self.multi_table):
+            total_cost += len(font_render_codepoints[font_index]) * self._estimate_glyph_cost(mtable.font_size)
+
+        target_chunk_cost = total_cost / max(1, max_workers * RENDER_CHUNKS_PER_WORKER)
+
+        render_tables = self.multi_table
+        subset_dir = ""
+        if presubset:
+            render_tables, subset_dir = self._presubset_fonts(font_render_codepoints, backend)
+
         all_tasks = []
+        tasks_cost: List[float] = []
+        font_chunks_count: List[int] = []
         for font_index, mtable in enumerate(self.multi_table):
-            available_chars = mtable.available_chars
+            render_codepoints = font_render_codepoints[font_index]
             ttf_basename = os.path.basename(mtable.ttf_path)
             font_size = mtable.font_size
+            glyph_cost = self._estimate_glyph_cost(font_size)
+
+            chunk_size = chars_per_chunk
+            if chunk_size <= 0:
+                chunk_size = max(RENDER_MIN_CHUNK_GLYPHS, int(target_chunk_cost / glyph_cost))
 
             chunks = []
-            for i in range(0, len(available_chars), chars_per_chunk):
-                chunk = available_chars[i:i + chars_per_chunk]
+            for i in range(0, len(render_codepoints), chunk_size):
+                chunk = render_codepoints[i:i + chunk_size]
                 chunks.append(chunk)
 
-            print(f"Font {font_index} \"{ttf_basename}\" size {font_size}: {len(available_chars)} chars -> {len(chunks)} chunks")
+            font_chunks_count.append(len(chunks))
+            print(f"Font {font_index} \"{ttf_basename}\" size {font_size}: {len(render_codepoints)} chars -> {len(chunks)} chunks")
 
-            for chunk_index, char_chunk in enumerate(chunks):
+            for chunk_index, codepoint_chunk in enumerate(chunks):
                 all_tasks.append(
                     (
                         font_index,
-                        mtable,
+                        render_tables[font_index],
                         font_size,
                         margin,
                         chunk_index,
-                        char_chunk,
-                        developer_mode
+                        codepoint_chunk,
+                        developer_mode,
+                        rasterizer
                     )
                 )
-        max_workers = min(min(os.cpu_count(), self.max_workers), len(all_tasks))
-        print(f"Total tasks: {len(all_tasks)} (from {len(self.multi_table)} fonts)")
+                tasks_cost.append(len(codepoint_chunk) * glyph_cost)
 
-        merged_glyphs_dict: Dict[int, TTFGlyph] = {}
+        # largest first, idle workers take the next task from the shared queue of the executor,
+        # so the expensive chunks don't become stragglers at the end
+        tasks_order = sorted(range(len(all_tasks)), key=lambda index: tasks_cost[index], reverse=True)
+        print(f"Total tasks: {len(all_tasks)} (from {len(self.multi_table)} fonts), "
+              f"{min(self._get_pool().max_workers, len(all_tasks))} workers")
+
+        font_glyphs: List[Dict[int, TTFGlyph]] = [{} for _ in self.multi_table]
         total_missing = 0
 
-        with ProcessPoolExecutor(max_workers=max_workers) as executor:
-            planned_tasks = {}
-            for task_index, task in enumerate(all_tasks):
-                planned_tasks[executor.submit(FontImageMulti._render_glyphs_chunk, *task)] = task_index
+        completed = 0
+        total = len(all_tasks)
 
-            completed = 0
-            total = len(all_tasks)
+        # progress
+        font_progress = {}
+        for i in range(len(self.multi_table)):
+            font_progress[i] = {'completed': 0, 'total': 0}
 
-            # progress
-            font_progress = {}
-            for i in range(len(self.multi_table)):
-                font_progress[i] = {'completed': 0, 'total': 0}
+        for font_index, chunks_count in enumerate(font_chunks_count):
+            font_progress[font_index]['total'] = chunks_count
 
-            for font_index, mtable in enumerate(self.multi_table):
-                available_chars = mtable.available_chars
-                chunks_count = (len(available_chars) + chars_per_chunk - 1) // chars_per_chunk
-                font_progress[font_index]['total'] = chunks_count
+        # failed chunks are retried on their own, completed chunks are kept
+        ordered_tasks = [all_tasks[task_index] for task_index in tasks_order]
+        try:
+            for task_index, result, error in self._get_pool().run_tasks(FontImageMulti._render_glyphs_chunk,
+                                                                        ordered_tasks, backend=backend,
+                                                                        retries=retries, retry_serial=retry_serial):
+                completed += 1
+                if error is not None:
+                    task = ordered_tasks[task_index]
+                    font_index, chunk_index, codepoint_chunk = task[0], task[4], task[5]
+                    print(f"[Error] font {font_index} chunk {chunk_index} failed: {error}, "
+                          f"{len(codepoint_chunk)} characters are not rendered")
+                    total_missing += len(codepoint_chunk)
+                    font_progress[font_index]['completed'] += 1
+                    continue
 
-            for planned_task in as_completed(planned_tasks):
-                task_index = planned_tasks[planned_task]
-                try:
-                    font_index, chunk_index, chunk_ttf_glyphs_dict, missing_count = planned_task.result()
-                    completed += 1
+                font_index, chunk_index, chunk_ttf_glyphs_dict, missing_count = result
+                font_glyphs[font_index].update(chunk_ttf_glyphs_dict)
 
-                    for unicode, glyph in chunk_ttf_glyphs_dict.items():
-                        merged_glyphs_dict[unicode] = glyph
+                total_missing += missing_count
 
-                    total_missing += missing_count
+                font_progress[font_index]['completed'] += 1
+                if completed % 10 == 0 or completed == total:
+                    progress_str = " | ".join([
+                        f"Font {i}: {progress['completed']}/{progress['total']}"
+                        for i, progress in font_progress.items()
+                        if progress['total'] > 0
+                    ])
+                    print(f"Progress: [{completed}/{total}] {progress_str}")
+        finally:
+            # retried chunks are done too, nothing loads the subset fonts anymore
+            if subset_dir:
+                shutil.rmtree(subset_dir, ignore_errors=True)
 
+        return font_glyphs, total_missing
 
-                    font_progress[font_index]['completed'] += 1
-                    if completed % 10 == 0 or completed == total:
-                        progress_str = " | ".join([
-                            f"Font {i}: {progress['completed']}/{progress['total']}"
-                            for i, progress in font_progress.items()
-                            if progress['total'] > 0
-                        ])
-                        print(f"Progress: [{completed}/{total}] {progress_str}")
+    def _presubset_fonts(self, font_render_codepoints: List[np.ndarray],
+                            backend: str) -> Tuple[List[MultiTable], str]:
+        """
+        Write a subset of every large font with only the glyphs its workers render, so each worker reads and
+        loads a small face instead of the whole file (or collection). Fonts are subset by the pool in parallel.
+        :return: tables for the render tasks, temporary directory of the subset fonts ("" if nothing was subset)
+        """
+        render_tables: List[MultiTable] = list(self.multi_table)
+        tasks: List[Tuple[str, List[int], str]] = []
+        task_fonts: List[int] = []
+        subset_dir = ""
 
-                except Exception as e:
-                    print(f"Error in task {task_index}: {e}")
+        for font_index, mtable in enumerate(self.multi_table):
+            font_path = _get_font_file_path(mtable)
+            render_count = len(font_render_codepoints[font_index])
+            if render_count == 0 or not os.path.exists(font_path) or \
+                    os.path.getsize(font_path) < PRESUBSET_MIN_FILE_SIZE or \
+                    render_count > len(mtable.available_codepoints) * PRESUBSET_MAX_GLYPHS_RATIO:
+                continue
 
-        # merged result
-        self.ttf_glyphs = list(merged_glyphs_dict.values())
-        self.ttf_glyphs = sorted(self.ttf_glyphs, key=lambda g: g.unicode, reverse=False)
+            if not subset_dir:
+                subset_dir = tempfile.mkdtemp(prefix="rtcw_font_subset_")
+            font_name = os.path.splitext(os.path.basename(font_path))[0]
+            subset_path = os.path.join(subset_dir, f"{font_index}_{font_name}.ttf")
+            unicodes = font_render_codepoints[font_index].tolist()
+            tasks.append((font_path, unicodes, subset_path))
+            task_fonts.append(font_index)
+
+        if not tasks:
+            return render_tables, subset_dir
+
+        start = time.perf_counter()
+        for task_index, result, error in self._get_pool().run_tasks(FontImageMulti._subset_font, tasks,
+                                                                    backend=backend, retries=0):
+            font_index = task_fonts[task_index]
+            if error is not None:
+                print(f"[Warning] failed to subset font {font_index}: {error}, workers load the whole font")
+                continue
 
-        print(f"\nSuccessfully rendered {len(self.ttf_glyphs)} unique characters!")
-        if total_missing > 0:
-            print(f"Total missing characters: {total_missing}")
+            font_size, subset_size = result
+            # the subset is loaded by path, don't send the parsed font to every worker
+            render_table = copy.copy(self.multi_table[font_index])
+            render_table.ttfont = None
+            render_table.render_path = tasks[task_index][2]
+            render_tables[font_index] = render_table
+            print(f"Font {font_index} \"{os.path.basename(render_table.ttf_path)}\" subset for workers: "
+                  f"{font_size / 1024:.0f} KB -> {subset_size / 1024:.0f} KB")
+
+        print(f"Subset {len(tasks)} fonts in {time.perf_counter() - start:.2f}s")
+        return render_tables, subset_dir
+
+    @staticmethod
+    def _subset_font(font_path: str, unicodes: List[int], subset_path: str) -> Tuple[int, int]:
+        """
+        :return: size of the font file and of the subset file
+        """
+        # keep the head and maxp values of the whole font, recalculating them clears the "left sidebearing at x=0"
+        # flag of the head table and FreeType hints some glyphs differently then
+        ttfont = TTFont(font_path, fontNumber=0, recalcBBoxes=False)
+        options = subset.Options()
+        # keep everything that may change the rasterized result, hinting and the .notdef outline
+        options.hinting = True
+        options.notdef_outline = True
+        options.layout_features = ['*']
+        options.name_IDs = ['*']
+        options.glyph_names = True
+        options.drop_tables += ['FFTM']     # FontForge timestamps
+        subsetter = subset.Subsetter(options=options)
+        subsetter.populate(unicodes=unicodes)
+        subsetter.subset(ttfont)
+        ttfont.save(subset_path)
+        ttfont.close()
+
+        return os.path.getsize(font_path), os.path.getsize(subset_path)
+
+    @staticmethod
+    def _estimate_glyph_cost(font_size: int) -> float:
+        # fixed per glyph overhead plus the rasterized area
+        return 1.0 + (font_size / 24) ** 2
 
     @staticmethod
     def _render_glyphs_chunk(font_index: int, mtable: MultiTable, font_size: int, margin: int,
-                                chunk_index: int, char_chunk: List[str], developer_mode: bool) -> Tuple:
-        font_pil = ImageFont.truetype(mtable.ttf_path, font_size)
+                                chunk_index: int, codepoint_chunk: np.ndarray, developer_mode: bool,
+                                rasterizer: str = "draw") -> Tuple:
+        """
+        codepoint_chunk: codepoints to render, already selected by _get_render_codepoints()
+        """
+        if mtable.render_path:
+            font_pil = load_font(mtable.render_path, font_size, in_memory=True)
+        else:
+            font_pil = load_font(mtable.ttf_path, font_size)
         ttf_glyphs_dict: Dict[int, TTFGlyph] = {}
         missing_count = 0
+        # the boundary lines of developer mode are drawn on RGBA images
+        use_mask = rasterizer == "mask" and not developer_mode
 
-        for char in char_chunk:
+        for codepoint in codepoint_chunk.tolist():
+            char = chr(codepoint)
             try:
-                is_reserved_char = ord(char) < 256 and font_index == 0
-
-                if not is_reserved_char:
-                    if len(mtable.selected_chars) > 0 and ord(char) not in mtable.selected_chars:
-                        continue
-                    if char not in mtable.available_chars:
-                        continue
-
-                bbox = font_pil.getbbox(char)
+                is_reserved_char = codepoint < 256 and font_index == 0 and mtable.reserve_base_chars
+                mask = None
+                if use_mask:
+                    mask, bbox = _rasterize_mask(font_pil, char)
+                else:
+                    bbox = font_pil.getbbox(char)
                 if not bbox:
                     if is_reserved_char:
+                        mask = None
                         bbox = font_pil.getbbox(' ')
                     else:
                         missing_count += 1
@@ -346,7 +858,7 @@ class FontImageMulti:
 
                 ttf_glyph = TTFGlyph()
                 ttf_glyph.char = char
-                ttf_glyph.unicode = ord(char)
+                ttf_glyph.unicode = codepoint
                 ttf_glyph.width = bbox_width
                 ttf_glyph.height = bbox_height
                 ttf_glyph.margin = margin
@@ -355,27 +867,30 @@ class FontImageMulti:
                 metrics = font_pil.getmetrics()
                 ttf_glyph.ascent, ttf_glyph.descent = metrics
 
-                ttf_glyph.image = Image.new("RGBA", (ttf_glyph.width, ttf_glyph.height), (0, 0, 0, 0))
-                draw = ImageDraw.Draw(ttf_glyph.image)
-
-                x_offset = -bbox[0]
-                y_offset = -bbox[1]
-                draw.text((x_offset, y_offset), char, font=font_pil, fill=(255, 255, 255, 255))
-
-                # draw the boundary line for debug
-                if developer_mode:
-                    # texture range
-                    rect_x1 = 0
-                    rect_y1 = 0
-                    rect_x2 = ttf_glyph.width - 1
-                    rect_y2 = ttf_glyph.height - 1
-                    rect_x1, rect_x2 = min(rect_x1, rect_x2), max(rect_x1, rect_x2)
-                    rect_y1, rect_y2 = min(rect_y1, rect_y2), max(rect_y1, rect_y2)
-                    draw.rectangle(
-                        [rect_x1, rect_y1, rect_x2, rect_y2],
-                        outline=(255, 0, 0, 255),  # red
-                        width=1
-                    )
+                if mask is not None:
+                    ttf_glyph.image = mask
+                else:
+                    ttf_glyph.image = Image.new("RGBA", (ttf_glyph.width, ttf_glyph.height), (0, 0, 0, 0))
+                    draw = ImageDraw.Draw(ttf_glyph.image)
+
+                    x_offset = -bbox[0]
+                    y_offset = -bbox[1]
+                    draw.text((x_offset, y_offset), char, font=font_pil, fill=(255, 255, 255, 255))
+
+                    # draw the boundary line for debug
+                    if developer_mode:
+                        # texture range
+                        rect_x1 = 0
+                        rect_y1 = 0
+                        rect_x2 = ttf_glyph.width - 1
+                        rect_y2 = ttf_glyph.height - 1
+                        rect_x1, rect_x2 = min(rect_x1, rect_x2), max(rect_x1, rect_x2)
+                        rect_y1, rect_y2 = min(rect_y1, rect_y2), max(rect_y1, rect_y2)
+                        draw.rectangle(
+                            [rect_x1, rect_y1, rect_x2, rect_y2],
+                            outline=(255, 0, 0, 255),  # red
+                            width=1
+                        )
 
                 ttf_glyphs_dict[ttf_glyph.unicode] = ttf_glyph
 
@@ -386,7 +901,12 @@ class FontImageMulti:
         return font_index, chunk_index, ttf_glyphs_dict, missing_count
 
     def pack_textures(self, texture_width: int, texture_height: int,
-                        char_spacing: int, texture_margin: int) -> None:
+                        char_spacing: int, texture_margin: int, trim_last_page: bool = False,
+                        on_page_packed: Optional[Callable[[Texture], None]] = None) -> None:
+        """
+        trim_last_page: shrink the height of the last page to the smallest power of two holding its glyphs
+        on_page_packed: called with each page as soon as it's full, e.g. to save it in the background
+        """
         self.textures = []
 
         current_x = texture_margin
@@ -401,7 +921,7 @@ class FontImageMulti:
 
         # Sort by height, but this will disrupt the order of the characters
         # ttf_glyphs = sorted(self.ttf_glyphs, key=lambda g: g.height, reverse=True)
-        ttf_glyphs = self.ttf_glyphs
+        ttf_glyphs = self._get_packed_glyphs()
 
         for i, ttf_glyph in enumerate(ttf_glyphs):
             # if need autowrap
@@ -413,6 +933,8 @@ class FontImageMulti:
             # if need to create a new texture file
             if current_y + ttf_glyph.height > texture_height - texture_margin:
                 self.textures.append(current_texture)
+                if on_page_packed is not None:
+                    on_page_packed(current_texture)
                 texture_index += 1
                 current_texture = Texture()
                 current_texture.texture_index = texture_index
@@ -436,118 +958,373 @@ class FontImageMulti:
 
         # the last one
         if current_texture.ttf_glyphs:
+            if trim_last_page:
+                bottom = max(ttf_glyph.y + ttf_glyph.height for ttf_glyph in current_texture.ttf_glyphs)
+                current_texture.height = min(texture_height, _next_power_of_two(bottom + texture_margin))
             self.textures.append(current_texture)
+            if on_page_packed is not None:
+                on_page_packed(current_texture)
 
         print(f"Created {len(self.textures)} texture pages")
 
-    def generate_glyphs_data(self, texture_name_base: str, texture_format: str) -> None:
-        for texture in self.textures:
-            for ttf_glyph in texture.ttf_glyphs:
-                glyph = Glyph()
-                glyph.unicode = ord(ttf_glyph.char)
+    def _get_packed_glyphs(self, by_frequency: bool = True) -> List[TTFGlyph]:
+        # duplicate glyphs are not packed, they point to the region of the same bitmap
+        ttf_glyphs = [ttf_glyph for ttf_glyph in self.ttf_glyphs if ttf_glyph.duplicate_of is None]
+
+        if by_frequency and self.glyph_frequency:
+            # a region is as hot as all glyphs drawn from it, cold glyphs keep the unicode order
+            uses: Dict[int, int] = {}
+            for ttf_glyph in self.ttf_glyphs:
+                packed_glyph = ttf_glyph.duplicate_of or ttf_glyph
+                uses[id(packed_glyph)] = uses.get(id(packed_glyph), 0) + self.glyph_frequency.get(ttf_glyph.unicode, 0)
+            ttf_glyphs.sort(key=lambda ttf_glyph: -uses.get(id(ttf_glyph), 0))
+
+        if self.blank_glyph is not None:
+            ttf_glyphs.insert(0, self.blank_glyph)
+
+        return ttf_glyphs
+
+    def set_usage_frequency(self, frequency: Optional[Dict[int, int]] = None,
+                            corpus: Optional[List[str]] = None) -> None:
+        """
+        Pack the most used glyphs first, so common strings are drawn from one or few pages and the engine
+        switches shaders less often while drawing text.
+        frequency: codepoint -> uses, counted from the corpus if not specified
+        corpus: strings drawn by the game (see RF_Corpus.read_corpus()), the page switches per string
+            before and after are reported after packing
+        """
+        self.usage_corpus = list(corpus) if corpus else []
+        if frequency is None:
+            frequency = count_frequency(self.usage_corpus)
+        self.glyph_frequency = dict(frequency)
+
+    def report_page_switches(self, texture_width: int, texture_height: int, char_spacing: int,
+                                texture_margin: int) -> Tuple[float, float]:
+        """
+        compare the page switches per corpus string of the packed pages with a unicode ordered layout
+        :return: mean page switches per string before and after
+        """
+        # pages of the unicode ordered layout, from the same row packing on glyph sizes only
+        unicode_ordered = self._get_packed_glyphs(by_frequency=False)
+        unicode_pages: List[int] = []
+        self._simulate_pack([(ttf_glyph.width, ttf_glyph.height) for ttf_glyph in unicode_ordered],
+                            texture_width, texture_height, char_spacing, texture_margin, glyph_pages=unicode_pages)
+        region_pages = {id(ttf_glyph): page for ttf_glyph, page in zip(unicode_ordered, unicode_pages)}
+
+        pages_before: Dict[int, int] = {}
+        pages_after: Dict[int, int] = {}
+        for ttf_glyph in self.ttf_glyphs:
+            packed_glyph = ttf_glyph.duplicate_of or ttf_glyph
+            pages_before[ttf_glyph.unicode] = region_pages[id(packed_glyph)]
+            pages_after[ttf_glyph.unicode] = packed_glyph.texture_index
+
+        switches_before, distinct_before = count_page_switches(self.usage_corpus, pages_before)
+        switches_after, distinct_after = count_page_switches(self.usage_corpus, pages_after)
+        print(f"Page switches per corpus string ({len(self.usage_corpus)} strings): "
+              f"{switches_before:.3f} -> {switches_after:.3f}, "
+              f"distinct pages per string: {distinct_before:.3f} -> {distinct_after:.3f}")
+
+        return switches_before, switches_after
+
+    @staticmethod
+    def _simulate_pack(glyph_sizes: List[Tuple[int, int]], texture_width: int, texture_height: int,
+                        char_spacing: int, texture_margin: int,
+                        glyph_pages: Optional[List[int]] = None) -> Tuple[int, int]:
+        """
+        run the same row layout as pack_textures() on glyph sizes only
+        glyph_pages: if specified, the page index of every glyph is appended to it
+        :return: pages count and bottom of the last page, (-1, 0) if any glyph doesn't fit in a page
+        """
+        right = texture_width - texture_margin
+        bottom = texture_height - texture_margin
+        current_x = texture_margin
+        current_y = texture_margin
+        max_row_height = 0
+        pages = 1
+
+        for width, height in glyph_sizes:
+            if width > right - texture_margin or height > bottom - texture_margin:
+                return -1, 0
+
+            if current_x + width > right:
+                current_x = texture_margin
+                current_y += max_row_height + char_spacing
+                max_row_height = 0
+
+            if current_y + height > bottom:
+                pages += 1
+                current_x = texture_margin
+                current_y = texture_margin
+                max_row_height = 0
+
+            current_x += width + char_spacing
+            if height > max_row_height:
+                max_row_height = height
+            if glyph_pages is not None:
+                glyph_pages.append(pages - 1)
+
+        return pages, current_y + max_row_height
+
+    def optimize_texture_size(self, max_texture_size: int, char_spacing: int, texture_margin: int,
+                                min_texture_size: int = 64, texture_mode: str = "rgba") -> Tuple[int, int]:
+        """
+        Simulate packing with power-of-two square and non-square sizes up to max_texture_size,
+        choose the one with the fewest pages, then the least wasted texels.
+        Last page is trimmed like pack_textures(trim_last_page=True).
+        texture_mode: pixel format of the pages, for the reported VRAM, see generate()
+        :return: texture width, texture height
+        """
+        glyph_sizes = [(ttf_glyph.width, ttf_glyph.height) for ttf_glyph in self._get_packed_glyphs()]
+        glyphs_area = sum(width * height for width, height in glyph_sizes)
+
+        candidate_sizes: List[int] = []
+        size = _next_power_of_two(min_texture_size)
+        while size <= max_texture_size:
+            candidate_sizes.append(size)
+            size *= 2
+
+        best: Optional[Tuple[int, ...]] = None    # pages, texels, |w - h|, width, height, last page height
+        for texture_width in candidate_sizes:
+            for texture_height in candidate_sizes:
+                page_texels = texture_width * texture_height
+                # can't beat the best one even if glyphs are packed without any gap
+                min_pages = max(1, -(-glyphs_area // page_texels))
+                if best is not None and min_pages > best[0]:
+                    continue
+
+                pages, last_bottom = self._simulate_pack(glyph_sizes, texture_width, texture_height,
+                                                            char_spacing, texture_margin)
+                if pages < 0:
+                    continue
+
+                last_height = min(texture_height, _next_power_of_two(last_bottom + texture_margin))
+                texels = (pages - 1) * page_texels + texture_width * last_height
+                candidate = (pages, texels, abs(texture_width - texture_height), texture_width, texture_height,
+                                last_height)
+                if best is None or candidate < best:
+                    best = candidate
+
+        if best is None:
+            raise ValueError(f"[Error] some glyphs are larger than the maximum texture size {max_texture_size}")
+
+        pages, texels, _, texture_width, texture_height, last_height = best
+        print(f"Optimized texture size: {texture_width}x{texture_height}, {pages} pages "
+              f"(last page {texture_width}x{last_height}), {texels - glyphs_area} wasted texels, "
+              f"VRAM {texels * TEXTURE_MODE_BYTES[texture_mode] / (1024 * 1024):.2f} MB "
+              f"({texture_mode}, {TEXTURE_MODE_BYTES[texture_mode]} B/texel)")
 
+        return texture_width, texture_height
+
+    def generate_glyphs_data(self, texture_name_base: str, texture_format: str) -> None:
+        for ttf_glyph in self.ttf_glyphs:
+            # duplicate glyphs keep their own metrics, but use the atlas region of the same bitmap
+            packed_glyph = ttf_glyph.duplicate_of or ttf_glyph
+            texture = self.textures[packed_glyph.texture_index]
+
+            glyph = Glyph()
+            glyph.unicode = ord(ttf_glyph.char)
+
+            if ttf_glyph.source_glyph is not None:
+                # imported glyphs keep their metrics, only the atlas region changes
+                source_glyph = ttf_glyph.source_glyph
+                glyph.height = source_glyph.height
+                glyph.top = source_glyph.top
+                glyph.bottom = source_glyph.bottom
+                glyph.pitch = source_glyph.pitch
+                glyph.xSkip = source_glyph.xSkip
+                glyph.imageWidth = source_glyph.imageWidth
+                glyph.imageHeight = source_glyph.imageHeight
+            else:
                 glyph.height = ttf_glyph.height
                 glyph.top = int(ttf_glyph.ascent + ttf_glyph.margin - ttf_glyph.bbox[1])
                 glyph.bottom = glyph.top - ttf_glyph.height
                 # glyph.pitch = ttf_glyph.width
                 # glyph.xSkip = ttf_glyph.width - ttf_glyph.margin * 2 + 2
                 glyph.pitch = ttf_glyph.width + ttf_glyph.margin
-                glyph.xSkip = ttf_glyph.width
+                glyph.xSkip = ttf_glyph.width - ttf_glyph.padding * 2
                 glyph.imageWidth = ttf_glyph.width
                 glyph.imageHeight = ttf_glyph.height
 
-                glyph.s = ttf_glyph.x / texture.width
-                glyph.t = ttf_glyph.y / texture.height
-                glyph.s2 = (ttf_glyph.x + ttf_glyph.width) / texture.width
-                glyph.t2 = (ttf_glyph.y + ttf_glyph.height) / texture.height
+            glyph.s = packed_glyph.x / texture.width
+            glyph.t = packed_glyph.y / texture.height
+            glyph.s2 = (packed_glyph.x + packed_glyph.width) / texture.width
+            glyph.t2 = (packed_glyph.y + packed_glyph.height) / texture.height
 
-                glyph.glyph = 0
-                glyph.shaderName = f"fonts/{texture_name_base}_{texture.texture_index:d}.{texture_format}"
+            glyph.glyph = 0
+            glyph.shaderName = f"fonts/{texture_name_base}_{texture.texture_index:d}.{texture_format}"
 
-                self.glyphs.append(glyph)
+            self.glyphs.append(glyph)
 
-    def save_textures(self, texture_name_base: str, texture_format: str) -> None:
+    def save_textures(self, texture_name_base: str, texture_format: str, texture_mode: str = "rgba",
+                        manifest: Optional[BuildManifest] = None) -> None:
         """
         texture_format: "tga", "png"
+        texture_mode: "rgba", "alpha" or "la", see generate()
+        manifest: record the pages, pages with the same content as the last build are not read again,
+            pages with the same glyphs at the same places are not encoded again
         """
         format: str = texture_format.lower()
 
         for texture in self.textures:
-            atlas = Image.new("RGBA", (texture.width, texture.height), (0, 0, 0, 0))
-
-            for ttf_glyph in texture.ttf_glyphs:
-                if ttf_glyph.image:
-                    atlas.paste(ttf_glyph.image, (ttf_glyph.x, ttf_glyph.y))
-
-            texture_name = f"{texture_name_base}_{texture.texture_index:d}"
-            if format == "tga":
-                tga_path = os.path.join(self.output_dir, f"{texture_name}.tga")
-                self._save_tga_for_rtcw(atlas, tga_path)
-            elif format == "png":
-                tga_path = os.path.join(self.output_dir, f"{texture_name}.png")
-                self._save_png_for_rtcw(atlas, tga_path)
-
-            print(f"Saved texture: {texture_name}.{format} ({texture.width}x{texture.height})")
-
-    def save_textures_parallel(self, texture_name_base: str, texture_format: str) -> None:
+            filepath = os.path.join(self.output_dir, f"{texture_name_base}_{texture.texture_index:d}.{format}")
+            expected = manifest.expected(filepath) if manifest else None
+            texture_index, texture_name, width, height, written, entry = FontImageMulti._save_single_texture(
+                texture, texture.texture_index, self.output_dir, texture_name_base, format, texture_mode, expected)
+            if manifest:
+                manifest.record(filepath, written, entry)
+
+            if written:
+                print(f"Saved texture: {texture_name}.{format} ({width}x{height})")
+            else:
+                print(f"Texture unchanged: {texture_name}.{format} ({width}x{height})")
+
+    def save_textures_parallel(self, texture_name_base: str, texture_format: str,
+                                texture_mode: str = "rgba", manifest: Optional[BuildManifest] = None) -> None:
         format: str = texture_format.lower()
         tasks = []
         for i, texture in enumerate(self.textures):
+            filepath = os.path.join(self.output_dir, f"{texture_name_base}_{i:d}.{format}")
             tasks.append(
                 (
                     texture,
                     i,
                     self.output_dir,
                     texture_name_base,
-                    format
+                    format,
+                    texture_mode,
+                    manifest.expected(filepath) if manifest else None
                 )
             )
-        max_workers = min(min(os.cpu_count(), self.max_workers), len(tasks))
-
         print(f"Starting parallel processing of {len(tasks)} textures...")
-        with ProcessPoolExecutor(max_workers=max_workers) as executor:
-            planned_tasks_dict = {}
-            for task in tasks:
-                planned_tasks_dict[executor.submit(FontImageMulti._save_single_texture, *task)] = task
+        completed = 0
+        failed = 0
+        total = len(tasks)
+
+        # a failed page is retried on its own, saved pages are not encoded again
+        for task_index, result, error in self._get_pool().run_tasks(FontImageMulti._save_single_texture, tasks,
+                                                                    backend="process"):
+            if error is not None:
+                failed += 1
+                print(f"[Error] Couldn't save texture {tasks[task_index][1]}: {error}")
+                continue
+
+            texture_index, texture_name, width, height, written, entry = result
+            completed += 1
+            if manifest:
+                manifest.record(os.path.join(self.output_dir, f"{texture_name}.{format}"), written, entry)
+            state = "Saved texture" if written else "Texture unchanged"
+            print(f"{state} ({completed}/{total}): {texture_name}.{format} ({width}x{height})")
 
-            completed = 0
-            total = len(tasks)
+        if failed > 0:
+            raise RuntimeError(f"[Error] {failed} of {total} textures couldn't be saved")
+        print(f"All {len(tasks)} textures saved successfully.")
 
-            for plan_task in as_completed(planned_tasks_dict):
+    def save_texture_async(self, writer: AsyncWriter, texture: Texture, texture_name_base: str,
+                            texture_format: str, texture_mode: str = "rgba") -> None:
+        """
+        compose, encode and write the texture page in the background writer
+        """
+        format: str = texture_format.lower()
+        texture_name = f"{texture_name_base}_{texture.texture_index:d}"
+        filepath = os.path.join(self.output_dir, f"{texture_name}.{format}")
+        # an unchanged page of the last build is kept without encoding it
+        source = _get_texture_source(texture, format, texture_mode)
+
+        if self.max_workers > 1:
+            # encode in the worker processes, the writer thread waits for the result and writes it,
+            # the executor is created here in the main thread, not by several writer threads at once
+            executor = self._get_pool().get_executor("process")
+
+            def encode() -> bytes:
                 try:
-                    texture_index, texture_name, width, height = plan_task.result()
-                    completed += 1
-                    print(f"Saved texture ({completed}/{total}): {texture_name}.{format} ({width}x{height})")
+                    return executor.submit(FontImageMulti._encode_texture, texture, format, texture_mode).result()
                 except Exception as e:
-                    task = planned_tasks_dict[plan_task]
-                    texture_index = task[1]
-                    print(f"[Error] Couldn't save texture {texture_index}: {e}")
+                    print(f"[Warning] failed to encode texture {texture.texture_index} in the pool: {e}, retry...")
+                    return FontImageMulti._encode_texture(texture, format, texture_mode)
 
-        print(f"All {len(tasks)} textures saved successfully.")
+            writer.submit(filepath, encode, source)
+        else:
+            writer.submit(filepath, lambda: FontImageMulti._encode_texture(texture, format, texture_mode), source)
 
     @staticmethod
-    def _save_single_texture(texture, texture_index, output_dir, texture_name_base, format):
-        atlas = Image.new("RGBA", (texture.width, texture.height), (0, 0, 0, 0))
+    def _save_single_texture(texture, texture_index, output_dir, texture_name_base, format, texture_mode="rgba",
+                                expected=None):
+        # each texture filename
+        texture_name = f"{texture_name_base}_{texture_index:d}"
+        filepath = os.path.join(output_dir, f"{texture_name}.{format}")
+        source = _get_texture_source(texture, format, texture_mode)
+        if matches_source(filepath, expected, source):
+            # same glyphs at the same places as the last build, the page is not encoded again
+            return texture_index, texture_name, texture.width, texture.height, False, expected
+
+        written, entry = write_if_changed(filepath, FontImageMulti._encode_texture(texture, format, texture_mode),
+                                            expected, source)
 
+        return texture_index, texture_name, texture.width, texture.height, written, entry
+
+    @staticmethod
+    def _compose_texture(texture: Texture, texture_mode: str = "rgba") -> Image.Image:
+        """
+        :return: "RGBA" atlas, "L" with the alpha of the glyphs for texture_mode "alpha", "LA" for "la"
+        """
+        if texture_mode == "alpha":
+            atlas = Image.new("L", (texture.width, texture.height), 0)
+        elif texture_mode == "la":
+            atlas = Image.new("LA", (texture.width, texture.height), (0, 0))
+        else:
+            atlas = Image.new("RGBA", (texture.width, texture.height), (0, 0, 0, 0))
+
+        # coverage masks of the "mask" rasterizer are pasted into their own page and colored once
+        masks: Optional[Image.Image] = None
+        drawn = False
         for ttf_glyph in texture.ttf_glyphs:
             if ttf_glyph.image:
-                atlas.paste(ttf_glyph.image, (ttf_glyph.x, ttf_glyph.y))
+                if texture_mode == "alpha":
+                    image = _glyph_alpha(ttf_glyph.image)
+                elif texture_mode == "la":
+                    image = _glyph_rgba(ttf_glyph.image).convert("LA")
+                elif ttf_glyph.image.mode == "L":
+                    if masks is None:
+                        masks = Image.new("L", (texture.width, texture.height), 0)
+                    masks.paste(ttf_glyph.image, (ttf_glyph.x, ttf_glyph.y))
+                    continue
+                else:
+                    image = ttf_glyph.image
+                atlas.paste(image, (ttf_glyph.x, ttf_glyph.y))
+                drawn = True
 
-        # each texture filename
-        texture_name = f"{texture_name_base}_{texture_index:d}"
+        if masks is not None:
+            # glyphs never overlap, so the pages of both rasterizers are merged with a per channel max
+            atlas = ImageChops.lighter(atlas, _glyph_rgba(masks)) if drawn else _glyph_rgba(masks)
+
+        return atlas
+
+    @staticmethod
+    def _encode_texture(texture: Texture, format: str, texture_mode: str = "rgba") -> bytes:
+        atlas = FontImageMulti._compose_texture(texture, texture_mode)
         if format == "tga":
-            tga_path = os.path.join(output_dir, f"{texture_name}.tga")
-            FontImageMulti._save_tga_for_rtcw(atlas, tga_path)
+            return FontImageMulti._encode_tga_for_rtcw(atlas)
         elif format == "png":
-            tga_path = os.path.join(output_dir, f"{texture_name}.png")
-            FontImageMulti._save_png_for_rtcw(atlas, tga_path)
+            return FontImageMulti._encode_png_for_rtcw(atlas)
         else:
             raise ValueError(f"Unsupported texture format: {format}")
 
-        return texture_index, texture_name, texture.width, texture.height
+    @staticmethod
+    def _check_texture_mode(format: str, texture_mode: str) -> None:
+        if texture_mode not in TEXTURE_MODES:
+            raise ValueError(f"Unsupported texture mode: {texture_mode}, use one of {', '.join(TEXTURE_MODES)}")
+        if texture_mode == "la" and format == "tga":
+            # TGA has no luminance-alpha type the engine loads, only 8-bit grayscale (image type 3)
+            raise ValueError("texture mode \"la\" is only supported with PNG pages, use \"alpha\" for TGA")
 
     @staticmethod
     def _save_tga_for_rtcw(image: Image.Image, filepath: str) -> None:
+        atomic_write(filepath, FontImageMulti._encode_tga_for_rtcw(image))
+
+    @staticmethod
+    def _encode_tga_for_rtcw(image: Image.Image) -> bytes:
+        if image.mode == 'L':
+            return FontImageMulti._encode_grayscale_tga(image)
         if image.mode != 'RGBA':
             image = image.convert('RGBA')
 
@@ -573,108 +1350,913 @@ class FontImageMulti:
         bgra_data[..., 2] = flipped_data[..., 0]  # R
         bgra_data[..., 3] = flipped_data[..., 3]  # A
 
-        with open(filepath, 'wb') as f:
-            f.write(header)
-            f.write(bgra_data.tobytes())
+        return bytes(header) + bgra_data.tobytes()
+
+    @staticmethod
+    def _encode_grayscale_tga(image: Image.Image) -> bytes:
+        width, height = image.size
+
+        # uncompressed 8-bit grayscale, loaded by id Tech 3 as (L, L, L, 255)
+        header = bytearray(18)
+        header[2] = 3
+        header[12] = width & 0xFF
+        header[13] = (width >> 8) & 0xFF
+        header[14] = height & 0xFF
+        header[15] = (height >> 8) & 0xFF
+        header[16] = 8  # depth bits
+        header[17] = 0x00
+
+        return bytes(header) + np.flipud(np.asarray(image)).tobytes()
 
     @staticmethod
     def _save_png_for_rtcw(image: Image.Image, filepath: str) -> None:
-        if image.mode != 'RGBA':
+        atomic_write(filepath, FontImageMulti._encode_png_for_rtcw(image))
+
+    @staticmethod
+    def _encode_png_for_rtcw(image: Image.Image) -> bytes:
+        if image.mode not in ('RGBA', 'L', 'LA'):
             image = image.convert('RGBA')
 
-        image.save(filepath, 'PNG', optimize=True, compress_level=6)
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG', optimize=True, compress_level=6)
+        return buffer.getvalue()
 
-    def save_fnt_file(self, filepath: str, texture_name_base: str) -> None:
-        special_chars: Dict[int, str] = {10: "(LF)", 13: "(CR)"}
+    def save_fnt_file(self, filepath: str, texture_name_base: str, texture_mode: str = "rgba",
+                        manifest: Optional[BuildManifest] = None) -> bool:
+        """
+        :return: whether the file was written, a file with the same content is left untouched
+        """
+        data = self._encode_fnt_file(texture_name_base, texture_mode)
+        if manifest:
+            return manifest.write(filepath, data)
+        return write_if_changed(filepath, data)[0]
 
-        with open(filepath, 'w', encoding='utf-8', errors='ignore') as f:
-            # some information about generated font
-            f.write(f"// RTCW Font File\n")
-            f.write(f"// Generated from:\n")
-            for i in range(len(self.multi_table)):
-                ttf_basename = os.path.basename(self.multi_table[i].ttf_path)
-                font_size = self.multi_table[i].font_size
-                char_ranges = self.multi_table[i].char_ranges
-                f.write(f"// \t\"{ttf_basename}\", size {font_size}: {char_ranges}\n")
-            f.write(f"// Total characters: {len(self.glyphs)}\n")
-            f.write(f"// Texture base name: {texture_name_base}\n\n")
-
-            sorted_glyphs = sorted(self.glyphs, key=lambda g: g.unicode)
-            f.write("// glyphs\n{\n")
-            for glyph in sorted_glyphs:
-                if glyph.unicode in special_chars:
-                    f.write(f"\t// Character: '{special_chars[glyph.unicode]}' (U+{glyph.unicode:04X})\n")
-                else:
-                    f.write(f"\t// Character: '{chr(glyph.unicode)}' (U+{glyph.unicode:04X})\n")
-                f.write(f"\tchar {glyph.unicode}\n")
-                f.write("\t{\n")
-                f.write(f"\t\theight {glyph.height}\n")
-                f.write(f"\t\ttop {glyph.top}\n")
-                f.write(f"\t\tbottom {glyph.bottom}\n")
-                f.write(f"\t\tpitch {glyph.pitch}\n")
-                f.write(f"\t\txSkip {glyph.xSkip}\n")
-                f.write(f"\t\timageWidth {glyph.imageWidth}\n")
-                f.write(f"\t\timageHeight {glyph.imageHeight}\n")
-                f.write(f"\t\ts {glyph.s:.6f}\n")
-                f.write(f"\t\tt {glyph.t:.6f}\n")
-                f.write(f"\t\ts2 {glyph.s2:.6f}\n")
-                f.write(f"\t\tt2 {glyph.t2:.6f}\n")
-                f.write("\t\tglyph 0\n")
-                f.write(f'\t\tshaderName "{glyph.shaderName}"\n')
-                f.write("\t}\n\n")
-            f.write("}\n\n")
-
-            f.write("// fontinfo\n{\n")
-            f.write(f"\tglyphScale {1.0:.6f}\n")
-            f.write(f"\tname \"{texture_name_base}\"\n")
-            f.write("}\n")
+    def _encode_fnt_file(self, texture_name_base: str, texture_mode: str = "rgba") -> bytes:
+        special_chars: Dict[int, str] = {10: "(LF)", 13: "(CR)"}
+        lines: List[str] = []
+
+        # some information about generated font
+        lines.append(f"// RTCW Font File\n")
+        lines.append(f"// Generated from:\n")
+        for i in range(len(self.multi_table)):
+            ttf_basename = os.path.basename(self.multi_table[i].ttf_path)
+            font_size = self.multi_table[i].font_size
+            char_ranges = self.multi_table[i].char_ranges
+            lines.append(f"// \t\"{ttf_basename}\", size {font_size}: {char_ranges}\n")
+        for font_path in self.imported_fonts:
+            lines.append(f"// \t\"{os.path.basename(font_path)}\", imported\n")
+        lines.append(f"// Total characters: {len(self.glyphs)}\n")
+        lines.append(f"// Texture base name: {texture_name_base}\n")
+        for note in TEXTURE_MODE_NOTES[texture_mode]:
+            lines.append(f"// {note}\n")
+        lines.append("\n")
+
+        sorted_glyphs = sorted(self.glyphs, key=lambda g: g.unicode)
+        lines.append("// glyphs\n{\n")
+        for glyph in sorted_glyphs:
+            if glyph.unicode in special_chars:
+                lines.append(f"\t// Character: '{special_chars[glyph.unicode]}' (U+{glyph.unicode:04X})\n")
+            else:
+                lines.append(f"\t// Character: '{chr(glyph.unicode)}' (U+{glyph.unicode:04X})\n")
+            lines.append(f"\tchar {glyph.unicode}\n")
+            lines.append("\t{\n")
+            lines.append(f"\t\theight {glyph.height}\n")
+            lines.append(f"\t\ttop {glyph.top}\n")
+            lines.append(f"\t\tbottom {glyph.bottom}\n")
+            lines.append(f"\t\tpitch {glyph.pitch}\n")
+            lines.append(f"\t\txSkip {glyph.xSkip}\n")
+            lines.append(f"\t\timageWidth {glyph.imageWidth}\n")
+            lines.append(f"\t\timageHeight {glyph.imageHeight}\n")
+            lines.append(f"\t\ts {glyph.s:.6f}\n")
+            lines.append(f"\t\tt {glyph.t:.6f}\n")
+            lines.append(f"\t\ts2 {glyph.s2:.6f}\n")
+            lines.append(f"\t\tt2 {glyph.t2:.6f}\n")
+            lines.append("\t\tglyph 0\n")
+            lines.append(f'\t\tshaderName "{glyph.shaderName}"\n')
+            lines.append("\t}\n\n")
+        lines.append("}\n\n")
+
+        lines.append("// fontinfo\n{\n")
+        lines.append(f"\tglyphScale {self.glyph_scale:.6f}\n")
+        lines.append(f"\tname \"{texture_name_base}\"\n")
+        lines.append("}\n")
+
+        return "".join(lines).encode('utf-8', errors='ignore')
 
     def generate(self, output_name: str, save_fnt: bool = True,
                     texture_width: int = 1024, texture_height: int = 1024,
                     char_margin: int = 2, char_spacing: int = 2, texture_margin: int = 8,
                     texture_format: str = "tga", max_workers: int = 1,
-                    developer_mode: bool = False) -> None:
+                    developer_mode: bool = False, deduplicate: bool = True, elide_empty: bool = True,
+                    auto_texture_size: bool = False, max_texture_size: int = 2048,
+                    async_write: bool = True, render_backend: str = "auto", texture_mode: str = "rgba",
+                    rasterizer: str = "draw") -> None:
         """
         texture_format: "tga", "png"
+        texture_mode: "rgba" 32-bit pages, "alpha" 8-bit grayscale pages holding the glyph coverage (TGA or PNG),
+            "la" 8-bit luminance and alpha PNG pages, the shader to draw them is written to the FNT header
+        render_backend: "serial", "thread", "process", or "auto" to choose from the glyph count and
+            the measured per-glyph cost
+        rasterizer: "draw" draws every glyph on its own RGBA image, "mask" keeps the 8-bit coverage mask
+            FreeType returns (same pixels, faster, RGBA is built once per page), developer_mode always draws
+        async_write: encode and write pages and FNT file in background threads, overlapped with packing
+            and glyph data generation
+        auto_texture_size: ignore texture_width and texture_height, choose the power-of-two size
+            up to max_texture_size with the fewest pages and least wasted texels, and trim the last page
         developer_mode: draw colored boundary lines for each font for adjustment purposes
+        deduplicate: glyphs with the same glyph id or identical bitmaps share one atlas region
+        elide_empty: glyphs without coverage are not packed and point to one shared transparent texel
         """
         format = texture_format.lower()
+        self._check_texture_mode(format, texture_mode)
         self.max_workers = max_workers
+
+        self._render_stage(char_margin=char_margin, developer_mode=developer_mode, deduplicate=deduplicate,
+                            render_backend=render_backend, rasterizer=rasterizer)
+        self._output_stage(output_name=output_name, texture_format=format, save_fnt=save_fnt,
+                            texture_width=texture_width, texture_height=texture_height, char_spacing=char_spacing,
+                            texture_margin=texture_margin, elide_empty=elide_empty,
+                            auto_texture_size=auto_texture_size, max_texture_size=max_texture_size,
+                            async_write=async_write, texture_mode=texture_mode)
+
+    def generate_sizes(self, output_name: str, font_sizes: List[int], supersample: int = 1, save_fnt: bool = True,
+                        texture_width: int = 1024, texture_height: int = 1024,
+                        char_margin: int = 2, char_spacing: int = 2, texture_margin: int = 8,
+                        texture_format: str = "tga", max_workers: int = 1,
+                        developer_mode: bool = False, deduplicate: bool = True, elide_empty: bool = True,
+                        auto_texture_size: bool = False, max_texture_size: int = 2048,
+                        async_write: bool = True, render_backend: str = "auto",
+                        texture_mode: str = "rgba", rasterizer: str = "draw") -> None:
+        """
+        Build several point sizes with one rasterization pass: glyphs are rendered once at the largest size
+        (times supersample), smaller sizes are derived with an area filter.
+        Each size replaces default_font_size, fonts with their own size in the table are scaled by the same ratio.
+        Output files are named "{output_name}_{font_size}", see generate() for the other parameters.
+        """
+        format = texture_format.lower()
+        self._check_texture_mode(format, texture_mode)
+        self.max_workers = max_workers
+        font_sizes = sorted(set(font_sizes), reverse=True)
+        render_size = font_sizes[0] * max(1, supersample)
+
+        self._render_stage(char_margin=char_margin, developer_mode=developer_mode, deduplicate=deduplicate,
+                            render_backend=render_backend, rasterizer=rasterizer,
+                            size_scale=render_size / self.default_font_size)
+
+        rendered_glyphs = self.ttf_glyphs
+        for font_size in font_sizes:
+            print(f"Deriving size {font_size} from rendered size {render_size}...")
+            self.ttf_glyphs = self._downsample_glyphs(rendered_glyphs, font_size / render_size, char_margin)
+            if deduplicate:
+                self._deduplicate_glyphs()
+
+            self._output_stage(output_name=f"{output_name}_{font_size}", texture_format=format, save_fnt=save_fnt,
+                                texture_width=texture_width, texture_height=texture_height,
+                                char_spacing=char_spacing, texture_margin=texture_margin, elide_empty=elide_empty,
+                                auto_texture_size=auto_texture_size, max_texture_size=max_texture_size,
+                                async_write=async_write, texture_mode=texture_mode)
+
+        self.ttf_glyphs = rendered_glyphs
+
+    def generate_sdf(self, output_name: str, font_sizes: Optional[List[int]] = None, spread: int = 4,
+                        supersample: int = 4, save_fnt: bool = True,
+                        texture_width: int = 1024, texture_height: int = 1024,
+                        char_margin: int = 2, char_spacing: int = 2, texture_margin: int = 8,
+                        texture_format: str = "tga", max_workers: int = 1, deduplicate: bool = True,
+                        elide_empty: bool = True, auto_texture_size: bool = False, max_texture_size: int = 2048,
+                        async_write: bool = True, render_backend: str = "auto",
+                        texture_mode: str = "rgba", rasterizer: str = "draw") -> None:
+        """
+        Build a signed distance field atlas at default_font_size: the alpha channel stores the distance to the
+        glyph outline (128 is the edge, 0 and 255 are `spread` pixels outside and inside), so the engine has to
+        draw it with a distance field shader, e.g. alpha test or smoothstep around 0.5.
+        Glyphs are rendered at supersample times the size, the distance is computed on the high resolution mask.
+        font_sizes: also write "{output_name}_{size}.fnt" for every size, all of them use the same pages
+            and scale the atlas metrics with glyphScale = size / default_font_size
+        See generate() for the other parameters.
+        """
+        format = texture_format.lower()
+        self._check_texture_mode(format, texture_mode)
+        self.max_workers = max_workers
+        supersample = max(1, supersample)
+
+        self._render_stage(char_margin=char_margin, developer_mode=False, deduplicate=deduplicate,
+                            render_backend=render_backend, rasterizer=rasterizer, size_scale=supersample)
+        self.ttf_glyphs = self.build_distance_fields(self.ttf_glyphs, spread=spread, supersample=supersample,
+                                                        margin=char_margin)
+        if deduplicate:
+            self._deduplicate_glyphs()
+
+        self.glyph_scale = 1.0
+        self._output_stage(output_name=output_name, texture_format=format, save_fnt=save_fnt,
+                            texture_width=texture_width, texture_height=texture_height, char_spacing=char_spacing,
+                            texture_margin=texture_margin, elide_empty=elide_empty,
+                            auto_texture_size=auto_texture_size, max_texture_size=max_texture_size,
+                            async_write=async_write, texture_mode=texture_mode)
+
+        if save_fnt and font_sizes:
+            # the glyph data already points to the pages of output_name
+            for font_size in font_sizes:
+                self.glyph_scale = font_size / self.default_font_size
+                fnt_path = os.path.join(self.output_dir, f"{output_name}_{font_size}.fnt")
+                self.save_fnt_file(filepath=fnt_path, texture_name_base=output_name, texture_mode=texture_mode,
+                                    manifest=self.manifest)
+            self.glyph_scale = 1.0
+            self.manifest.save()
+            print(f"Saved {len(font_sizes)} FNT files sharing the distance field atlas \"{output_name}\"")
+
+    def build_distance_fields(self, ttf_glyphs: List[TTFGlyph], spread: int, supersample: int,
+                                margin: int) -> List[TTFGlyph]:
+        """
+        Replace the glyph bitmaps (rendered at supersample times the size) by distance fields at the target size,
+        metrics are scaled back and the field adds `spread` pixels of padding on every side.
+        Chunks of glyphs are processed by the worker pool when max_workers > 1.
+        """
+        start = time.perf_counter()
+
+        # aliases share the image object, compute its field once
+        unique_glyphs: Dict[int, TTFGlyph] = {}
+        for ttf_glyph in ttf_glyphs:
+            unique_glyphs.setdefault(id(ttf_glyph.image), ttf_glyph)
+
+        items = [(key, ttf_glyph.image, ttf_glyph.bbox) for key, ttf_glyph in unique_glyphs.items()]
+        # larger glyphs first, so the expensive chunks don't become stragglers at the end
+        items.sort(key=lambda item: item[1].width * item[1].height, reverse=True)
+
+        fields: Dict[int, Tuple[Image.Image, Tuple[int, int, int, int]]] = {}
+        max_workers = self._get_pool().max_workers if self.max_workers > 1 else 1
+        if max_workers > 1 and len(items) > RENDER_MIN_CHUNK_GLYPHS:
+            chunks_count = max_workers * RENDER_CHUNKS_PER_WORKER
+            # interleave, every chunk gets a similar mix of large and small glyphs
+            tasks = [(items[i::chunks_count], spread, supersample) for i in range(chunks_count) if items[i::chunks_count]]
+            for task_index, result, error in self._get_pool().run_tasks(FontImageMulti._distance_field_chunk, tasks,
+                                                                        backend="process"):
+                if error is not None:
+                    raise RuntimeError(f"distance field chunk {task_index} failed: {error}")
+                fields.update(result)
+        else:
+            fields = FontImageMulti._distance_field_chunk(items, spread, supersample)
+
+        sdf_glyphs: List[TTFGlyph] = []
+        for ttf_glyph in ttf_glyphs:
+            image, bbox = fields[id(ttf_glyph.image)]
+
+            sdf_glyph = copy.copy(ttf_glyph)
+            sdf_glyph.image = image
+            sdf_glyph.bbox = bbox
+            sdf_glyph.width = bbox[2] - bbox[0]
+            sdf_glyph.height = bbox[3] - bbox[1]
+            sdf_glyph.margin = margin
+            sdf_glyph.padding = spread
+            sdf_glyph.ascent = round(ttf_glyph.ascent / supersample)
+            sdf_glyph.descent = round(ttf_glyph.descent / supersample)
+            sdf_glyph.duplicate_of = None
+            sdf_glyphs.append(sdf_glyph)
+
+        print(f"Built {len(fields)} distance fields (spread {spread}, supersample {supersample}x) "
+              f"in {time.perf_counter() - start:.2f}s")
+        return sdf_glyphs
+
+    @staticmethod
+    def _distance_field_chunk(items: List[Tuple[int, Image.Image, Tuple]], spread: int,
+                                supersample: int) -> Dict[int, Tuple[Image.Image, Tuple[int, int, int, int]]]:
+        fields: Dict[int, Tuple[Image.Image, Tuple[int, int, int, int]]] = {}
+        for key, image, bbox in items:
+            fields[key] = _glyph_distance_field(image, bbox, spread, supersample)
+        return fields
+
+    def generate_merged(self, output_name: str, font_paths: List[str], texture_dirs: Optional[List[str]] = None,
+                        replace_existing: bool = True, save_fnt: bool = True, save_dat: bool = True,
+                        texture_width: int = 1024, texture_height: int = 1024,
+                        char_margin: int = 2, char_spacing: int = 2, texture_margin: int = 8,
+                        texture_format: str = "tga", max_workers: int = 1,
+                        developer_mode: bool = False, deduplicate: bool = True, elide_empty: bool = True,
+                        auto_texture_size: bool = False, max_texture_size: int = 2048,
+                        async_write: bool = True, render_backend: str = "auto",
+                        texture_mode: str = "rgba", rasterizer: str = "draw", verify: bool = True) -> None:
+        """
+        Repack existing fonts and merge them with the glyphs of the corresponding table (which may be empty),
+        glyphs already in the FNT/DAT files are cut out of their pages instead of being rendered again.
+        Only the ranges of the table are rendered, the first font doesn't reserve the 256 base characters.
+        font_paths: FNT or DAT files, a later file overrides the glyphs of an earlier one
+        texture_dirs: directory of the pages of every font, default: the directory of the font file
+        replace_existing: glyphs rendered from the table replace imported glyphs with the same codepoint
+        save_dat: also convert the new .fnt file to .dat
+        verify: check the imported glyphs which were not replaced are unchanged, see verify_merged()
+        See generate() for the other parameters.
+        """
+        format = texture_format.lower()
+        self._check_texture_mode(format, texture_mode)
+        self.max_workers = max_workers
+
+        if self.multi_table:
+            # the imported fonts hold the base characters already, only add or replace the ranges of the table
+            self.multi_table[0].reserve_base_chars = False
+            try:
+                self._render_stage(char_margin=char_margin, developer_mode=developer_mode, deduplicate=deduplicate,
+                                    render_backend=render_backend, rasterizer=rasterizer)
+            finally:
+                self.multi_table[0].reserve_base_chars = True
+        else:
+            self.glyphs = []
+            self.ttf_glyphs = []
+            self.blank_glyph = None
+        rendered_glyphs = self.ttf_glyphs
+
+        imported_glyphs = self.load_font_glyphs(font_paths, texture_dirs)
+        rendered_unicodes = {ttf_glyph.unicode for ttf_glyph in rendered_glyphs}
+        imported_unicodes = {ttf_glyph.unicode for ttf_glyph in imported_glyphs}
+        if replace_existing:
+            imported_glyphs = [ttf_glyph for ttf_glyph in imported_glyphs if ttf_glyph.unicode not in rendered_unicodes]
+        else:
+            rendered_glyphs = [ttf_glyph for ttf_glyph in rendered_glyphs if ttf_glyph.unicode not in imported_unicodes]
+
+        self.ttf_glyphs = sorted(imported_glyphs + rendered_glyphs, key=lambda ttf_glyph: ttf_glyph.unicode)
+        print(f"Merged {len(imported_glyphs)} imported glyphs with {len(rendered_glyphs)} rendered glyphs")
+        if deduplicate:
+            self._deduplicate_glyphs()
+
+        self._output_stage(output_name=output_name, texture_format=format, save_fnt=save_fnt or save_dat,
+                            texture_width=texture_width, texture_height=texture_height, char_spacing=char_spacing,
+                            texture_margin=texture_margin, elide_empty=elide_empty,
+                            auto_texture_size=auto_texture_size, max_texture_size=max_texture_size,
+                            async_write=async_write, texture_mode=texture_mode)
+
+        fnt_path = os.path.join(self.output_dir, f"{output_name}.fnt")
+        if verify and (save_fnt or save_dat):
+            self.verify_merged(fnt_path, font_paths, texture_dirs)
+
+        if save_dat:
+            fontinfo = FontData(file_path=fnt_path, output_dir=self.output_dir, max_glyphs=self.max_glyphs,
+                                verbose=False)
+            fontinfo.write_dat(manifest=self.manifest)
+            if not save_fnt:
+                os.remove(fnt_path)
+                self.manifest.discard(fnt_path)
+            self.manifest.save()
+            print(f"Saved \"{os.path.join(self.output_dir, output_name)}.dat\"")
+
+    def verify_merged(self, fnt_path: str, font_paths: List[str], texture_dirs: Optional[List[str]] = None,
+                        check_pixels: bool = True) -> bool:
+        """
+        Check that every imported glyph not replaced by a rendered one kept its metrics in the merged font fnt_path
+        and, with check_pixels, the same pixels in its atlas region, pages of every texture mode are compared as
+        the RGBA pixels they store. Glyphs only move in the atlas.
+        :return: whether all kept glyphs are identical, the differences are printed otherwise
+        """
+        from RF_FontDiff import FontRecords, diff_fonts
+
+        metric_fields = ("height", "top", "bottom", "pitch", "xSkip", "imageWidth", "imageHeight", "glyph")
+        rendered = [ttf_glyph.unicode for ttf_glyph in self.ttf_glyphs if ttf_glyph.source_glyph is None]
+        overridden = np.array(rendered, dtype=np.int64)     # rendered, or overridden by a later font
+        identical = True
+        for font_index in reversed(range(len(font_paths))):
+            font_path = font_paths[font_index]
+            texture_dir = texture_dirs[font_index] if texture_dirs else os.path.dirname(font_path)
+            codepoints = FontRecords(font_path, max_glyphs=self.max_glyphs).records["unicode"].astype(np.int64)
+            kept = np.setdiff1d(codepoints, overridden)
+            overridden = np.union1d(overridden, codepoints)
+
+            diff = diff_fonts(font_path, fnt_path, check_pixels=check_pixels, old_texture_dir=texture_dir,
+                                new_texture_dir=self.output_dir, max_glyphs=self.max_glyphs)
+            differences = {"missing": np.intersect1d(diff.removed, kept)}
+            for field in metric_fields:
+                differences[field] = np.intersect1d(diff.changed_fields[field], kept)
+            if check_pixels:
+                differences["pixels"] = np.intersect1d(diff.pixels_changed, kept)
+
+            for name, unicodes in differences.items():
+                if len(unicodes):
+                    identical = False
+                    print(f"[Warning] {len(unicodes)} glyphs kept from \"{font_path}\" differ in the merged font "
+                          f"({name}): {' '.join(f'U+{int(unicode):04X}' for unicode in unicodes[:20])}")
+            print(f"Checked {len(kept)} glyphs kept from \"{font_path}\"")
+
+        return identical
+
+    def load_font_glyphs(self, font_paths: List[str], texture_dirs: Optional[List[str]] = None) -> List[TTFGlyph]:
+        """
+        Cut the glyphs of existing FNT/DAT files out of their texture pages, a later file overrides the glyphs
+        of an earlier one. Pages are found by the file name of the shader name (or the same name as .tga/.png).
+        """
+        self.imported_fonts = list(font_paths)
+        font_glyphs: Dict[int, TTFGlyph] = {}
+
+        for font_index, font_path in enumerate(font_paths):
+            texture_dir = texture_dirs[font_index] if texture_dirs else os.path.dirname(font_path)
+            fontinfo = FontData(file_path=font_path, max_glyphs=self.max_glyphs, verbose=False)
+
+            if abs(fontinfo.glyphScale - self.glyph_scale) > 1e-6:
+                if font_index == 0:
+                    self.glyph_scale = fontinfo.glyphScale
+                else:
+                    print(f"[Warning] glyphScale {fontinfo.glyphScale:.6f} of \"{font_path}\" differs from "
+                          f"{self.glyph_scale:.6f}, its glyphs will be scaled differently in game")
+
+            pages: Dict[str, Optional[np.ndarray]] = {}
+            regions: Dict[Tuple, Image.Image] = {}
+            missing_count = 0
+            for unicode, glyph in fontinfo.glyphs.items():
+                shader_name = glyph.shaderName.replace('\"', '')
+                if shader_name not in pages:
+                    pages[shader_name] = _load_font_page(texture_dir, shader_name)
+                page = pages[shader_name]
+                if page is None:
+                    missing_count += 1
+                    continue
+
+                page_height, page_width = page.shape[:2]
+                x1, y1 = round(glyph.s * page_width), round(glyph.t * page_height)
+                x2, y2 = round(glyph.s2 * page_width), round(glyph.t2 * page_height)
+
+                # glyphs sharing a region keep sharing one image, so deduplication doesn't hash it again
+                region_key = (shader_name, x1, y1, x2, y2)
+                image = regions.get(region_key)
+                if image is None:
+                    image = Image.fromarray(np.ascontiguousarray(page[y1:y2, x1:x2]), "RGBA")
+                    regions[region_key] = image
+
+                ttf_glyph = TTFGlyph()
+                ttf_glyph.char = chr(unicode)
+                ttf_glyph.unicode = unicode
+                ttf_glyph.width, ttf_glyph.height = image.size
+                ttf_glyph.bbox = (0, 0, ttf_glyph.width, ttf_glyph.height)
+                ttf_glyph.image = image
+                ttf_glyph.source_glyph = glyph
+                font_glyphs[unicode] = ttf_glyph
+
+            print(f"Imported {len(fontinfo.glyphs) - missing_count} glyphs from \"{font_path}\" "
+                  f"({len(pages)} pages)")
+            for shader_name, page in pages.items():
+                if page is None:
+                    print(f"[Warning] page \"{shader_name}\" not found in \"{texture_dir}\", its glyphs are skipped")
+
+        return list(font_glyphs.values())
+
+    def compare_downsampled_quality(self, font_size: int, render_size: int, sample_count: int = 200,
+                                    char_margin: int = 2, max_offset: int = 1) -> Dict[str, float]:
+        """
+        Compare glyphs derived from render_size with glyphs rendered natively at font_size,
+        on a sample of the selected characters of every font.
+        Both glyphs are placed on their baseline, then the derived one is moved by up to max_offset pixels
+        to where it matches best: hinting snaps native edges to the pixel grid, that offset is reported apart
+        from the pixel error of the filter.
+        :return: mean absolute alpha error (0-255) and PSNR (dB) once aligned, the same before aligning,
+                    mean offset (px) and ratio of glyphs needing one,
+                    ratio of glyphs whose top/width/height differ by more than one pixel
+        """
+        abs_errors: List[float] = []
+        squared_errors: List[float] = []
+        unaligned_abs_errors: List[float] = []
+        unaligned_squared_errors: List[float] = []
+        offsets: List[int] = []
+        metric_differences = 0
+        compared = 0
+
+        for font_index, mtable in enumerate(self.multi_table):
+            render_codepoints = self._get_render_codepoints(font_index, mtable)
+            step = max(1, len(render_codepoints) // max(1, sample_count // max(1, len(self.multi_table))))
+            sample_codepoints = render_codepoints[::step]
+
+            native_size = round(mtable.font_size * font_size / self.default_font_size)
+            source_size = round(mtable.font_size * render_size / self.default_font_size)
+            native = FontImageMulti._render_glyphs_chunk(font_index, mtable, native_size, char_margin, -1,
+                                                        sample_codepoints, False)[2]
+            source = FontImageMulti._render_glyphs_chunk(font_index, mtable, source_size, char_margin, -1,
+                                                        sample_codepoints, False)[2]
+            derived = {ttf_glyph.unicode: ttf_glyph
+                        for ttf_glyph in self._downsample_glyphs(list(source.values()), native_size / source_size,
+                                                                char_margin)}
+
+            for unicode, native_glyph in native.items():
+                derived_glyph = derived.get(unicode)
+                if derived_glyph is None or native_glyph.image is None or derived_glyph.image is None:
+                    continue
+
+                # baseline frame, the ascents of both sizes may round differently
+                native_y = native_glyph.bbox[1] - native_glyph.ascent
+                derived_y = derived_glyph.bbox[1] - derived_glyph.ascent
+                x0 = min(native_glyph.bbox[0], derived_glyph.bbox[0]) - max_offset
+                y0 = min(native_y, derived_y) - max_offset
+                x1 = max(native_glyph.bbox[2], derived_glyph.bbox[2]) + max_offset
+                y1 = max(native_y + native_glyph.height, derived_y + derived_glyph.height) + max_offset
+
+                native_alpha = np.zeros((y1 - y0, x1 - x0), dtype=np.float64)
+                alpha = np.asarray(_glyph_alpha(native_glyph.image), dtype=np.float64)
+                gx, gy = native_glyph.bbox[0] - x0, native_y - y0
+                native_alpha[gy:gy + alpha.shape[0], gx:gx + alpha.shape[1]] = alpha
+
+                derived_image = np.asarray(_glyph_alpha(derived_glyph.image), dtype=np.float64)
+                best: Optional[Tuple[float, float, int]] = None
+                unaligned: Optional[Tuple[float, float, int]] = None
+                for dy in range(-max_offset, max_offset + 1):
+                    for dx in range(-max_offset, max_offset + 1):
+                        derived_alpha = np.zeros_like(native_alpha)
+                        gx, gy = derived_glyph.bbox[0] - x0 + dx, derived_y - y0 + dy
+                        derived_alpha[gy:gy + derived_image.shape[0], gx:gx + derived_image.shape[1]] = \
+                            derived_image
+                        difference = native_alpha - derived_alpha
+                        errors = (float(np.abs(difference).mean()), float((difference ** 2).mean()),
+                                    abs(dx) + abs(dy))
+                        if dx == 0 and dy == 0:
+                            unaligned = errors
+                        if best is None or errors[0] < best[0] or (errors[0] == best[0] and errors[2] < best[2]):
+                            best = errors
+
+                abs_errors.append(best[0])
+                squared_errors.append(best[1])
+                offsets.append(best[2])
+                unaligned_abs_errors.append(unaligned[0])
+                unaligned_squared_errors.append(unaligned[1])
+
+                # hinting moves native edges by up to a pixel, only count larger metric differences
+                native_top = native_glyph.ascent - native_glyph.bbox[1]
+                derived_top = derived_glyph.ascent - derived_glyph.bbox[1]
+                if abs(native_top - derived_top) > 1 or abs(native_glyph.width - derived_glyph.width) > 1 or \
+                        abs(native_glyph.height - derived_glyph.height) > 1:
+                    metric_differences += 1
+                compared += 1
+
+        def psnr(errors: List[float]) -> float:
+            mean_squared_error = float(np.mean(errors)) if errors else 0.0
+            return 10 * np.log10(255 ** 2 / mean_squared_error) if mean_squared_error > 0 else float("inf")
+
+        result = {
+            "glyphs": float(compared),
+            "mean_abs_error": float(np.mean(abs_errors)) if abs_errors else 0.0,
+            "psnr": psnr(squared_errors),
+            "unaligned_mean_abs_error": float(np.mean(unaligned_abs_errors)) if unaligned_abs_errors else 0.0,
+            "unaligned_psnr": psnr(unaligned_squared_errors),
+            "mean_offset": float(np.mean(offsets)) if offsets else 0.0,
+            "offset_ratio": sum(1 for offset in offsets if offset) / compared if compared else 0.0,
+            "metric_difference_ratio": metric_differences / compared if compared else 0.0,
+        }
+        print(f"Size {font_size} derived from {render_size} vs native ({compared} glyphs): "
+              f"mean abs error {result['mean_abs_error']:.2f}/255, PSNR {result['psnr']:.2f} dB once aligned "
+              f"({result['unaligned_mean_abs_error']:.2f}/255, {result['unaligned_psnr']:.2f} dB on the baseline), "
+              f"{result['offset_ratio'] * 100:.1f}% glyphs offset by hinting (mean {result['mean_offset']:.2f}px), "
+              f"{result['metric_difference_ratio'] * 100:.1f}% glyphs with metrics off by more than 1px")
+        return result
+
+    @staticmethod
+    def _downsample_glyphs(ttf_glyphs: List[TTFGlyph], factor: float, margin: int) -> List[TTFGlyph]:
+        """
+        scale rendered glyphs and their metrics by factor (<= 1) with an area filter
+        """
+        derived_glyphs: List[TTFGlyph] = []
+        derived_images: Dict[int, Tuple[Image.Image, Tuple[int, int, int, int]]] = {}
+
+        for ttf_glyph in ttf_glyphs:
+            # aliases share the image object, downsample it once
+            ascent = round(ttf_glyph.ascent * factor)
+            derived = derived_images.get(id(ttf_glyph.image))
+            if derived is None:
+                derived = _area_downsample(ttf_glyph.image, ttf_glyph.bbox, factor, ttf_glyph.ascent, ascent)
+                derived_images[id(ttf_glyph.image)] = derived
+            image, bbox = derived
+
+            derived_glyph = copy.copy(ttf_glyph)
+            derived_glyph.image = image
+            derived_glyph.bbox = bbox
+            derived_glyph.width = bbox[2] - bbox[0]
+            derived_glyph.height = bbox[3] - bbox[1]
+            derived_glyph.margin = margin
+            derived_glyph.ascent = ascent
+            derived_glyph.descent = round(ttf_glyph.descent * factor)
+            derived_glyph.duplicate_of = None
+            derived_glyphs.append(derived_glyph)
+
+        return derived_glyphs
+
+    def _render_stage(self, char_margin: int, developer_mode: bool, deduplicate: bool, render_backend: str,
+                        rasterizer: str = "draw", size_scale: float = 1.0) -> None:
+        """
+        size_scale: render every font at its size times size_scale, the table keeps its sizes
+        """
+        if rasterizer not in RASTERIZERS:
+            raise ValueError(f"Unsupported rasterizer: {rasterizer}, use one of {', '.join(RASTERIZERS)}")
+
+        if size_scale != 1.0:
+            table_sizes = [mtable.font_size for mtable in self.multi_table]
+            try:
+                for mtable, table_size in zip(self.multi_table, table_sizes):
+                    mtable.font_size = round(table_size * size_scale)
+                self._render_stage(char_margin=char_margin, developer_mode=developer_mode, deduplicate=deduplicate,
+                                    render_backend=render_backend, rasterizer=rasterizer)
+            finally:
+                for mtable, table_size in zip(self.multi_table, table_sizes):
+                    mtable.font_size = table_size
+            return
+
         self.glyphs = []
         self.ttf_glyphs = []
+        self.blank_glyph = None
 
-        if self.max_workers > 1:
-            try:
-                self.render_glyphs_parallel(margin=char_margin, developer_mode=developer_mode, chars_per_chunk=600)
-            except Exception as e:
-                if developer_mode:
-                    print(f"Parallel acceleration failed, switch to default mode...\n{e}")
-                self.render_glyphs(margin=char_margin, developer_mode=developer_mode)
+        backend = render_backend.lower()
+        if self.render_cache is not None:
+            self.render_glyphs_cached(margin=char_margin, developer_mode=developer_mode, deduplicate=deduplicate,
+                                        backend=backend, rasterizer=rasterizer)
+            return
+
+        if backend == "auto":
+            backend = self.select_render_backend(margin=char_margin, developer_mode=developer_mode,
+                                                    deduplicate=deduplicate, rasterizer=rasterizer)
+
+        if self.max_workers > 1 and backend in ("thread", "process"):
+            # failed chunks are retried on their own, no need to render everything again
+            self.render_glyphs_parallel(margin=char_margin, developer_mode=developer_mode, chars_per_chunk=0,
+                                        deduplicate=deduplicate, backend=backend, rasterizer=rasterizer)
         else:
-            self.render_glyphs(margin=char_margin, developer_mode=developer_mode)
-        
+            self.render_glyphs(margin=char_margin, developer_mode=developer_mode, deduplicate=deduplicate,
+                                rasterizer=rasterizer)
+
+    def _output_stage(self, output_name: str, texture_format: str, save_fnt: bool,
+                        texture_width: int, texture_height: int, char_spacing: int, texture_margin: int,
+                        elide_empty: bool, auto_texture_size: bool, max_texture_size: int, async_write: bool,
+                        texture_mode: str = "rgba") -> None:
+        format = texture_format
+        self.glyphs = []
+        self.blank_glyph = None
+
+        if elide_empty:
+            self.elide_empty_glyphs()
+
+        if auto_texture_size:
+            texture_width, texture_height = self.optimize_texture_size(max_texture_size=max_texture_size,
+                                                                        char_spacing=char_spacing,
+                                                                        texture_margin=texture_margin,
+                                                                        texture_mode=texture_mode)
+
+        fnt_path = os.path.join(self.output_dir, f"{output_name}.fnt")
+        # files with the same content as the last build are not rewritten, see the manifest for what changed
+        self.manifest = BuildManifest(os.path.join(self.output_dir, f"{output_name}{MANIFEST_SUFFIX}"))
+        if async_write:
+            writer = AsyncWriter(max_queue=4, threads=min(max(1, self.max_workers), available_cpu_count()),
+                                    manifest=self.manifest)
+            try:
+                self.pack_textures(texture_width=texture_width, texture_height=texture_height,
+                                    char_spacing=char_spacing, texture_margin=texture_margin,
+                                    trim_last_page=auto_texture_size,
+                                    on_page_packed=lambda texture: self.save_texture_async(writer, texture, output_name,
+                                                                                            format, texture_mode))
+                self.generate_glyphs_data(texture_name_base=output_name, texture_format=format)
+                if self.usage_corpus:
+                    self.report_page_switches(texture_width, texture_height, char_spacing, texture_margin)
+                if save_fnt:
+                    # generate .fnt data file
+                    writer.submit(fnt_path, lambda: self._encode_fnt_file(texture_name_base=output_name,
+                                                                            texture_mode=texture_mode))
+            finally:
+                writer.close()
+                self.manifest.save()
+
+            print(f"Saved {writer.written_count} files in background ({writer.unchanged_count} unchanged): "
+                  f"{writer.busy_time:.2f}s encoding and writing, "
+                  f"{writer.hidden_time:.2f}s hidden behind packing and glyph data generation")
+            print(f"Generation completed! Created {len(self.textures)} {format.upper()} files and 1 FNT file")
+            return
+
         self.pack_textures(texture_width=texture_width, texture_height=texture_height,
-                            char_spacing=char_spacing, texture_margin=texture_margin)
+                            char_spacing=char_spacing, texture_margin=texture_margin,
+                            trim_last_page=auto_texture_size)
         self.generate_glyphs_data(texture_name_base=output_name, texture_format=format)
+        if self.usage_corpus:
+            self.report_page_switches(texture_width, texture_height, char_spacing, texture_margin)
 
         if self.max_workers > 1:
-            try:
-                self.save_textures_parallel(texture_name_base=output_name, texture_format=format)
-            except Exception as e:
-                if developer_mode:
-                    print(f"Parallel acceleration failed, switch to default mode\n{e}")
-                self.save_textures(texture_name_base=output_name, texture_format=format)
+            self.save_textures_parallel(texture_name_base=output_name, texture_format=format,
+                                        texture_mode=texture_mode, manifest=self.manifest)
         else:
-            self.save_textures(texture_name_base=output_name, texture_format=format)
+            self.save_textures(texture_name_base=output_name, texture_format=format, texture_mode=texture_mode,
+                                manifest=self.manifest)
 
         if save_fnt:
             # generate .fnt data file
-            fnt_path = os.path.join(self.output_dir, f"{output_name}.fnt")
-            self.save_fnt_file(filepath=fnt_path, texture_name_base=output_name)
+            self.save_fnt_file(filepath=fnt_path, texture_name_base=output_name, texture_mode=texture_mode,
+                                manifest=self.manifest)
+        self.manifest.save()
+        print(f"{len(self.manifest.changed)} files written, {len(self.manifest.unchanged)} unchanged")
 
         print(f"Generation completed! Created {len(self.textures)} {format.upper()} files and 1 FNT file")
 
 
+def _get_texture_source(texture: Texture, format: str, texture_mode: str) -> str:
+    """
+    :return: hash of everything the page is encoded from, the size, format and mode, and every glyph image
+        with its position
+    """
+    source = hashlib.blake2b(digest_size=16)
+    source.update(f"{format} {texture_mode} {texture.width}x{texture.height}".encode('utf-8'))
+    for ttf_glyph in texture.ttf_glyphs:
+        if ttf_glyph.image:
+            image = ttf_glyph.image
+            source.update(f";{ttf_glyph.x},{ttf_glyph.y} {image.mode} {image.width}x{image.height}".encode('utf-8'))
+            source.update(image.tobytes())
+
+    return source.hexdigest()
+
+
+def _get_font_stamp(mtable: MultiTable) -> Tuple[int, int]:
+    """
+    :return: modification time and size of the font file, (0, 0) if it can't be read
+    """
+    try:
+        stat = os.stat(_get_font_file_path(mtable))
+    except OSError:
+        return 0, 0
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _contains(sorted_codepoints: np.ndarray, codepoints: np.ndarray) -> np.ndarray:
+    """
+    :return: for every codepoint, if it's in sorted_codepoints, by binary search
+    """
+    if len(sorted_codepoints) == 0:
+        return np.zeros(len(codepoints), dtype=bool)
+
+    positions = np.searchsorted(sorted_codepoints, codepoints)
+    return sorted_codepoints[np.minimum(positions, len(sorted_codepoints) - 1)] == codepoints
+
+
+def _get_font_file_path(mtable: MultiTable) -> str:
+    """
+    path of the file the font was actually loaded from, it may be found in the system fonts directory
+    """
+    reader = getattr(mtable.ttfont, "reader", None)
+    font_file = getattr(reader, "file", None)
+    return getattr(font_file, "name", mtable.ttf_path)
+
+
+def _rasterize_mask(font_pil: ImageFont.FreeTypeFont, char: str) -> Tuple[Image.Image, Tuple[int, int, int, int]]:
+    """
+    Rasterize the coverage of a glyph in one FreeType call, without drawing it on an RGBA image.
+    :return: "L" mask, same pixels as the alpha of the glyph drawn by ImageDraw.text(), and bbox like getbbox()
+    """
+    core, (x_offset, y_offset) = font_pil.getmask2(char, mode="L")
+    mask = Image.frombytes("L", core.size, bytes(core))
+    if char == '\n':
+        # ImageDraw.text() lays out a line feed as a line break and draws nothing in the box
+        mask = Image.new("L", mask.size, 0)
+    return mask, (x_offset, y_offset, x_offset + mask.width, y_offset + mask.height)
+
+
+def _glyph_alpha(image: Image.Image) -> Image.Image:
+    """
+    :return: coverage of an RGBA glyph image or of an "L" mask
+    """
+    return image if image.mode == "L" else image.getchannel("A")
+
+
+# coverage -> color channel of a white glyph, drawn pixels are white, transparent pixels are black
+_MASK_COLOR_LUT: List[int] = [0] + [255] * 255
+
+
+def _glyph_rgba(image: Image.Image) -> Image.Image:
+    """
+    :return: "RGBA" image of a glyph, an "L" mask becomes white text like ImageDraw.text() draws it
+    """
+    if image.mode != "L":
+        return image if image.mode == "RGBA" else image.convert("RGBA")
+
+    color = image.point(_MASK_COLOR_LUT)
+    return Image.merge("RGBA", (color, color, color, image))
+
+
+def _load_font_page(texture_dir: str, shader_name: str) -> Optional[np.ndarray]:
+    """
+    :return: RGBA pixels of the page, None if it's not found
+    """
+    basename = os.path.basename(shader_name)
+    stem = os.path.splitext(basename)[0]
+    for filename in (basename, stem + ".tga", stem + ".png"):
+        filepath = os.path.join(texture_dir, filename)
+        if os.path.exists(filepath):
+            with Image.open(filepath) as image:
+                if image.mode == "L":
+                    # 8-bit pages of texture mode "alpha" store the coverage of white glyphs
+                    alpha = np.asarray(image)
+                    pixels = np.zeros((image.height, image.width, 4), dtype=np.uint8)
+                    pixels[alpha > 0, :3] = 255
+                    pixels[..., 3] = alpha
+                    return pixels
+                return np.asarray(image.convert("RGBA"))
+
+    return None
+
+
+def _glyph_distance_field(image: Image.Image, bbox: Tuple, spread: int,
+                            supersample: int) -> Tuple[Image.Image, Tuple[int, int, int, int]]:
+    """
+    Signed distance field of a glyph rendered at supersample times the target size.
+    bbox is the position of the image relative to the text origin, in supersampled pixels.
+    :return: RGBA image at the target size with the field in alpha, its bbox padded by spread
+    """
+    x0, y0 = int(bbox[0]), int(bbox[1])
+    width, height = image.size
+
+    # target pixels covering the glyph plus the spread, aligned to whole supersampled blocks
+    out_x0, out_y0 = math.floor(x0 / supersample) - spread, math.floor(y0 / supersample) - spread
+    out_x1 = math.ceil((x0 + width) / supersample) + spread
+    out_y1 = math.ceil((y0 + height) / supersample) + spread
+    out_width, out_height = out_x1 - out_x0, out_y1 - out_y0
+
+    mask = np.zeros((out_height * supersample, out_width * supersample), dtype=bool)
+    if width > 0 and height > 0:
+        offset_x, offset_y = x0 - out_x0 * supersample, y0 - out_y0 * supersample
+        mask[offset_y:offset_y + height, offset_x:offset_x + width] = np.asarray(_glyph_alpha(image)) >= 128
+
+    # distance in target pixels, averaged over every supersampled block
+    distance = _signed_distance(mask, spread * supersample) / supersample
+    distance = distance.reshape(out_height, supersample, out_width, supersample).mean(axis=(1, 3))
+
+    alpha = np.clip(np.rint(127.5 + distance * (127.5 / max(1, spread))), 0, 255).astype(np.uint8)
+    field = np.empty((out_height, out_width, 4), dtype=np.uint8)
+    field[..., :3] = 255
+    field[..., 3] = alpha
+    return Image.fromarray(field, "RGBA"), (out_x0, out_y0, out_x1, out_y1)
+
+
+def _signed_distance(mask: np.ndarray, radius: int) -> np.ndarray:
+    """
+    Euclidean distance from every pixel center to the outline of mask, positive inside, clamped to +-radius.
+    Separable transform (column pass, then row pass over squared distances), every pass is vectorized
+    over the whole image and only looks `radius` pixels away, which keeps it exact up to the clamp.
+    """
+    height, width = mask.shape
+    far = np.float32(radius + 1)
+
+    # [0]: distance to the nearest pixel inside, [1]: distance to the nearest pixel outside
+    features = np.stack([mask, ~mask])
+
+    vertical = np.where(features, np.float32(0), far)
+    for d in range(1, min(radius, height - 1) + 1):
+        np.minimum(vertical[:, d:], np.where(features[:, :-d], np.float32(d), far), out=vertical[:, d:])
+        np.minimum(vertical[:, :-d], np.where(features[:, d:], np.float32(d), far), out=vertical[:, :-d])
+    vertical *= vertical
+
+    squared = vertical.copy()
+    for d in range(1, min(radius, width - 1) + 1):
+        np.minimum(squared[:, :, d:], vertical[:, :, :-d] + np.float32(d * d), out=squared[:, :, d:])
+        np.minimum(squared[:, :, :-d], vertical[:, :, d:] + np.float32(d * d), out=squared[:, :, :-d])
+
+    distance = np.sqrt(squared)
+    # the outline lies half a pixel between an inside and an outside pixel center
+    signed = np.where(mask, distance[1] - 0.5, 0.5 - distance[0])
+    return np.clip(signed, -radius, radius)
+
+
+def _area_downsample(image: Image.Image, bbox: Tuple[int, int, int, int], factor: float, ascent: int = 0,
+                        out_ascent: int = 0) -> Tuple[Image.Image, Tuple[int, int, int, int]]:
+    """
+    Scale a RGBA glyph image by factor with an exact area filter, every output pixel averages the source pixels
+    it covers, weighted by the covered area. bbox is the position of the image relative to the text origin.
+    The glyph is scaled around the baseline (ascent below the origin), which is then placed at out_ascent,
+    on a pixel edge like a native render places it.
+    :return: scaled image, scaled bbox on the integer pixel grid
+    """
+    x0, y0 = int(bbox[0]), int(bbox[1])
+    src_width, src_height = image.size
+    offset_y = out_ascent - ascent * factor
+
+    # the scaled bbox is snapped outward to whole pixels
+    out_x0, out_y0 = math.floor(x0 * factor), math.floor(y0 * factor + offset_y)
+    out_x1, out_y1 = math.ceil((x0 + src_width) * factor), math.ceil((y0 + src_height) * factor + offset_y)
+    out_width, out_height = max(0, out_x1 - out_x0), max(0, out_y1 - out_y0)
+    if out_width == 0 or out_height == 0 or src_width == 0 or src_height == 0:
+        return Image.new("RGBA", (out_width, out_height), (0, 0, 0, 0)), (out_x0, out_y0, out_x1, out_y1)
+
+    def area_weights(src_start: int, src_count: int, out_start: int, out_count: int,
+                        offset: float = 0.0) -> np.ndarray:
+        # overlap of output pixel i with source pixel j, measured in output pixels
+        src_edges = (src_start + np.arange(src_count + 1)) * factor + offset
+        out_edges = out_start + np.arange(out_count + 1, dtype=np.float64)
+        low = np.maximum(out_edges[:-1, None], src_edges[None, :-1])
+        high = np.minimum(out_edges[1:, None], src_edges[None, 1:])
+        return np.clip(high - low, 0.0, None)
+
+    weights_x = area_weights(x0, src_width, out_x0, out_width)      # (out_width, src_width)
+    weights_y = area_weights(y0, src_height, out_y0, out_height, offset_y)    # (out_height, src_height)
+
+    # premultiplied alpha, so transparent pixels don't darken the edges
+    data = np.asarray(_glyph_rgba(image), dtype=np.float64)
+    alpha = data[..., 3:4] / 255.0
+    premultiplied = np.concatenate([data[..., :3] * alpha, data[..., 3:4]], axis=2)
+
+    scaled = np.einsum('ij,jkc,lk->ilc', weights_y, premultiplied, weights_x, optimize=True)
+    scaled_alpha = scaled[..., 3:4]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        color = np.where(scaled_alpha > 0, scaled[..., :3] * 255.0 / scaled_alpha, 0.0)
+
+    result = np.concatenate([color, scaled_alpha], axis=2)
+    result = np.clip(np.rint(result), 0, 255).astype(np.uint8)
+
+    return Image.fromarray(result, "RGBA"), (out_x0, out_y0, out_x1, out_y1)
+
+
+def _next_power_of_two(value: int) -> int:
+    return 1 << max(0, int(value) - 1).bit_length()
+
+
 # example
 if __name__ == "__main__":
     # the meaning of font_size is not quite the same as in rtcw
@@ -712,6 +2294,6 @@ if __name__ == "__main__":
         ]
     ]
 
-    generator = FontImageMulti(table, default_font_size=36, output_dir="./output", max_glyphs=65536)
-    generator.generate("fontImage_utf8_1", save_fnt=True, texture_width=2048, texture_height=2048,
-                        texture_format="png", max_workers=8, developer_mode=False)
+    with FontImageMulti(table, default_font_size=36, output_dir="./output", max_glyphs=65536) as generator:
+        generator.generate("fontImage_utf8_1", save_fnt=True, texture_width=2048, texture_height=2048,
+                            texture_format="png", max_workers=8, developer_mode=False)
@@ -1,6 +1,7 @@
-from typing import Tuple, List, Set, Dict, Optional, TYPE_CHECKING
+from typing import Tuple, List, Dict, Optional, TYPE_CHECKING
 
 if TYPE_CHECKING:
+    import numpy as np
     from PIL import Image
     from fontTools.ttLib import TTFont
 
@@ -21,6 +22,30 @@ PER_GLYPH_UNIC_DATA_SIZE = 4 * 13 + MAX_SHADER_NAME     # per unicode Glyph data
 GLYPHS_PER_FONT = 256       # Note: set 256 for default RTCW
 SYS_FONTS_DIR = "C:/Windows/Fonts"
 
+# automatic render backend selection, see FontImageMulti.select_render_backend()
+RENDER_SERIAL_SECONDS = 0.5             # estimated render time below which a pool doesn't pay off
+RENDER_PROCESS_STARTUP_SECONDS = 1.0    # rough cost of spawning worker processes and pickling tasks
+RENDER_THREAD_SPEEDUP = 2.0             # FreeType/Pillow only release the GIL in parts of the rendering
+RENDER_CHUNKS_PER_WORKER = 4            # adaptive chunks per worker, smaller chunks balance stragglers
+RENDER_MIN_CHUNK_GLYPHS = 32            # each chunk loads the font once, don't make chunks too small
+PRESUBSET_MIN_FILE_SIZE = 1 << 20       # smaller font files load fast enough without subsetting
+PRESUBSET_MAX_GLYPHS_RATIO = 0.5        # only subset when workers render less than this part of the glyphs
+
+# texture page pixel formats, see FontImageMulti.generate()
+TEXTURE_MODES: Tuple[str, ...] = ("rgba", "alpha", "la")
+TEXTURE_MODE_BYTES: Dict[str, int] = {"rgba": 4, "alpha": 1, "la": 2}      # per texel, uploaded as is
+
+# glyph rasterizers, see FontImageMulti.generate()
+RASTERIZERS: Tuple[str, ...] = ("draw", "mask")
+
+# "{output_name}.manifest.json", content hashes of the files written by a build
+MANIFEST_SUFFIX = ".manifest.json"
+
+# "{dat file}.journal", old bytes of the records being patched in place, see RF_Utils.patch_in_place()
+PATCH_JOURNAL_SUFFIX = ".journal"
+
+WATCH_POLL_SECONDS = 1.0        # interval between two checks of the build config and font files in watch mode
+
 
 class Glyph:
     def __init__(self):
@@ -55,6 +80,9 @@ class TTFGlyph:
         self.image: Optional[Image.Image] = None    # PIL.Image from pillow
         self.bbox: Tuple[float, float, float, float] = (0, 0, 0, 0)
         self.texture_index: int = 0
+        self.duplicate_of: Optional[TTFGlyph] = None    # share the atlas region of another glyph
+        self.padding: int = 0    # empty border around the glyph outline, e.g. the spread of a distance field
+        self.source_glyph: Optional[Glyph] = None     # imported from an existing font, its metrics are kept
 
 
 class Texture:
@@ -71,5 +99,10 @@ class MultiTable:
         self.font_size: int = 0
         self.char_ranges: List[Tuple[int, int]] = []
         self.ttfont: Optional[TTFont] = None
-        self.available_chars: List[str] = []
-        self.selected_chars: Set[int] = set()
+        self.font_stamp: Tuple[int, int] = (0, 0)     # modification time and size of the font file when loaded
+        self.reserve_base_chars: bool = True    # as first font, render the 256 base characters outside its ranges
+        # sorted int64 codepoint arrays, NumPy is loaded by the generator
+        self.available_codepoints: Optional["np.ndarray"] = None   # in the cmap, plus the 256 base characters
+        self.selected_codepoints: Optional["np.ndarray"] = None    # empty: every available character
+        self.glyph_names: Dict[int, str] = {}       # codepoint -> glyph id in the font
+        self.render_path: str = ""      # subset of the font loaded by the render workers, see presubset
@@ -0,0 +1,377 @@
+"""
+    RF_Utils.py
+    Shared file and process helpers used by the font data and image generators.
+"""
+
+
+from typing import Tuple, List, Dict, Callable, Optional, Union, Any
+import os
+import json
+import math
+import queue
+import struct
+import hashlib
+import tempfile
+import threading
+import time
+
+from RF_Set import PATCH_JOURNAL_SUFFIX
+
+
+def atomic_write(filepath: str, data: Union[bytes, bytearray, memoryview]) -> None:
+    """
+    Write data to a temporary file in the same directory, then rename it over filepath,
+    so readers never see a half-written file.
+    """
+    dirname = os.path.dirname(os.path.abspath(filepath))
+    os.makedirs(dirname, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix="_" + os.path.basename(filepath), dir=dirname)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_if_changed(filepath: str, data: Union[bytes, bytearray, memoryview],
+                        expected: Optional[Dict[str, Any]] = None, source: str = "") -> Tuple[bool, Dict[str, Any]]:
+    """
+    atomic_write() only if the content of filepath differs from data, an unchanged file keeps its modification time.
+    :param expected: manifest entry of the file from the last build, the existing file is not read again
+        if its size and modification time still match the entry
+    :param source: hash of what data was generated from, kept in the entry, see matches_source()
+    :return: whether the file was written, manifest entry of the file: "sha256", "size", "mtime_ns" (and "source")
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    written = True
+
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        stat = None
+
+    if stat is not None and stat.st_size == len(data):
+        if expected and expected.get("sha256") == digest and expected.get("size") == stat.st_size and \
+                expected.get("mtime_ns") == stat.st_mtime_ns:
+            written = False
+        else:
+            with open(filepath, 'rb') as f:
+                written = hashlib.sha256(f.read()).hexdigest() != digest
+
+    if written:
+        atomic_write(filepath, data)
+        stat = os.stat(filepath)
+
+    entry = {"sha256": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if source:
+        entry["source"] = source
+    return written, entry
+
+
+def matches_source(filepath: str, expected: Optional[Dict[str, Any]], source: str) -> bool:
+    """
+    :return: whether the last build generated the file from the same source and it's still on disk as written,
+        then it doesn't need to be generated (e.g. encoded) again
+    """
+    if not source or not expected or expected.get("source") != source:
+        return False
+
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return False
+    return expected.get("size") == stat.st_size and expected.get("mtime_ns") == stat.st_mtime_ns
+
+
+def patch_in_place(filepath: str, patches: List[Tuple[int, bytes]]) -> None:
+    """
+    Overwrite the given (offset, data) regions of filepath in place, only the patched bytes are written.
+    The old bytes are saved to "{filepath}.journal" first, so a crash in the middle is rolled back
+    by recover_patch() and leaves either the old or the new file.
+    """
+    recover_patch(filepath)
+
+    journal = bytearray()
+    with open(filepath, 'r+b') as f:
+        for offset, data in patches:
+            f.seek(offset)
+            old_data = f.read(len(data))
+            if len(old_data) != len(data):
+                raise ValueError(f"[Error] patch at {offset} is out of \"{filepath}\"")
+            journal += struct.pack('<qi', offset, len(old_data)) + old_data
+
+        # the journal is complete before the file is touched
+        atomic_write(filepath + PATCH_JOURNAL_SUFFIX, journal)
+
+        for offset, data in patches:
+            f.seek(offset)
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.remove(filepath + PATCH_JOURNAL_SUFFIX)
+
+
+def recover_patch(filepath: str) -> bool:
+    """
+    Roll back a patch_in_place() interrupted by a crash, restore the old bytes saved in its journal.
+    :return: whether a journal was found
+    """
+    journal_path = filepath + PATCH_JOURNAL_SUFFIX
+    if not os.path.exists(journal_path):
+        return False
+    if not os.path.exists(filepath):
+        os.remove(journal_path)
+        return False
+
+    with open(journal_path, 'rb') as f:
+        journal = f.read()
+    with open(filepath, 'r+b') as f:
+        pos = 0
+        while pos < len(journal):
+            offset, size = struct.unpack_from('<qi', journal, pos)
+            pos += struct.calcsize('<qi')
+            f.seek(offset)
+            f.write(journal[pos:pos + size])
+            pos += size
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.remove(journal_path)
+    print(f"[Warning] \"{filepath}\" was not completely patched, restored the previous content")
+    return True
+
+
+class BuildManifest:
+    """
+    Content hashes of the files written by one build, saved as JSON next to them. Unchanged files are not
+    rewritten, and later steps (pk3 packaging, uploads) can read which files changed since the last build.
+    Thread safe, files may be written by AsyncWriter threads.
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath: str = filepath
+        self.previous: Dict[str, Dict[str, Any]] = {}   # entries of the last build, relative path -> entry
+        self.files: Dict[str, Dict[str, Any]] = {}      # entries of this build
+        self.changed: List[str] = []                    # written by this build, new or different content
+
+        self._lock = threading.Lock()
+        self._startup()
+
+    def _startup(self) -> None:
+        if not os.path.exists(self.filepath):
+            return
+
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                self.previous = json.load(f).get("files", {})
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"[Warning] couldn't read build manifest \"{self.filepath}\": {e}, every file is compared again")
+            self.previous = {}
+
+    def _key(self, filepath: str) -> str:
+        manifest_dir = os.path.dirname(os.path.abspath(self.filepath))
+        return os.path.relpath(os.path.abspath(filepath), manifest_dir).replace('\\', '/')
+
+    def expected(self, filepath: str) -> Optional[Dict[str, Any]]:
+        return self.previous.get(self._key(filepath))
+
+    def write(self, filepath: str, data: Union[bytes, bytearray, memoryview], source: str = "") -> bool:
+        """
+        write_if_changed() and record the file
+        :return: whether the file was written
+        """
+        written, entry = write_if_changed(filepath, data, self.expected(filepath), source)
+        self.record(filepath, written, entry)
+        return written
+
+    def reuse(self, filepath: str, source: str) -> bool:
+        """
+        record the file of the last build as unchanged if it was generated from the same source, see matches_source()
+        :return: whether the file was reused, otherwise it has to be generated and written
+        """
+        expected = self.expected(filepath)
+        if not matches_source(filepath, expected, source):
+            return False
+
+        self.record(filepath, False, expected)
+        return True
+
+    def record(self, filepath: str, written: bool, entry: Dict[str, Any]) -> None:
+        """
+        record a file written by write_if_changed() somewhere else, e.g. in a worker process
+        """
+        key = self._key(filepath)
+        with self._lock:
+            self.files[key] = entry
+            if written and key not in self.changed:
+                self.changed.append(key)
+
+    def discard(self, filepath: str) -> None:
+        """
+        forget an intermediate file removed by the build
+        """
+        key = self._key(filepath)
+        with self._lock:
+            self.files.pop(key, None)
+            if key in self.changed:
+                self.changed.remove(key)
+
+    @property
+    def unchanged(self) -> List[str]:
+        return [key for key in self.files if key not in self.changed]
+
+    @property
+    def removed(self) -> List[str]:
+        # written by the last build but not by this one, e.g. a page that is no longer needed
+        return [key for key in self.previous if key not in self.files]
+
+    def save(self) -> None:
+        with self._lock:
+            manifest = {
+                "files": dict(sorted(self.files.items())),
+                "changed": sorted(self.changed),
+                "removed": sorted(key for key in self.previous if key not in self.files),
+            }
+        write_if_changed(self.filepath, json.dumps(manifest, indent=1).encode('utf-8'))
+
+
+class AsyncWriter:
+    """
+    Background writer stage, encode and write files in worker threads while the caller keeps working.
+    Jobs are queued in a bounded queue, so the caller blocks when the writer falls behind.
+    Every file is written with write_if_changed(), and recorded in the manifest if given.
+    """
+
+    def __init__(self, max_queue: int = 4, threads: int = 1, manifest: Optional[BuildManifest] = None):
+        self.busy_time: float = 0.0     # time spent by the worker threads on encoding and writing
+        self.wait_time: float = 0.0     # time the caller was blocked by the writer
+        self.written_count: int = 0
+        self.unchanged_count: int = 0   # encoded content equal to the existing file, not written
+        self.manifest: Optional[BuildManifest] = manifest
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, max_queue))
+        self._lock = threading.Lock()
+        self._errors: List[BaseException] = []
+        self._threads: List[threading.Thread] = []
+        self._threads_count: int = max(1, threads)
+
+        for i in range(self._threads_count):
+            thread = threading.Thread(target=self._run, name=f"AsyncWriter-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, filepath: str, encode: Callable[[], bytes], source: str = "") -> None:
+        """
+        :param encode: called in the writer thread, returns the file content
+        :param source: hash of what the file is encoded from, encode is not called if the manifest can reuse the file
+        """
+        start = time.perf_counter()
+        self._queue.put((filepath, encode, source))
+        self.wait_time += time.perf_counter() - start
+
+    def close(self) -> None:
+        """
+        wait until all queued files are written, raise the first error of the writer
+        """
+        start = time.perf_counter()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.wait_time += time.perf_counter() - start
+
+        if self._errors:
+            raise self._errors[0]
+
+    @property
+    def hidden_time(self) -> float:
+        # writer threads run in parallel, so the hidden time is at most the elapsed busy time
+        return max(0.0, self.busy_time / max(1, self._threads_count) - self.wait_time)
+
+    def __enter__(self) -> "AsyncWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+
+            filepath, encode, source = job
+            start = time.perf_counter()
+            try:
+                if self.manifest is not None:
+                    written = not self.manifest.reuse(filepath, source) and \
+                                self.manifest.write(filepath, encode(), source)
+                else:
+                    written, _ = write_if_changed(filepath, encode())
+                with self._lock:
+                    if written:
+                        self.written_count += 1
+                    else:
+                        self.unchanged_count += 1
+            except BaseException as e:
+                with self._lock:
+                    self._errors.append(e)
+            finally:
+                with self._lock:
+                    self.busy_time += time.perf_counter() - start
+
+
+def available_cpu_count() -> int:
+    """
+    CPUs this process may actually use, respecting the CPU affinity and cgroup (container) CPU quotas,
+    unlike os.cpu_count() which returns all CPUs of the machine.
+    """
+    count = os.cpu_count() or 1
+
+    if hasattr(os, "sched_getaffinity"):
+        try:
+            count = min(count, len(os.sched_getaffinity(0)))
+        except OSError:
+            pass
+
+    quota = _read_cgroup_cpu_quota()
+    if quota > 0:
+        count = min(count, max(1, math.ceil(quota)))
+
+    return max(1, count)
+
+
+def _read_cgroup_cpu_quota() -> float:
+    """
+    :return: CPU quota in number of CPUs, -1 if there is no quota
+    """
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    try:
+        with open("/sys/fs/cgroup/cpu.max", 'r') as f:
+            values = f.read().split()
+        if len(values) == 2 and values[0] != "max":
+            return int(values[0]) / int(values[1])
+        return -1
+    except (OSError, ValueError):
+        pass
+
+    # cgroup v1
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", 'r') as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", 'r') as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+
+    return -1
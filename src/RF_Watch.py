@@ -0,0 +1,275 @@
+"""
+    RF_Watch.py
+    Watch a build config and its font files, rebuild only what changed while tuning sizes and ranges.
+"""
+
+
+from typing import Tuple, List, Dict, Optional, Any
+import os
+import json
+import time
+import traceback
+
+from RF_Set import GLYPHS_PER_FONT, WATCH_POLL_SECONDS
+from RF_FontData import FontData
+from RF_FontImageMulti import FontImageMulti, _get_font_file_path
+from RF_WorkerPool import WorkerPool
+
+
+# JSON build config, "table" is the corresponding table of FontImageMulti, codepoints may be written
+# as "0x0590" strings, e.g. [["./test/ttf/MSUIGHUB.TTF", [["0x0590", "0x06FF"]], 42]]
+BUILD_CONFIG_DEFAULTS: Dict[str, Any] = {
+    "table": [],
+    "output_dir": "./output",
+    "output_name": "fontImage",
+    "default_font_size": 36,
+    "texture_size": 2048,
+    "texture_format": "png",
+    "texture_mode": "rgba",
+    "rasterizer": "draw",
+    "max_glyphs": GLYPHS_PER_FONT,
+    "char_margin": 2,
+    "char_spacing": 2,
+    "texture_margin": 8,
+    "save_dat": True,
+}
+
+
+def load_build_config(filepath: str) -> Dict[str, Any]:
+    """
+    :return: the config with the defaults of the missing settings, codepoints of the table as int
+    """
+    with open(filepath, 'r', encoding='utf-8') as f:
+        loaded = json.load(f)
+    if not isinstance(loaded, dict):
+        raise ValueError("the build config must be a JSON object")
+
+    unknown = [key for key in loaded if key not in BUILD_CONFIG_DEFAULTS]
+    if unknown:
+        print(f"[Warning] unknown settings in \"{filepath}\": {', '.join(unknown)}, ignored")
+
+    config = dict(BUILD_CONFIG_DEFAULTS)
+    config.update({key: value for key, value in loaded.items() if key in BUILD_CONFIG_DEFAULTS})
+
+    table = []
+    for entry in config["table"]:
+        entry = list(entry)
+        if len(entry) >= 2:
+            entry[1] = [(_parse_codepoint(char_range[0]), _parse_codepoint(char_range[-1])) for char_range in entry[1]]
+        table.append(entry)
+    config["table"] = table
+
+    return config
+
+
+def save_build_config(filepath: str, config: Dict[str, Any]) -> None:
+    """
+    write a build config, the ranges of the table are written as hexadecimal strings
+    """
+    config = dict(config)
+    table = []
+    for entry in config.get("table", []):
+        entry = list(entry)
+        if len(entry) >= 2:
+            entry[1] = [[f"0x{char_range[0]:04X}", f"0x{char_range[-1]:04X}"] for char_range in entry[1]]
+        table.append(entry)
+    config["table"] = table
+
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=4)
+
+
+def _parse_codepoint(value: Any) -> int:
+    return int(value, 0) if isinstance(value, str) else int(value)
+
+
+def describe_changes(old_config: Dict[str, Any], new_config: Dict[str, Any]) -> List[str]:
+    """
+    :return: one line per changed setting or table entry
+    """
+    changes: List[str] = []
+    for key in BUILD_CONFIG_DEFAULTS:
+        if key != "table" and old_config.get(key) != new_config.get(key):
+            changes.append(f"{key}: {old_config.get(key)} -> {new_config.get(key)}")
+
+    old_table, new_table = old_config.get("table", []), new_config.get("table", [])
+    for index in range(max(len(old_table), len(new_table))):
+        if index >= len(old_table):
+            changes.append(f"table entry {index} added: \"{new_table[index][0]}\"")
+            continue
+        if index >= len(new_table):
+            changes.append(f"table entry {index} removed: \"{old_table[index][0]}\"")
+            continue
+
+        old_entry, new_entry = old_table[index], new_table[index]
+        if old_entry[0] != new_entry[0]:
+            changes.append(f"table entry {index} font: \"{old_entry[0]}\" -> \"{new_entry[0]}\"")
+        if old_entry[1:2] != new_entry[1:2]:
+            changes.append(f"table entry {index} \"{new_entry[0]}\" ranges changed")
+        if old_entry[2:3] != new_entry[2:3]:
+            old_size = old_entry[2] if len(old_entry) >= 3 else "default"
+            new_size = new_entry[2] if len(new_entry) >= 3 else "default"
+            changes.append(f"table entry {index} \"{new_entry[0]}\" size: {old_size} -> {new_size}")
+
+    return changes
+
+
+def _get_file_stamp(filepath: str) -> Tuple[int, int]:
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return 0, 0
+    return stat.st_mtime_ns, stat.st_size
+
+
+class BuildWatcher:
+    """
+    Poll a JSON build config and the font files of its table, and rebuild the font when one of them changes.
+    The generator, its worker pool (with the fonts loaded by the workers), the parsed fonts and the rendered
+    glyphs are kept between builds: only the glyphs of changed fonts, sizes and ranges are rendered again,
+    and the pages, FNT and DAT files with the same content are not rewritten.
+    Stop it with Ctrl+C, call close() or use "with" to shut the pool down.
+    """
+
+    def __init__(self, config_path: str, max_workers: int = 0, poll_interval: float = WATCH_POLL_SECONDS):
+        """
+        :param max_workers: set 0 to use all available CPUs
+        """
+        self.config_path: str = config_path
+        self.poll_interval: float = poll_interval
+        self.config: Dict[str, Any] = {}        # config of the last build
+        self.generator: Optional[FontImageMulti] = None
+        self.pool: WorkerPool = WorkerPool(max_workers=max_workers)
+        self.builds_count: int = 0
+
+        self._stamps: Dict[str, Tuple[int, int]] = {}     # watched file -> modification time and size
+        self._generator_key: Tuple = ()
+
+    def close(self) -> None:
+        if self.generator is not None:
+            self.generator.close()
+            self.generator = None
+        self.pool.shutdown()
+
+    def __enter__(self) -> "BuildWatcher":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def watch(self, max_builds: int = 0) -> None:
+        """
+        build, then poll until interrupted
+        :param max_builds: stop after this many builds, 0: never
+        """
+        print(f"Watching \"{self.config_path}\" and its fonts, press Ctrl+C to stop...")
+        try:
+            while True:
+                if self.poll():
+                    print("Waiting for changes...")
+                    if 0 < max_builds <= self.builds_count:
+                        break
+                time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            print("Watch stopped")
+
+    def poll(self) -> bool:
+        """
+        :return: whether a build was run
+        """
+        stamps = {filepath: _get_file_stamp(filepath) for filepath in self._stamps}
+        stamps[self.config_path] = _get_file_stamp(self.config_path)
+        if stamps == self._stamps:
+            return False
+        changed_files = [filepath for filepath, stamp in stamps.items()
+                            if filepath != self.config_path and self._stamps.get(filepath) != stamp]
+        self._stamps = stamps
+
+        try:
+            config = load_build_config(self.config_path)
+        except (OSError, ValueError) as e:
+            print(f"[Error] couldn't read build config \"{self.config_path}\": {e}, waiting for the next change")
+            return False
+
+        changes = [f"font file changed: \"{filepath}\"" for filepath in changed_files]
+        if self.config:
+            changes += describe_changes(self.config, config)
+            if not changes:
+                return False
+            print("Changes since the last build:\n\t" + "\n\t".join(changes))
+
+        self.build(config)
+        return True
+
+    def build(self, config: Dict[str, Any]) -> bool:
+        """
+        :return: whether the build succeeded, a failed build is retried after the next change
+        """
+        start = time.perf_counter()
+        self.config = config
+        self.builds_count += 1
+        output_dir, output_name = config["output_dir"], config["output_name"]
+
+        # watch the fonts of this table only, a missing font is built as soon as it's added
+        self._stamps = {self.config_path: self._stamps.get(self.config_path, _get_file_stamp(self.config_path))}
+        for entry in config["table"]:
+            if entry:
+                self._stamps[entry[0]] = _get_file_stamp(entry[0])
+
+        try:
+            generator_key = (config["default_font_size"], output_dir, config["max_glyphs"])
+            if self.generator is None or generator_key != self._generator_key:
+                # the rendered glyphs don't depend on these settings, keep them
+                render_cache = self.generator.render_cache if self.generator is not None else {}
+                self.generator = FontImageMulti(
+                    corresponding_table=config["table"],
+                    default_font_size=config["default_font_size"],
+                    output_dir=output_dir,
+                    max_glyphs=config["max_glyphs"],
+                    pool=self.pool
+                )
+                self.generator.render_cache = render_cache
+                self._generator_key = generator_key
+            else:
+                # fonts of unchanged files are not parsed again
+                self.generator.set_corresponding_table(config["table"])
+
+            for mtable in self.generator.multi_table:
+                font_path = _get_font_file_path(mtable)
+                self._stamps[font_path] = _get_file_stamp(font_path)
+
+            self.generator.generate(
+                output_name=output_name,
+                texture_width=config["texture_size"],
+                texture_height=config["texture_size"],
+                char_margin=config["char_margin"],
+                char_spacing=config["char_spacing"],
+                texture_margin=config["texture_margin"],
+                texture_format=config["texture_format"],
+                texture_mode=config["texture_mode"],
+                rasterizer=config["rasterizer"],
+                max_workers=self.pool.max_workers
+            )
+
+            manifest = self.generator.manifest
+            if config["save_dat"]:
+                fontinfo = FontData(
+                    file_path=os.path.join(output_dir, f"{output_name}.fnt"),
+                    output_dir=output_dir,
+                    max_glyphs=config["max_glyphs"],
+                    verbose=False
+                )
+                fontinfo.write_dat(manifest=manifest)
+                manifest.save()
+        except Exception:
+            print(f"[Error] build failed, fix the config or the fonts to build again:\n{traceback.format_exc()}")
+            return False
+
+        print(f"Build {self.builds_count} finished in {time.perf_counter() - start:.2f}s, "
+              f"{len(manifest.changed)} files written, {len(manifest.unchanged)} unchanged")
+        return True
+
+
+def watch_build(config_path: str, max_workers: int = 0, poll_interval: float = WATCH_POLL_SECONDS) -> None:
+    with BuildWatcher(config_path, max_workers=max_workers, poll_interval=poll_interval) as watcher:
+        watcher.watch()
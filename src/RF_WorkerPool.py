@@ -0,0 +1,205 @@
+"""
+    RF_WorkerPool.py
+    Persistent worker pool shared by rendering, encoding and conversion stages.
+"""
+
+
+from typing import Tuple, List, Dict, Optional, Callable, Iterator, Any, TYPE_CHECKING
+import os
+import io
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from RF_Utils import available_cpu_count
+
+if TYPE_CHECKING:
+    # Pillow is loaded by the first load_font() call, conversion-only pools never import it
+    from PIL import ImageFont
+
+
+class WorkerPool:
+    """
+    Keep process and thread executors alive for the lifetime of a generator or a multi-build session,
+    so worker processes start (and import modules) only once and keep their font caches warm.
+    Shut it down explicitly with shutdown(), or use it as a context manager.
+    Thread safe, executors may be requested and replaced from several threads, e.g. AsyncWriter threads.
+    """
+
+    def __init__(self, max_workers: int = 0):
+        """
+        :param max_workers: set 0 to use all available CPUs
+        """
+        cpu_count = available_cpu_count()
+        self.max_workers: int = min(max_workers, cpu_count) if max_workers > 0 else cpu_count
+
+        self._process_executor: Optional[ProcessPoolExecutor] = None
+        self._thread_executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()       # guards creating and replacing the executors
+
+    def get_executor(self, backend: str = "process") -> Executor:
+        """
+        :param backend: "process" or "thread", executors are created on first use
+        """
+        with self._lock:
+            if backend == "thread":
+                if self._thread_executor is None:
+                    self._thread_executor = ThreadPoolExecutor(max_workers=self.max_workers)
+                return self._thread_executor
+
+            if self._process_executor is None:
+                self._process_executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._process_executor
+
+    def submit(self, fn: Callable, *args: Any, backend: str = "process") -> Future:
+        executor = self.get_executor(backend)
+        try:
+            return executor.submit(fn, *args)
+        except (BrokenProcessPool, RuntimeError):
+            # broken, or replaced and shut down by another thread meanwhile
+            self.restart(backend, executor)
+            return self.get_executor(backend).submit(fn, *args)
+
+    def run_tasks(self, fn: Callable, tasks: List[Tuple], backend: str = "process", retries: int = 1,
+                    retry_serial: bool = True) -> Iterator[Tuple[int, Any, Optional[BaseException]]]:
+        """
+        Run fn(*task) for every task, yield (task index, result, error) as tasks complete.
+        A failed task is resubmitted up to `retries` times, then run serially in this process if retry_serial,
+        completed results are kept. A broken process pool is replaced before resubmitting.
+        error is None on success, otherwise the last exception of the task.
+        """
+        attempts: List[int] = [0] * len(tasks)
+        pending: List[int] = list(range(len(tasks)))
+
+        while pending:
+            futures: Dict[Future, int] = {}
+            executor = self.get_executor(backend)
+            try:
+                for task_index in pending:
+                    futures[executor.submit(fn, *tasks[task_index])] = task_index
+            except (BrokenProcessPool, RuntimeError):
+                # the pool broke (or was replaced by another thread) while submitting,
+                # wait for the submitted ones and resubmit the rest
+                pass
+
+            broken = False
+            failed: Dict[int, BaseException] = {}
+            for future in as_completed(futures):
+                task_index = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    broken = broken or isinstance(e, BrokenProcessPool)
+                    attempts[task_index] += 1
+                    failed[task_index] = e
+                    continue
+
+                yield task_index, result, None
+
+            submitted = set(futures.values())
+            if broken or len(submitted) < len(pending):
+                print("[Warning] worker pool is broken, restart it and resubmit the unfinished tasks...")
+                self.restart(backend, executor)
+
+            retry_tasks: List[int] = []
+            for task_index in pending:
+                if task_index not in submitted:
+                    retry_tasks.append(task_index)
+                    continue
+                if task_index not in failed:
+                    continue
+
+                error = failed[task_index]
+                if attempts[task_index] <= retries:
+                    print(f"[Warning] task {task_index} failed: {error}, retry...")
+                    retry_tasks.append(task_index)
+                elif retry_serial:
+                    print(f"[Warning] task {task_index} failed: {error}, retry in the main process...")
+                    try:
+                        yield task_index, fn(*tasks[task_index]), None
+                    except Exception as e:
+                        yield task_index, None, e
+                else:
+                    yield task_index, None, error
+
+            pending = retry_tasks
+
+    def restart(self, backend: str = "process", executor: Optional[Executor] = None) -> None:
+        """
+        drop the executor of the backend, a new one is created on next use
+        :param executor: the broken executor, if another thread already replaced it the new one is kept
+        """
+        with self._lock:
+            current = self._thread_executor if backend == "thread" else self._process_executor
+            if current is None or (executor is not None and current is not executor):
+                return
+            if backend == "thread":
+                self._thread_executor = None
+            else:
+                self._process_executor = None
+
+        current.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executors = [self._process_executor, self._thread_executor]
+            self._process_executor = None
+            self._thread_executor = None
+
+        # outside the lock, the workers may still be waited for
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=wait, cancel_futures=True)
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.shutdown()
+
+
+# per worker font cache, FreeType faces must not be shared between threads
+_font_cache = threading.local()
+
+
+# temporary fonts loaded in memory, the oldest ones are dropped from the cache
+MAX_CACHED_MEMORY_FONTS = 8
+
+
+def load_font(ttf_path: str, font_size: int, in_memory: bool = False) -> "ImageFont.FreeTypeFont":
+    """
+    ImageFont.truetype() with a cache living as long as the worker process or thread,
+    a font file modified since it was loaded (e.g. in watch mode) is loaded again
+    in_memory: read the whole file first, FreeType doesn't keep it open, so a temporary font file can be removed
+    """
+    from PIL import ImageFont
+
+    fonts: Optional[Dict[Tuple[str, int], Tuple[int, ImageFont.FreeTypeFont]]] = getattr(_font_cache, "fonts", None)
+    if fonts is None:
+        fonts = {}
+        _font_cache.fonts = fonts
+        _font_cache.memory_keys = []
+
+    try:
+        mtime = os.stat(ttf_path).st_mtime_ns
+    except OSError:
+        # not a path, Pillow also searches the system fonts directory
+        mtime = 0
+
+    key = (ttf_path, font_size)
+    cached = fonts.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    if in_memory:
+        with open(ttf_path, 'rb') as f:
+            font_pil = ImageFont.truetype(io.BytesIO(f.read()), font_size)
+        if key not in _font_cache.memory_keys:
+            _font_cache.memory_keys.append(key)
+        if len(_font_cache.memory_keys) > MAX_CACHED_MEMORY_FONTS:
+            fonts.pop(_font_cache.memory_keys.pop(0), None)
+    else:
+        font_pil = ImageFont.truetype(ttf_path, font_size)
+    fonts[key] = (mtime, font_pil)
+
+    return font_pil
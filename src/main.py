@@ -10,14 +10,15 @@ You may also need to modify RTCW code to support more fonts. For default RTCW, i
 """
 
 
+# only the standard library and RF_FontData are loaded at startup, the image generation modules pull in
+# NumPy, Pillow and fontTools, so they are imported by the functions using them
 from RF_FontData import FontData
-from RF_FontImage import FontImage
-from RF_FontImageMulti import FontImageMulti
+import os
 import traceback
 
 
-def generateImage():
-    # Generate TGA font textures and base FNT data file
+def getCorrespondingTable():
+    # shared by generateImage() and the first config of watchBuild()
     table = [
         # Chinese, CJK
         # as base template, if the specified font with the same code point is used later
@@ -50,24 +51,64 @@ def generateImage():
         #     32
         # ]
     ]
+    return table
+
+
+def generateImage():
+    from RF_FontImageMulti import FontImageMulti
+    from RF_Corpus import collect_codepoints
+    from RF_Coverage import analyze_coverage
+
+    # Generate TGA font textures and base FNT data file
+    table = getCorrespondingTable()
 
-    generator = FontImageMulti(
+    # the worker pool of the generator is shut down when leaving the "with" block
+    with FontImageMulti(
         corresponding_table=table,
         default_font_size=default_font_size,
         output_dir=output_dir,
         max_glyphs=max_glyphs
-    )
-    generator.generate(
-        output_name=output_name,
-        texture_width=texture_size,
-        texture_height=texture_size,
-        char_margin=2,
-        char_spacing=2,
-        texture_margin=8,
-        texture_format=texture_format,
-        max_workers=max_workers,
-        developer_mode=False
-    )
+    ) as generator:
+        if corpus_paths:
+            # only render the characters used by the localized strings of the game
+            generator.subset_chars(collect_codepoints(corpus_paths), always_include=always_include_ranges)
+        if show_coverage:
+            # covered, overridden and missing codepoints of every range, from the cmaps only
+            analyze_coverage(generator, fallback_dirs=fallback_font_dirs).show_info()
+        generator.generate(
+            output_name=output_name,
+            texture_width=texture_size,
+            texture_height=texture_size,
+            char_margin=2,
+            char_spacing=2,
+            texture_margin=8,
+            texture_format=texture_format,
+            texture_mode=texture_mode,
+            rasterizer=rasterizer,
+            max_workers=max_workers,
+            developer_mode=False
+        )
+
+
+def watchBuild():
+    from RF_Watch import watch_build, save_build_config
+
+    # rebuild whenever the config or a font changes, only the changed glyphs are rendered again
+    if not os.path.exists(watch_config):
+        save_build_config(watch_config, {
+            "table": getCorrespondingTable(),
+            "output_dir": output_dir,
+            "output_name": output_name,
+            "default_font_size": default_font_size,
+            "texture_size": texture_size,
+            "texture_format": texture_format,
+            "texture_mode": texture_mode,
+            "rasterizer": rasterizer,
+            "max_glyphs": max_glyphs,
+            "save_dat": FNTtoDat,
+        })
+        print(f"Created \"{watch_config}\" from the settings of main.py, edit it to rebuild")
+    watch_build(watch_config, max_workers=max_workers)
 
 
 def convertData():
@@ -91,11 +132,28 @@ def convertData():
         fontinfo.write_fnt()
 
 
+def batchConvertData():
+    from RF_BatchConvert import convert_batch
+
+    # convert every FNT and DAT file found in the directories or glob patterns to each other
+    convert_batch(
+        inputs=batch_inputs,
+        output_dir=batch_output_dir,
+        max_glyphs=max_glyphs,
+        max_workers=max_workers
+    )
+
+
 def main():
+    if WatchBuild:
+        watchBuild()
+        return
     if GenerateImage:
         generateImage()
     if GenerateData:
         convertData()
+    if BatchConvertData:
+        batchConvertData()
 
 
 if __name__ == '__main__':
@@ -103,14 +161,25 @@ if __name__ == '__main__':
     GenerateData = True
     FNTtoDat = True
     DATtoFNT = False
+    BatchConvertData = False
+    batch_inputs = ["./output", "./fonts/**/*.dat"]     # directories, files or glob patterns
+    batch_output_dir = ""       # empty: write next to the input files
+    WatchBuild = False      # keep running, rebuild when the watch config or a font changes (Ctrl+C to stop)
+    watch_config = "./font_build.json"      # created from the settings below if missing
 
     output_dir = "./output"
     output_name = "fontImage_36"
     default_font_size = 36
     texture_size = 2048     # Maximum size supported by vanilla RTCW is 2048. RealRTCW could support more large size
     texture_format = "png"
+    texture_mode = "rgba"       # "alpha": 8-bit grayscale TGA/PNG, "la": 8-bit luminance-alpha PNG
+    rasterizer = "draw"     # "mask": faster, same pixels as "draw"
     max_workers = 8     # Maximum number of processes for parallel acceleration
     max_glyphs = 256
+    corpus_paths = []       # localization files, pk3 archives or directories, empty: render the whole table
+    always_include_ranges = [(0x0020, 0x007E)]      # rendered even if not in the corpus
+    show_coverage = False       # report the coverage of the table before rendering
+    fallback_font_dirs = []     # searched for fonts covering the codepoints missing from every font
 
     try:
         main()